@@ -1 +1,5 @@
 """Backend package for the drone shipping demo."""
+from dotenv import load_dotenv
+
+# Load ``.env`` once, before any backend module reads its settings at import time.
+load_dotenv()
@@ -0,0 +1,135 @@
+"""
+Cold start measurement.
+
+Measures, each in a fresh interpreter, how long ``import backend.main`` takes
+and how long a ``uvicorn`` worker needs until ``/healthz`` answers. The broker
+points at an unroutable address by default, so a startup that blocked on the
+MQTT connection would show up as a multi-second time-to-healthy.
+
+Run with:
+    python -m backend.benchmarks.cold_start --runs 5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.benchmarks.mqtt_load import percentile  # noqa: E402
+
+# TEST-NET-1: never routes, so a blocking connect would hang until the TCP timeout.
+UNREACHABLE_BROKER = "192.0.2.1"
+_IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import backend.main; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def _env(db_path: Path, broker: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        {
+            "DATABASE_URL": f"sqlite:///{db_path}",
+            "MQTT_HOST": broker,
+            "DISPATCHER_ENABLED": "0",
+            "CLUSTER_ENABLED": "0",
+        }
+    )
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    """Seconds spent in ``import backend.main`` in a fresh interpreter."""
+    out = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SNIPPET], cwd=PROJECT_ROOT, env=env, check=True, capture_output=True, text=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_time_to_healthy(env: Dict[str, str], timeout_s: float = 30.0) -> Optional[float]:
+    """Seconds from spawning ``uvicorn`` until ``/healthz`` returns 200; ``None`` on timeout."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/healthz"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout_s:
+            try:
+                with urllib.request.urlopen(url, timeout=1.0) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        return None
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:  # pragma: no cover - stuck shutdown
+            proc.kill()
+
+
+def _summary(samples: List[float]) -> Dict[str, Any]:
+    return {
+        "runs": len(samples),
+        "min_s": round(min(samples), 4) if samples else None,
+        "p50_s": round(percentile(samples, 50) or 0.0, 4) if samples else None,
+        "max_s": round(max(samples), 4) if samples else None,
+    }
+
+
+def run_cold_start(runs: int, broker: str = UNREACHABLE_BROKER, healthz: bool = True) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="cold_start_") as tmp:
+        env = _env(Path(tmp) / "cold_start.db", broker)
+        imports = [measure_import(env) for _ in range(runs)]
+        report: Dict[str, Any] = {"broker": broker, "import_backend_main": _summary(imports)}
+        if healthz:
+            healthy = [measure_time_to_healthy(env) for _ in range(runs)]
+            report["time_to_healthz"] = _summary([value for value in healthy if value is not None])
+            report["time_to_healthz"]["timeouts"] = sum(1 for value in healthy if value is None)
+    return report
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure import time and time-to-/healthz of the backend.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement.")
+    parser.add_argument("--broker", default=UNREACHABLE_BROKER, help="MQTT_HOST for the measured processes.")
+    parser.add_argument("--no-healthz", action="store_true", help="Only measure the import.")
+    parser.add_argument("--output", type=Path, help="Optional JSON report path.")
+    args = parser.parse_args(argv)
+
+    report = run_cold_start(args.runs, broker=args.broker, healthz=not args.no_healthz)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text, encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,62 @@
+"""
+Compare two benchmark result files written by ``backend.benchmarks.run``.
+
+Run with:
+    python -m backend.benchmarks.compare results/old.json results/new.json
+Exits non-zero when any case/size got slower than ``--threshold``.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+def _load(path: Path) -> Dict[Tuple[str, int], Dict[str, Any]]:
+    report = json.loads(path.read_text(encoding="utf-8"))
+    return {(item["name"], int(item["size"])): item for item in report.get("results", [])}
+
+
+def compare(old: Path, new: Path, threshold: float = 1.10) -> List[Dict[str, Any]]:
+    """Return one row per case/size present in both files, flagging regressions."""
+    before = _load(old)
+    after = _load(new)
+    rows: List[Dict[str, Any]] = []
+    for key in sorted(before.keys() & after.keys()):
+        old_s = before[key]["median_s"]
+        new_s = after[key]["median_s"]
+        ratio = new_s / old_s if old_s > 0 else float("inf")
+        rows.append(
+            {
+                "name": key[0],
+                "size": key[1],
+                "old_median_s": old_s,
+                "new_median_s": new_s,
+                "ratio": ratio,
+                "regression": ratio > threshold,
+            }
+        )
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("old", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=1.10, help="Slowdown ratio treated as a regression.")
+    args = parser.parse_args(argv)
+
+    rows = compare(args.old, args.new, args.threshold)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['name']:<28} n={row['size']:<6} "
+            f"{row['old_median_s'] * 1000:10.2f} ms -> {row['new_median_s'] * 1000:10.2f} ms "
+            f"x{row['ratio']:.2f} {flag}"
+        )
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,108 @@
+"""
+Feasibility-kernel benchmark.
+
+Plans the same synthetic route with every installed kernel (python, grid,
+numpy, numba), checks that all of them produce the reference plan, and
+prints the speedup over the Python loop.
+
+Run with:
+    python -m backend.benchmarks.kernels
+    python -m backend.benchmarks.kernels --sizes 100 1000 --range-km 25
+The Python kernel is quadratic in the number of targets; 10 000 targets take
+about two minutes with it.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.benchmarks.run import time_callable  # noqa: E402
+from backend.benchmarks.synthetic import DEFAULT_SEED, synthetic_route  # noqa: E402
+from backend.services import feasibility, planner_core, route_planner, scheduling  # noqa: E402
+
+DEFAULT_SIZES = (100, 1000, 10000)
+START = datetime(2024, 1, 1)
+
+
+def run_kernels(
+    sizes: Sequence[int],
+    kernels: Sequence[str],
+    seed: int = DEFAULT_SEED,
+    range_km: Optional[float] = None,
+    repeat: int = 3,
+    min_time_s: float = 1.0,
+) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for size in sizes:
+        route = synthetic_route(size, seed=seed)
+        if range_km is not None:
+            route.drone.base_range_km = range_km
+        stops = route_planner.stops_from_locations(route.locations, route.weights)
+        hub = route_planner.hub_from_station(route.station)
+        drone = route_planner.drone_spec(route.drone)
+
+        def plan(kernel: str) -> List[Dict[str, object]]:
+            return planner_core.plan_route(
+                stops, hub, drone, start_time=START, station_schedule=scheduling.StationSchedule(), kernel=kernel
+            )
+
+        reference: Optional[List[Dict[str, object]]] = None
+        baseline_s: Optional[float] = None
+        for kernel in kernels:
+            steps = plan(kernel)  # warm-up, and JIT compilation for numba
+            if reference is None:
+                reference = steps
+            samples = time_callable(lambda: plan(kernel), repeat, min_time_s)
+            median_s = statistics.median(samples)
+            if kernel == "python":
+                baseline_s = median_s
+            row = {
+                "kernel": kernel,
+                "size": size,
+                "median_s": median_s,
+                "runs": len(samples),
+                "identical": steps == reference,
+                "speedup": (baseline_s / median_s) if baseline_s else None,
+            }
+            rows.append(row)
+            speedup = f"x{row['speedup']:.1f}" if row["speedup"] else ""
+            print(
+                f"{kernel:<8} n={size:<6} median={median_s * 1000:10.2f} ms  "
+                f"identical={row['identical']}  {speedup}"
+            )
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the planner feasibility kernels.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument("--kernels", nargs="+", choices=feasibility.available_kernels(), default=feasibility.available_kernels())
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--range-km", type=float, help="Override the drone range, e.g. to force recharges.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=1.0)
+    parser.add_argument("--output", type=Path, help="Optional JSON output path.")
+    args = parser.parse_args(argv)
+
+    # The first kernel is the reference; keep the Python loop first when it runs.
+    kernels = sorted(args.kernels, key=lambda name: name != "python")
+    rows = run_kernels(args.sizes, kernels, args.seed, args.range_km, args.repeat, args.min_time)
+    output = args.output
+    if output is not None:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps({"results": rows}, indent=2), encoding="utf-8")
+        print(f"\nResults written to: {output}")
+    return 0 if all(row["identical"] for row in rows) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,241 @@
+"""
+MQTT ingest/planning load harness.
+
+Boots the real ``mqtt_bg`` background client against an in-process
+``LocalBroker``, fires ``dron/celpontok`` targets and ``dron/utvonal``
+telemetry messages at configurable rates, and reports throughput, plan
+latency percentiles and dropped messages. Runs fully offline.
+
+Run with:
+    python -m backend.benchmarks.mqtt_load --targets-rate 20 --telemetry-rate 200 --duration 10
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import mqtt_bg  # noqa: E402
+from backend.benchmarks.synthetic import DEFAULT_SEED, create_synthetic_database  # noqa: E402
+from backend.local_broker import LocalBroker, LocalClient  # noqa: E402
+
+
+def percentile(samples: Sequence[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile; ``None`` for an empty sample."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, min(len(ordered), int(round(pct / 100.0 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+class _PlanRecorder:
+    """Wraps ``_handle_targets_payload`` to time each plan on the MQTT thread."""
+
+    def __init__(self, handler) -> None:
+        self._handler = handler
+        self._lock = threading.Lock()
+        self.plan_s: List[float] = []
+        self.end_to_end_s: List[float] = []
+        self.last_finished: Optional[float] = None
+
+    def __call__(self, payload: Dict[str, Any]) -> None:
+        started = time.perf_counter()
+        try:
+            self._handler(payload)
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self.plan_s.append(finished - started)
+                self.last_finished = finished
+                sent_at = payload.get("sent_at")
+                if isinstance(sent_at, float):
+                    self.end_to_end_s.append(finished - sent_at)
+
+
+def run_load(
+    duration_s: float = 10.0,
+    targets_rate: float = 10.0,
+    telemetry_rate: float = 100.0,
+    targets_per_message: int = 20,
+    locations_per_county: int = 200,
+    counties: int = 4,
+    queue_size: int = 10000,
+    drain_timeout_s: float = 30.0,
+    seed: int = DEFAULT_SEED,
+) -> Dict[str, Any]:
+    db = create_synthetic_database(
+        n_locations=locations_per_county,
+        n_orders=0,
+        seed=seed,
+        n_counties=counties,
+    )
+    rng = random.Random(seed)
+    broker = LocalBroker()
+    recorder = _PlanRecorder(mqtt_bg._handle_targets_payload)
+    summaries = {"count": 0}
+
+    def on_summary(_client, _userdata, msg) -> None:
+        if msg.payload.startswith(b'{"route"'):
+            summaries["count"] += 1
+
+    observer = LocalClient(client_id="load-observer", broker=broker, max_queued_messages=queue_size * 10)
+    observer.on_message = on_summary
+    producer = LocalClient(client_id="load-producer", broker=broker)
+
+    with patch.object(mqtt_bg, "SessionLocal", db.session_factory), patch.dict(
+        mqtt_bg._HANDLERS[mqtt_bg.MQTT_TOPIC_TARGETS], {"targets": recorder}
+    ):
+        mqtt_bg.start(lambda: LocalClient(client_id="backend", broker=broker, max_queued_messages=queue_size))
+        backend_client = mqtt_bg.get_client()
+        observer.connect()
+        observer.subscribe(mqtt_bg.MQTT_TOPIC)
+        observer.loop_start()
+        producer.connect()
+
+        sent = {mqtt_bg.MQTT_TOPIC_TARGETS: 0, mqtt_bg.MQTT_TOPIC: 0}
+        intervals = {
+            mqtt_bg.MQTT_TOPIC_TARGETS: 1.0 / targets_rate if targets_rate > 0 else None,
+            mqtt_bg.MQTT_TOPIC: 1.0 / telemetry_rate if telemetry_rate > 0 else None,
+        }
+        started = time.perf_counter()
+        next_due = {topic: started for topic, interval in intervals.items() if interval}
+        deadline = started + duration_s
+
+        while next_due:
+            topic = min(next_due, key=next_due.get)
+            due = next_due[topic]
+            if due >= deadline:
+                del next_due[topic]
+                continue
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            county_id = rng.choice(db.county_ids)
+            if topic == mqtt_bg.MQTT_TOPIC_TARGETS:
+                targets = rng.sample(db.location_ids[county_id], min(targets_per_message, len(db.location_ids[county_id])))
+                payload: Dict[str, Any] = {
+                    "county_id": county_id,
+                    "targets": targets,
+                    "weights": [round(rng.uniform(0.02, 0.2), 2) for _ in targets],
+                    "sent_at": time.perf_counter(),
+                }
+            else:
+                payload = {
+                    "coordinates": {"x": 19.0 + rng.random(), "y": 47.0 + rng.random()},
+                    "battery_pct": round(rng.uniform(10, 100), 1),
+                    "drone_id": county_id,
+                }
+            producer.publish(topic, json.dumps(payload))
+            sent[topic] += 1
+            next_due[topic] = due + intervals[topic]  # type: ignore[operator]
+
+        send_elapsed = time.perf_counter() - started
+
+        # Drain whatever the MQTT thread still has queued.
+        drain_deadline = time.perf_counter() + drain_timeout_s
+        while time.perf_counter() < drain_deadline:
+            if backend_client.pending() == 0 and len(recorder.plan_s) >= sent[mqtt_bg.MQTT_TOPIC_TARGETS]:
+                break
+            time.sleep(0.05)
+        publisher = mqtt_bg.get_publisher()
+        if hasattr(publisher, "flush"):
+            # Routes go out through the outbox asynchronously.
+            publisher.flush(timeout=max(0.0, drain_deadline - time.perf_counter()))
+        while observer.pending() and time.perf_counter() < drain_deadline:
+            time.sleep(0.05)
+        total_elapsed = time.perf_counter() - started
+        drain_elapsed = total_elapsed - send_elapsed
+        # Rates stop at the last completed plan (or the last send), not at the drain's polling sleeps.
+        plan_elapsed = max(send_elapsed, recorder.last_finished - started if recorder.last_finished else 0.0)
+
+        mqtt_bg.stop()
+        observer.loop_stop()
+        observer.disconnect()
+        producer.disconnect()
+    db.engine.dispose()
+
+    planned = len(recorder.plan_s)
+    messages_in = sum(sent.values())
+    broker_stats = broker.stats()
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "config": {
+            "duration_s": duration_s,
+            "targets_rate": targets_rate,
+            "telemetry_rate": telemetry_rate,
+            "targets_per_message": targets_per_message,
+            "locations_per_county": locations_per_county,
+            "counties": counties,
+            "queue_size": queue_size,
+        },
+        "sent": {"targets": sent[mqtt_bg.MQTT_TOPIC_TARGETS], "telemetry": sent[mqtt_bg.MQTT_TOPIC]},
+        "send_elapsed_s": round(send_elapsed, 3),
+        "drain_elapsed_s": round(drain_elapsed, 3),
+        "total_elapsed_s": round(total_elapsed, 3),
+        "throughput_msgs_per_s": round(messages_in / send_elapsed, 2) if send_elapsed else None,
+        "plans_completed": planned,
+        "plans_per_s": round(planned / plan_elapsed, 2) if plan_elapsed else None,
+        "routes_published": summaries["count"],
+        "plan_latency_ms": {"p50": ms(percentile(recorder.plan_s, 50)), "p99": ms(percentile(recorder.plan_s, 99))},
+        "end_to_end_latency_ms": {
+            "p50": ms(percentile(recorder.end_to_end_s, 50)),
+            "p99": ms(percentile(recorder.end_to_end_s, 99)),
+        },
+        "dropped": {
+            "broker_queue_full": broker_stats["dropped"],
+            "targets_not_planned": max(0, sent[mqtt_bg.MQTT_TOPIC_TARGETS] - planned),
+        },
+        "broker": broker_stats,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="MQTT ingest and planning load test against a local broker.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to keep sending.")
+    parser.add_argument("--targets-rate", type=float, default=10.0, help="dron/celpontok messages per second.")
+    parser.add_argument("--telemetry-rate", type=float, default=100.0, help="dron/utvonal messages per second.")
+    parser.add_argument("--targets-per-message", type=int, default=20)
+    parser.add_argument("--locations", type=int, default=200, help="Synthetic locations per county.")
+    parser.add_argument("--counties", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=10000, help="Backend client inbound queue bound.")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", type=Path, help="Optional JSON report path.")
+    args = parser.parse_args(argv)
+
+    report = run_load(
+        duration_s=args.duration,
+        targets_rate=args.targets_rate,
+        telemetry_rate=args.telemetry_rate,
+        targets_per_message=args.targets_per_message,
+        locations_per_county=args.locations,
+        counties=args.counties,
+        queue_size=args.queue_size,
+        drain_timeout_s=args.drain_timeout,
+        seed=args.seed,
+    )
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text, encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
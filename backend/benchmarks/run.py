@@ -0,0 +1,322 @@
+"""
+Planner benchmark suite.
+
+Times the route planner, the county order planner, the fleet-wide parallel
+replan, the MQTT targets handler (with a stub client), raw MQTT ingest
+(decode and dispatch of telemetry messages) and the REST endpoints
+over a sweep of synthetic sizes, and writes the results to JSON so runs can
+be compared between commits.
+
+Run with:
+    python -m backend.benchmarks.run
+    python -m backend.benchmarks.run --sizes 10 100 --label quick
+Compare two runs with:
+    python -m backend.benchmarks.compare old.json new.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.benchmarks.synthetic import DEFAULT_SEED, create_synthetic_database, synthetic_route  # noqa: E402
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# A case prepares its fixtures for a given size and returns the callable to time
+# together with an optional teardown.
+Prepared = Tuple[Callable[[], Any], Optional[Callable[[], None]]]
+
+
+@dataclass
+class Case:
+    name: str
+    prepare: Callable[[int, int], Prepared]
+
+
+class StubMqttClient:
+    """Counts publishes without touching the network."""
+
+    def __init__(self) -> None:
+        self.published = 0
+
+    def publish(self, _topic: str, _payload: str, *_args, **_kwargs) -> Any:
+        self.published += 1
+
+        class Result:
+            rc = 0
+
+        return Result()
+
+
+def _prepare_plan_route(size: int, seed: int) -> Prepared:
+    from backend.services import route_planner
+
+    route = synthetic_route(size, seed=seed)
+
+    def run() -> Any:
+        return route_planner.plan_route_with_recharges(route.locations, route.station, route.drone, route.weights)
+
+    return run, None
+
+
+def _prepare_plan_orders(size: int, seed: int) -> Prepared:
+    from backend import optimizer_service
+
+    # One location per order keeps the location table proportional to the sweep.
+    db = create_synthetic_database(n_locations=size, n_orders=size, seed=seed)
+    county_id = db.county_ids[0]
+
+    def run() -> Any:
+        with db.session_factory() as session:
+            return optimizer_service.plan_orders_for_county(county_id, session)
+
+    return run, db.engine.dispose
+
+
+def _prepare_replan(size: int, seed: int) -> Prepared:
+    from backend.services import fleet_replan
+    from backend.init_db import COUNTY_SEED
+
+    # ``size`` orders spread over every seed county.
+    n_counties = len(COUNTY_SEED)
+    per_county = max(1, size // n_counties)
+    db = create_synthetic_database(n_locations=per_county, n_orders=per_county, seed=seed, n_counties=n_counties)
+
+    def run() -> Any:
+        with db.session_factory() as session:
+            return fleet_replan.replan_counties(session)
+
+    return run, db.engine.dispose
+
+
+def _prepare_targets_payload(size: int, seed: int) -> Prepared:
+    from backend import mqtt_bg
+
+    db = create_synthetic_database(n_locations=size, n_orders=0, seed=seed)
+    county_id = db.county_ids[0]
+    targets = db.location_ids[county_id]
+    payload = {"county_id": county_id, "targets": targets, "weights": [0.001 for _ in targets]}
+    client = StubMqttClient()
+    patches = [
+        patch.object(mqtt_bg, "SessionLocal", db.session_factory),
+        patch.object(mqtt_bg, "get_client", lambda: client),
+    ]
+    for item in patches:
+        item.start()
+
+    def teardown() -> None:
+        for item in reversed(patches):
+            item.stop()
+        db.engine.dispose()
+
+    return (lambda: mqtt_bg._handle_targets_payload(payload)), teardown
+
+
+def _prepare_mqtt_ingest(size: int, seed: int) -> Prepared:
+    from backend import mqtt_bg
+    from backend.local_broker import LocalMessage
+    from backend.services import route_planner
+
+    route = synthetic_route(min(size, 1000), seed=seed)
+    steps = route_planner.plan_route_with_recharges(route.locations, route.station, route.drone, route.weights)
+    payloads = [json.dumps(step).encode("utf-8") for step in steps]
+    payloads.append(json.dumps({"route": [step["next"] for step in steps]}).encode("utf-8"))
+    # One malformed message in fifty, as a noisy publisher would send.
+    payloads.extend([b"not json", b'{"coordinates": null}'] * max(1, len(payloads) // 100))
+    messages = [
+        LocalMessage(topic=mqtt_bg.MQTT_TOPIC, payload=payloads[i % len(payloads)], qos=0, retain=False, mid=i)
+        for i in range(size)
+    ]
+
+    def run() -> Any:
+        for message in messages:
+            mqtt_bg._process_message(message)
+
+    return run, None
+
+
+def _prepare_rest(size: int, seed: int) -> Prepared:
+    from fastapi.testclient import TestClient
+
+    from backend import cluster, main
+    from backend.db import get_session
+
+    db = create_synthetic_database(n_locations=size, n_orders=0, seed=seed)
+    county_id = db.county_ids[0]
+    location_ids = db.location_ids[county_id]
+
+    def override_session():
+        session = db.session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    # Startup runs ensure_schema on ``main.engine`` and starts MQTT; point it at the
+    # synthetic database and skip the background services.
+    patches = [
+        patch.object(main, "engine", db.engine),
+        patch.object(main, "SessionLocal", db.session_factory),
+        patch.object(main, "start_mqtt_owner", lambda: None),
+        patch.object(cluster, "CLUSTER_ENABLED", False),
+    ]
+    for item in patches:
+        item.start()
+    main.app.dependency_overrides[get_session] = override_session
+    client = TestClient(main.app)
+    client.__enter__()
+
+    def run() -> Any:
+        assert client.get("/api/counties").status_code == 200
+        assert client.get(f"/api/locations?county_id={county_id}").status_code == 200
+        assert client.get("/api/points").status_code == 200
+        response = client.post(
+            "/api/orders",
+            json={
+                "origin_location_id": location_ids[0],
+                "destination_location_id": location_ids[-1],
+                "weight_kg": 1.0,
+            },
+        )
+        assert response.status_code == 201
+
+    def teardown() -> None:
+        client.__exit__(None, None, None)
+        main.app.dependency_overrides.pop(get_session, None)
+        for item in reversed(patches):
+            item.stop()
+        db.engine.dispose()
+
+    return run, teardown
+
+
+CASES: Dict[str, Case] = {
+    case.name: case
+    for case in (
+        Case("plan_route_with_recharges", _prepare_plan_route),
+        Case("plan_orders_for_county", _prepare_plan_orders),
+        Case("replan_counties", _prepare_replan),
+        Case("handle_targets_payload", _prepare_targets_payload),
+        Case("mqtt_ingest", _prepare_mqtt_ingest),
+        Case("rest_endpoints", _prepare_rest),
+    )
+}
+
+
+def time_callable(func: Callable[[], Any], repeat: int, min_time_s: float) -> List[float]:
+    """Run ``func`` at least once, and up to ``repeat`` times while under ``min_time_s`` total."""
+    samples: List[float] = []
+    started = time.perf_counter()
+    while len(samples) < max(1, repeat):
+        t0 = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - t0)
+        if time.perf_counter() - started >= min_time_s:
+            break
+    return samples
+
+
+def run_case(case: Case, size: int, seed: int, repeat: int, min_time_s: float) -> Dict[str, Any]:
+    func, teardown = case.prepare(size, seed)
+    try:
+        # Warm-up (imports, statement caches, JIT) is timed but never counted as a sample.
+        t0 = time.perf_counter()
+        func()
+        warmup_s = time.perf_counter() - t0
+        samples = time_callable(func, repeat, min_time_s)
+    finally:
+        if teardown is not None:
+            teardown()
+    return {
+        "name": case.name,
+        "size": size,
+        "runs": len(samples),
+        "warmup_s": warmup_s,
+        "min_s": min(samples),
+        "median_s": statistics.median(samples),
+        "mean_s": statistics.fmean(samples),
+        "max_s": max(samples),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return (
+            subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=PROJECT_ROOT,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+            or None
+        )
+    except Exception:
+        return None
+
+
+def run_suite(
+    case_names: Sequence[str],
+    sizes: Sequence[int],
+    seed: int = DEFAULT_SEED,
+    repeat: int = 5,
+    min_time_s: float = 1.0,
+    label: Optional[str] = None,
+) -> Dict[str, Any]:
+    revision = _git_revision()
+    results: List[Dict[str, Any]] = []
+    for name in case_names:
+        case = CASES[name]
+        for size in sizes:
+            result = run_case(case, size, seed, repeat, min_time_s)
+            results.append(result)
+            print(f"{name:<28} n={size:<6} median={result['median_s'] * 1000:10.2f} ms  runs={result['runs']}")
+    return {
+        "meta": {
+            "label": label or revision or "local",
+            "git_revision": revision,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the planner benchmark suite.")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=5, help="Maximum timed runs per case and size.")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Stop repeating once this many seconds passed.")
+    parser.add_argument("--label", help="Name of the run; defaults to the git revision.")
+    parser.add_argument("--output", type=Path, help="Result JSON path; defaults to results/<label>.json.")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.cases, args.sizes, args.seed, args.repeat, args.min_time, args.label)
+    output = args.output or RESULTS_DIR / f"{report['meta']['label']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+"""Deterministic synthetic counties for planner benchmarks.
+
+Coordinates are derived from ``init_db.COUNTY_SEED``/``LOCATION_SEED`` with a
+seeded jitter, so the same seed always produces the same county.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import models
+from backend.db import Base
+from backend.init_db import COUNTY_SEED, LOCATION_SEED
+
+DEFAULT_SEED = 1234
+DEFAULT_COUNTY = "Budapest"
+JITTER_DEG = 0.05
+
+
+@dataclass
+class SyntheticRoute:
+    """Transient ORM objects ready for ``plan_route_with_recharges``."""
+
+    locations: List[models.Location]
+    station: models.Station
+    drone: models.Drone
+    weights: Dict[int, float]
+
+
+@dataclass
+class SyntheticDatabase:
+    """In-memory database populated with synthetic counties."""
+
+    engine: Engine
+    session_factory: sessionmaker
+    county_ids: List[int]
+    location_ids: Dict[int, List[int]]
+
+
+def _county_entry(county_name: str) -> Dict[str, object]:
+    for entry in COUNTY_SEED:
+        if entry["name"] == county_name:
+            return entry
+    raise KeyError(f"Unknown seed county: {county_name}")
+
+
+def jittered_points(
+    county_name: str,
+    count: int,
+    rng: random.Random,
+    jitter_deg: float = JITTER_DEG,
+) -> Iterator[Tuple[str, float, float]]:
+    """Yield ``(name, lat, lon)`` points scattered around a county's seed locations."""
+    anchors = [(loc["name"], loc["lat"], loc["lon"]) for loc in LOCATION_SEED if loc["county"] == county_name]
+    if not anchors:
+        entry = _county_entry(county_name)
+        anchors = [(county_name, entry["lat"], entry["lon"])]
+    for index in range(count):
+        name, lat, lon = anchors[index % len(anchors)]
+        yield (
+            f"{name} #{index}",
+            lat + rng.uniform(-jitter_deg, jitter_deg),
+            lon + rng.uniform(-jitter_deg, jitter_deg),
+        )
+
+
+def synthetic_route(
+    n_targets: int,
+    seed: int = DEFAULT_SEED,
+    county_name: str = DEFAULT_COUNTY,
+) -> SyntheticRoute:
+    """Build ``n_targets`` transient locations plus the county's hub and drone."""
+    rng = random.Random(seed)
+    entry = _county_entry(county_name)
+    station = models.Station(id=1, county_id=1, name=f"{county_name} Hub", lat=entry["lat"], lon=entry["lon"])
+    drone = models.Drone(
+        id=1,
+        station_id=1,
+        base_range_km=entry["base_range_km"],
+        max_payload_kg=entry["max_payload_kg"],
+        speed_kmh=round(rng.uniform(50.0, 90.0), 1),
+    )
+    locations: List[models.Location] = []
+    weights: Dict[int, float] = {}
+    # Keep the total payload within the drone's limit regardless of size.
+    per_target_kg = float(entry["max_payload_kg"]) / max(n_targets, 1)
+    for loc_id, (name, lat, lon) in enumerate(jittered_points(county_name, n_targets, rng), start=1):
+        locations.append(models.Location(id=loc_id, name=name, county_id=1, lat=lat, lon=lon))
+        weights[loc_id] = round(per_target_kg * rng.uniform(0.5, 1.0), 6)
+    return SyntheticRoute(locations=locations, station=station, drone=drone, weights=weights)
+
+
+def create_synthetic_database(
+    n_locations: int,
+    n_orders: int,
+    seed: int = DEFAULT_SEED,
+    n_counties: int = 1,
+    url: str = "sqlite://",
+    engine: Optional[Engine] = None,
+) -> SyntheticDatabase:
+    """Create and populate a database with ``n_counties`` synthetic counties.
+
+    Each county gets one hub, one drone, ``n_locations`` locations and
+    ``n_orders`` pending orders between random pairs of its locations.
+    """
+    if engine is None:
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+            future=True,
+        )
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+    rng = random.Random(seed)
+
+    county_ids: List[int] = []
+    location_ids: Dict[int, List[int]] = {}
+    with session_factory() as session:
+        for entry in COUNTY_SEED[:n_counties]:
+            county = models.County(name=entry["name"])
+            station = models.Station(name=f"{entry['name']} Hub", lat=entry["lat"], lon=entry["lon"], county=county)
+            drone = models.Drone(
+                base_range_km=entry["base_range_km"],
+                max_payload_kg=entry["max_payload_kg"],
+                speed_kmh=round(rng.uniform(50.0, 90.0), 1),
+                station=station,
+            )
+            session.add_all([county, station, drone])
+            session.flush()
+
+            rows = [
+                {"name": name, "county_id": county.id, "lat": lat, "lon": lon}
+                for name, lat, lon in jittered_points(entry["name"], n_locations, rng)
+            ]
+            if rows:
+                session.execute(insert(models.Location), rows)
+            ids = [
+                loc_id
+                for (loc_id,) in session.query(models.Location.id)
+                .filter(models.Location.county_id == county.id)
+                .order_by(models.Location.id)
+            ]
+
+            if ids and n_orders:
+                order_rows = [
+                    {
+                        "origin_location_id": rng.choice(ids),
+                        "destination_location_id": rng.choice(ids),
+                        "weight_kg": round(rng.uniform(0.2, float(entry["max_payload_kg"]) * 0.8), 2),
+                        "county_id": county.id,
+                        "drone_id": drone.id,
+                        "status": "pending",
+                    }
+                    for _ in range(n_orders)
+                ]
+                session.execute(insert(models.Order), order_rows)
+
+            county_ids.append(county.id)
+            location_ids[county.id] = ids
+        session.commit()
+
+    return SyntheticDatabase(
+        engine=engine,
+        session_factory=session_factory,
+        county_ids=county_ids,
+        location_ids=location_ids,
+    )
@@ -0,0 +1,278 @@
+"""
+Multi-worker coordination for ``uvicorn --workers N``.
+
+Exactly one worker owns the MQTT client, the planner and the dispatcher; the
+others serve HTTP and ``/ws`` from state the owner shares. Both use a small
+SQLite file (``CLUSTER_STATE_PATH``) in WAL mode:
+
+- ``leases``: the owner holds the ``mqtt-owner`` lease and renews it every
+  ``CLUSTER_LEASE_TTL_S / 3``. When the lease expires (owner crashed or hung)
+  or is released (owner shut down), the next worker to tick takes it over and
+  starts MQTT. A worker that finds its lease taken stops MQTT at once, so two
+  owners never plan the same targets for longer than one renewal.
+- ``shared_state``: the owner mirrors ``mqtt_bg``'s last message and route
+  every ``CLUSTER_SYNC_S`` when they changed; followers read them back
+  (``follower_state``), re-parsing only when the version moved.
+
+With ``CLUSTER_ENABLED=0`` (default) nothing here runs and the process
+behaves as a single worker.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("backend.cluster")
+
+APP_ROOT = Path(__file__).resolve().parent
+CLUSTER_ENABLED = os.getenv("CLUSTER_ENABLED", "0").lower() in {"1", "true", "yes", "on"}
+CLUSTER_STATE_PATH = os.getenv("CLUSTER_STATE_PATH") or str(APP_ROOT / "cluster_state.db")
+CLUSTER_LEASE_TTL_S = float(os.getenv("CLUSTER_LEASE_TTL_S", "10"))
+CLUSTER_SYNC_S = float(os.getenv("CLUSTER_SYNC_S", "0.2"))
+
+LEASE_NAME = "mqtt-owner"
+STATE_KEY = "mqtt_state"
+
+# ``mqtt_bg.state_since``: (version, last message, last route) if changed after the given version.
+StateSource = Callable[[int], Optional[Tuple[int, Dict[str, Any], List[Any]]]]
+
+
+class ClusterStore:
+    """Leases and shared key/value state in one SQLite file."""
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_state "
+            "(key TEXT PRIMARY KEY, version INTEGER NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def try_acquire(self, name: str, owner: str, ttl_s: float, now: float) -> bool:
+        """Take or renew ``name`` for ``owner`` unless someone else holds an unexpired lease."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+                if row is not None and row[0] != owner and row[1] > now:
+                    self._conn.execute("COMMIT")
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                    (name, owner, now + ttl_s),
+                )
+                self._conn.execute("COMMIT")
+                return True
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def release(self, name: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def holder(self, name: str, now: float) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None and row[1] > now else None
+
+    def put(self, key: str, value: Any, now: float) -> None:
+        """Store ``value``, bumping the key's version (monotonic across owners)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO shared_state (key, version, value, updated_at) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET version = version + 1, value = excluded.value, updated_at = excluded.updated_at",
+                (key, json.dumps(value), now),
+            )
+
+    def version(self, key: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM shared_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def get(self, key: str) -> Optional[Tuple[int, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT version, value FROM shared_state WHERE key = ?", (key,)).fetchone()
+        return (row[0], json.loads(row[1])) if row is not None else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@contextmanager
+def startup_lock(path: str = CLUSTER_STATE_PATH, timeout_s: float = 60.0) -> Iterator[None]:
+    """Run one worker's startup section (e.g. schema creation) at a time across the cluster."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=timeout_s, isolation_level=None)
+    try:
+        conn.execute("BEGIN EXCLUSIVE")
+        try:
+            yield
+        finally:
+            conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def default_owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Cluster:
+    """Lease loop for one worker; calls ``on_elected``/``on_demoted`` on role changes."""
+
+    def __init__(
+        self,
+        store: ClusterStore,
+        on_elected: Callable[[], None],
+        on_demoted: Callable[[], None],
+        state_source: StateSource,
+        owner_id: Optional[str] = None,
+        ttl_s: float = CLUSTER_LEASE_TTL_S,
+        sync_s: float = CLUSTER_SYNC_S,
+    ) -> None:
+        self.store = store
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.state_source = state_source
+        self.owner_id = owner_id or default_owner_id()
+        self.ttl_s = ttl_s
+        self.sync_s = sync_s
+        self.leader = False
+        self._synced_version = -1
+        self._cache_lock = threading.Lock()
+        self._cached: Tuple[int, Dict[str, Any], List[Any]] = (-1, {}, [])
+        self._cache_checked_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # Election ------------------------------------------------------------------
+    def tick(self, now: Optional[float] = None) -> bool:
+        """Acquire or renew the lease and switch roles if it changed; returns whether this worker leads."""
+        now = time.time() if now is None else now
+        try:
+            leading = self.store.try_acquire(LEASE_NAME, self.owner_id, self.ttl_s, now)
+        except sqlite3.Error:
+            logger.exception("Lease renewal failed")
+            leading = False
+        if leading and not self.leader:
+            self.leader = True
+            self._synced_version = -1
+            logger.info("Worker %s elected MQTT owner", self.owner_id)
+            self.on_elected()
+        elif not leading and self.leader:
+            self.leader = False
+            logger.warning("Worker %s lost the MQTT owner lease; stopping MQTT", self.owner_id)
+            self.on_demoted()
+        return self.leader
+
+    def sync_state(self, now: Optional[float] = None) -> None:
+        """Owner side: publish the last message and route if they changed."""
+        snapshot = self.state_source(self._synced_version)
+        if snapshot is None:
+            return
+        version, message, route = snapshot
+        self.store.put(STATE_KEY, {"message": message, "route": route}, time.time() if now is None else now)
+        self._synced_version = version
+
+    def shared_state(self) -> Tuple[Dict[str, Any], List[Any]]:
+        """Follower side: the owner's last message and route, re-read at most every ``sync_s``."""
+        now = time.monotonic()
+        with self._cache_lock:
+            if now - self._cache_checked_at < self.sync_s:
+                return self._cached[1], self._cached[2]
+            self._cache_checked_at = now
+            if self.store.version(STATE_KEY) != self._cached[0]:
+                row = self.store.get(STATE_KEY)
+                if row is not None:
+                    version, value = row
+                    self._cached = (version, value.get("message") or {}, value.get("route") or [])
+            return self._cached[1], self._cached[2]
+
+    # Thread ----------------------------------------------------------------------
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.tick()
+        self._thread = threading.Thread(target=self._run, name="cluster-lease", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """Step down and release the lease so another worker can take over at once."""
+        self._stop.set()
+        thread = self._thread
+        self._thread = None
+        if thread is not None:
+            thread.join(timeout)
+        if self.leader:
+            self.leader = False
+            self.on_demoted()
+            self.store.release(LEASE_NAME, self.owner_id)
+
+    def _run(self) -> None:
+        renew_every = self.ttl_s / 3.0
+        next_renew = time.monotonic() + renew_every
+        while not self._stop.wait(self.sync_s if self.leader else renew_every):
+            try:
+                if time.monotonic() >= next_renew or not self.leader:
+                    self.tick()
+                    next_renew = time.monotonic() + renew_every
+                if self.leader:
+                    self.sync_state()
+            except Exception:  # pragma: no cover - keep the lease loop alive
+                logger.exception("Cluster iteration failed")
+
+
+_cluster: Optional[Cluster] = None
+_cluster_lock = threading.Lock()
+
+
+def start(on_elected: Callable[[], None], on_demoted: Callable[[], None], state_source: StateSource) -> Cluster:
+    """Join the cluster; this worker runs ``on_elected`` when (and if) it becomes the MQTT owner."""
+    global _cluster
+    with _cluster_lock:
+        if _cluster is None:
+            _cluster = Cluster(ClusterStore(CLUSTER_STATE_PATH), on_elected, on_demoted, state_source)
+            _cluster.start()
+        return _cluster
+
+
+def stop() -> None:
+    global _cluster
+    with _cluster_lock:
+        cluster = _cluster
+        _cluster = None
+    if cluster is not None:
+        cluster.stop()
+        cluster.store.close()
+
+
+def is_leader() -> bool:
+    """Whether this worker owns MQTT; always true outside cluster mode."""
+    cluster = _cluster
+    return cluster is None or cluster.leader
+
+
+def follower_state() -> Optional[Tuple[Dict[str, Any], List[Any]]]:
+    """The owner's last message and route when this worker is a follower; ``None`` if it owns MQTT itself."""
+    cluster = _cluster
+    if cluster is None or cluster.leader:
+        return None
+    return cluster.shared_state()
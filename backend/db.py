@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
-from typing import Iterator
+from typing import Iterator, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, create_engine, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
 APP_ROOT = Path(__file__).resolve().parent
@@ -27,3 +28,27 @@ def get_session() -> Iterator[Session]:
         yield session
     finally:
         session.close()
+
+
+def ensure_schema(bind: Engine, metadata: Optional[MetaData] = None) -> None:
+    """Create missing tables, nullable columns and indexes on an existing database.
+
+    Lets databases created by older versions (such as the bundled
+    ``drone_delivery.db``) pick up new columns and indexes without a rebuild.
+    ``metadata`` defaults to ``Base.metadata``; callers pass ``models.Base.metadata``
+    so the models they actually use are covered even if this module was reloaded.
+    """
+    metadata = metadata if metadata is not None else Base.metadata
+    metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
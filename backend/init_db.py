@@ -1,12 +1,39 @@
+"""
+Database seeding.
+
+``python -m backend.init_db`` (or ``python backend/init_db.py``) creates the
+schema and tops up the reference data: the 20 counties of ``COUNTY_SEED`` with
+one hub and drone each, and the ``LOCATION_SEED`` locations. Running it again
+only inserts what is missing.
+
+With any of the bulk options it also generates synthetic data for
+production-scale local databases::
+
+    python -m backend.init_db --counties 40 --locations-per-county 50000 \
+        --drones-per-county 100 --orders-per-county 20000 --seed 1234
+
+Counts are per-county *targets*: each run inserts only the rows missing to
+reach them, so a larger run tops up a smaller one. Rows are generated from
+RNG streams keyed by ``(seed, county, kind, block of SEED_BLOCK indices)``,
+so row ``i`` of a county is the same whether it was inserted in one run or in
+several. Inserts go through SQLAlchemy Core in ``--chunk-size`` batches, each
+in its own transaction, so an interrupted run can simply be repeated.
+"""
 from __future__ import annotations
 
-from contextlib import contextmanager
-from typing import Dict
+import argparse
 import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import func, insert, select
+from sqlalchemy.engine import Connection, Engine
 
-from backend.db import Base, SessionLocal, engine
+from backend.db import Base, SessionLocal, engine, ensure_schema
 from backend import models
 
 
@@ -197,6 +224,15 @@ LOCATION_SEED = [
 ]
 
 
+# Hungary's bounding box; synthetic counties beyond COUNTY_SEED get hubs inside it.
+SYNTHETIC_BBOX = (45.75, 48.55, 16.1, 22.9)
+SYNTHETIC_COUNTY_DEFAULTS = {"base_range_km": 195.0, "max_payload_kg": 5.0}
+LOCATION_JITTER_DEG = 0.08
+SEED_BLOCK = 1024
+DEFAULT_SEED = 1234
+DEFAULT_CHUNK_SIZE = 5000
+
+
 @contextmanager
 def session_scope():
     session = SessionLocal()
@@ -210,60 +246,347 @@ def session_scope():
         session.close()
 
 
-def seed_data() -> None:
-    if Base.metadata.tables == {}:
-        raise RuntimeError("Metadata not configured before seeding.")
+@dataclass
+class SeedReport:
+    """Rows inserted by one seeding run (existing rows are not counted)."""
 
-    Base.metadata.create_all(bind=engine)
+    counties: int = 0
+    stations: int = 0
+    drones: int = 0
+    locations: int = 0
+    orders: int = 0
+    seconds: float = 0.0
+    per_county: Dict[str, Dict[str, int]] = field(default_factory=dict)
 
-    with session_scope() as session:
-        if session.query(models.County).count() > 0:
-            print("Database already contains data; skipping seed records.")
+    def add(self, county: str, kind: str, count: int) -> None:
+        if not count:
             return
-
-        county_lookup: Dict[str, models.County] = {}
-
-        # Counties + stations + drones
-        for entry in COUNTY_SEED:
-            county = models.County(name=entry["name"])
-            station = models.Station(
-                name=f"{entry['name']} Hub",
-                lat=entry["lat"],
-                lon=entry["lon"],
-                county=county,
-            )
-            drone = models.Drone(
-                base_range_km=entry["base_range_km"],
-                max_payload_kg=entry["max_payload_kg"],
-                speed_kmh=round(random.uniform(50.0, 90.0), 1),
-                station=station,
+        setattr(self, kind, getattr(self, kind) + count)
+        self.per_county.setdefault(county, {})[kind] = self.per_county.get(county, {}).get(kind, 0) + count
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "counties": self.counties,
+            "stations": self.stations,
+            "drones": self.drones,
+            "locations": self.locations,
+            "orders": self.orders,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+def county_entries(count: Optional[int] = None, seed: int = DEFAULT_SEED) -> List[Dict[str, Any]]:
+    """The first ``count`` counties: ``COUNTY_SEED``, then deterministic synthetic ones."""
+    entries: List[Dict[str, Any]] = [dict(entry) for entry in COUNTY_SEED]
+    if count is None:
+        return entries
+    min_lat, max_lat, min_lon, max_lon = SYNTHETIC_BBOX
+    for index in range(len(entries), count):
+        name = f"Synthetic {index + 1:04d}"
+        rng = random.Random(f"{seed}:{name}:county")
+        entries.append(
+            {
+                "name": name,
+                "lat": round(rng.uniform(min_lat, max_lat), 4),
+                "lon": round(rng.uniform(min_lon, max_lon), 4),
+                **SYNTHETIC_COUNTY_DEFAULTS,
+            }
+        )
+    return entries[:count]
+
+
+def _insert_chunks(bind: Engine, table: Any, rows: Iterable[Dict[str, Any]], chunk_size: int) -> int:
+    """Insert ``rows`` in ``chunk_size`` batches, one transaction per batch.
+
+    The INSERT is compiled once and each batch goes to the driver's
+    ``executemany`` as-is; per-row parameter processing in ``Connection.execute``
+    would otherwise cost more than the insert itself. Every row must carry
+    every column it needs, since column defaults are not applied.
+    """
+    inserted = 0
+    iterator = iter(rows)
+    first = next(iterator, None)
+    if first is None:
+        return 0
+    compiled = insert(table).compile(dialect=bind.dialect, column_keys=list(first))
+    keys = list(compiled.positiontup) if compiled.positional else list(first)
+    columns = table.__table__.c
+    # Type conversions the driver can't do itself (e.g. datetimes on SQLite).
+    processors = [(key, columns[key].type.bind_processor(bind.dialect)) for key in keys]
+    processors = [(key, process) for key, process in processors if process is not None]
+    iterator = chain([first], iterator)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return inserted
+        for row in chunk:
+            for key, process in processors:
+                row[key] = process(row[key])
+        params = [tuple(row[key] for key in keys) for row in chunk] if compiled.positional else chunk
+        with bind.begin() as conn:
+            conn.exec_driver_sql(compiled.string, params)
+        inserted += len(chunk)
+
+
+def _indexed_draws(seed: int, county: str, kind: str, start: int, stop: int, draws: int) -> Iterator[Tuple[int, List[float]]]:
+    """Yield ``(index, draws uniforms)`` for ``start <= index < stop``.
+
+    Each block of ``SEED_BLOCK`` indices has its own RNG and every index
+    consumes exactly ``draws`` values, so a top-up starting mid-block
+    reproduces the rows a single run would have generated.
+    """
+    index = start
+    while index < stop:
+        block = index // SEED_BLOCK
+        rng = random.Random(f"{seed}:{county}:{kind}:{block}")
+        for _ in range((index - block * SEED_BLOCK) * draws):
+            rng.random()
+        block_end = min(stop, (block + 1) * SEED_BLOCK)
+        while index < block_end:
+            yield index, [rng.random() for _ in range(draws)]
+            index += 1
+
+
+def _county_ids(conn: Connection) -> Dict[str, int]:
+    return {name: county_id for county_id, name in conn.execute(select(models.County.id, models.County.name))}
+
+
+def _hub_ids(conn: Connection) -> Dict[int, int]:
+    """County id -> its hub (lowest station id)."""
+    rows = conn.execute(select(models.Station.county_id, func.min(models.Station.id)).group_by(models.Station.county_id))
+    return {county_id: station_id for county_id, station_id in rows}
+
+
+def _counts_by_county(conn: Connection, column: Any, join: Any = None) -> Dict[int, int]:
+    query = select(column, func.count()).group_by(column)
+    if join is not None:
+        query = query.select_from(join)
+    return {county_id: count for county_id, count in conn.execute(query)}
+
+
+def seed_reference_data(bind: Engine = engine, seed: int = DEFAULT_SEED, counties: Optional[int] = None) -> SeedReport:
+    """Insert the missing counties (with hub and first drone) and ``LOCATION_SEED`` locations."""
+    report = SeedReport()
+    entries = county_entries(counties, seed)
+    with bind.begin() as conn:
+        existing = _county_ids(conn)
+        missing = [{"name": entry["name"]} for entry in entries if entry["name"] not in existing]
+        if missing:
+            conn.execute(insert(models.County), missing)
+        county_ids = _county_ids(conn)
+        for row in missing:
+            report.add(row["name"], "counties", 1)
+
+        hubs = _hub_ids(conn)
+        stations = []
+        for entry in entries:
+            county_id = county_ids[entry["name"]]
+            if county_id in hubs:
+                continue
+            stations.append({"name": f"{entry['name']} Hub", "lat": entry["lat"], "lon": entry["lon"], "county_id": county_id})
+            report.add(entry["name"], "stations", 1)
+        if stations:
+            conn.execute(insert(models.Station), stations)
+            hubs = _hub_ids(conn)
+
+        drone_counts = _counts_by_county(conn, models.Station.county_id, models.Drone.__table__.join(models.Station.__table__))
+        drones = []
+        for entry in entries:
+            county_id = county_ids[entry["name"]]
+            if drone_counts.get(county_id):
+                continue
+            # Drone #0 of the county's "drones" stream, so bulk top-ups continue it.
+            _, (speed,) = next(_indexed_draws(seed, entry["name"], "drones", 0, 1, 1))
+            drones.append(
+                {
+                    "station_id": hubs[county_id],
+                    "base_range_km": entry["base_range_km"],
+                    "max_payload_kg": entry["max_payload_kg"],
+                    "speed_kmh": round(50.0 + 40.0 * speed, 1),
+                }
             )
-            session.add_all([county, station, drone])
-            county_lookup[county.name] = county
-
-        # Locations
+            report.add(entry["name"], "drones", 1)
+        if drones:
+            conn.execute(insert(models.Drone), drones)
+
+        seed_names = {loc["name"] for loc in LOCATION_SEED}
+        seeded = set(
+            conn.execute(
+                select(models.Location.county_id, models.Location.name).where(models.Location.name.in_(seed_names))
+            ).all()
+        )
+        locations = []
         for loc in LOCATION_SEED:
-            county = county_lookup.get(loc["county"])
-            if not county:
+            county_id = county_ids.get(loc["county"])
+            if county_id is None or (county_id, loc["name"]) in seeded:
                 continue
-
-            session.add(
-                models.Location(
-                    name=loc["name"],
-                    lat=loc["lat"],
-                    lon=loc["lon"],
-                    county=county,
+            locations.append({"name": loc["name"], "lat": loc["lat"], "lon": loc["lon"], "county_id": county_id})
+            report.add(loc["county"], "locations", 1)
+        if locations:
+            conn.execute(insert(models.Location), locations)
+    return report
+
+
+def bulk_seed(
+    bind: Engine = engine,
+    counties: Optional[int] = None,
+    locations_per_county: int = 0,
+    drones_per_county: int = 0,
+    orders_per_county: int = 0,
+    seed: int = DEFAULT_SEED,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress: Optional[Callable[[str, str, int], None]] = None,
+) -> SeedReport:
+    """Top every selected county up to the requested locations, drones and pending orders.
+
+    ``counties`` selects the first N of ``county_entries`` (all of
+    ``COUNTY_SEED`` by default); reference data is seeded first. Targets of 0
+    leave that kind untouched. ``progress(county, kind, inserted)`` is called
+    after each county/kind.
+    """
+    started = time.perf_counter()
+    ensure_schema(bind, models.Base.metadata)
+    report = seed_reference_data(bind, seed=seed, counties=counties)
+    entries = county_entries(counties, seed)
+
+    with bind.connect() as conn:
+        county_ids = _county_ids(conn)
+        hubs = _hub_ids(conn)
+        location_counts = _counts_by_county(conn, models.Location.county_id)
+        drone_counts = _counts_by_county(conn, models.Station.county_id, models.Drone.__table__.join(models.Station.__table__))
+        order_counts = _counts_by_county(conn, models.Order.county_id)
+
+    anchors_by_county: Dict[str, List[Tuple[str, float, float]]] = {}
+    for loc in LOCATION_SEED:
+        anchors_by_county.setdefault(loc["county"], []).append((loc["name"], loc["lat"], loc["lon"]))
+
+    for entry in entries:
+        name = entry["name"]
+        county_id = county_ids[name]
+
+        start = location_counts.get(county_id, 0)
+        if locations_per_county > start:
+            anchors = anchors_by_county.get(name) or [(name, entry["lat"], entry["lon"])]
+            rows = (
+                {
+                    "name": f"{anchors[index % len(anchors)][0]} #{index}",
+                    "county_id": county_id,
+                    "lat": round(anchors[index % len(anchors)][1] + (2.0 * lat - 1.0) * LOCATION_JITTER_DEG, 6),
+                    "lon": round(anchors[index % len(anchors)][2] + (2.0 * lon - 1.0) * LOCATION_JITTER_DEG, 6),
+                }
+                for index, (lat, lon) in _indexed_draws(seed, name, "locations", start, locations_per_county, 2)
+            )
+            inserted = _insert_chunks(bind, models.Location, rows, chunk_size)
+            report.add(name, "locations", inserted)
+            if progress:
+                progress(name, "locations", inserted)
+
+        start = drone_counts.get(county_id, 0)
+        if drones_per_county > start:
+            rows = (
+                {
+                    "station_id": hubs[county_id],
+                    "base_range_km": entry["base_range_km"],
+                    "max_payload_kg": entry["max_payload_kg"],
+                    "speed_kmh": round(50.0 + 40.0 * speed, 1),
+                }
+                for _, (speed,) in _indexed_draws(seed, name, "drones", start, drones_per_county, 1)
+            )
+            inserted = _insert_chunks(bind, models.Drone, rows, chunk_size)
+            report.add(name, "drones", inserted)
+            if progress:
+                progress(name, "drones", inserted)
+
+        start = order_counts.get(county_id, 0)
+        if orders_per_county > start:
+            with bind.connect() as conn:
+                location_ids = conn.execute(
+                    select(models.Location.id).where(models.Location.county_id == county_id).order_by(models.Location.id)
+                ).scalars().all()
+                drone_ids = conn.execute(
+                    select(models.Drone.id)
+                    .join(models.Station)
+                    .where(models.Station.county_id == county_id)
+                    .order_by(models.Drone.id)
+                ).scalars().all()
+            if not location_ids:
+                continue
+            max_weight = float(entry["max_payload_kg"]) * 0.8
+            now = datetime.utcnow()
+            rows = (
+                {
+                    "origin_location_id": location_ids[int(origin * len(location_ids))],
+                    "destination_location_id": location_ids[int(destination * len(location_ids))],
+                    "weight_kg": round(0.2 + (max_weight - 0.2) * weight, 2),
+                    "county_id": county_id,
+                    "drone_id": drone_ids[int(drone * len(drone_ids))] if drone_ids else None,
+                    "status": "pending",
+                    "created_at": now,
+                    "status_changed_at": now,
+                }
+                for _, (origin, destination, weight, drone) in _indexed_draws(
+                    seed, name, "orders", start, orders_per_county, 4
                 )
             )
+            inserted = _insert_chunks(bind, models.Order, rows, chunk_size)
+            report.add(name, "orders", inserted)
+            if progress:
+                progress(name, "orders", inserted)
 
-        try:
-            session.flush()
-        except IntegrityError as exc:
-            session.rollback()
-            raise RuntimeError(f"Failed to insert seed data: {exc}") from exc
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def seed_data() -> None:
+    if Base.metadata.tables == {}:
+        raise RuntimeError("Metadata not configured before seeding.")
 
-    print("Database initialized with seed data.")
+    ensure_schema(engine, models.Base.metadata)
+    report = seed_reference_data(engine)
+    if report.counties or report.stations or report.drones or report.locations:
+        print(
+            f"Database seeded: {report.counties} counties, {report.stations} stations, "
+            f"{report.drones} drones, {report.locations} locations added."
+        )
+    else:
+        print("Database already contains the seed records; nothing to add.")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Create the schema and seed reference or synthetic data.")
+    parser.add_argument("--counties", type=int, help="Counties to fill (default: the 20 real ones; more adds synthetic ones).")
+    parser.add_argument("--locations-per-county", type=int, default=0, help="Target location count per county.")
+    parser.add_argument("--drones-per-county", type=int, default=0, help="Target drone count per county.")
+    parser.add_argument("--orders-per-county", type=int, default=0, help="Target order count per county (new ones are pending).")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per INSERT transaction.")
+    args = parser.parse_args(argv)
+
+    bulk = args.counties or args.locations_per_county or args.drones_per_county or args.orders_per_county
+    if not bulk:
+        seed_data()
+        return 0
+
+    def progress(county: str, kind: str, inserted: int) -> None:
+        print(f"{county}: +{inserted} {kind}", flush=True)
+
+    report = bulk_seed(
+        engine,
+        counties=args.counties,
+        locations_per_county=args.locations_per_county,
+        drones_per_county=args.drones_per_county,
+        orders_per_county=args.orders_per_county,
+        seed=args.seed,
+        chunk_size=max(1, args.chunk_size),
+        progress=progress,
+    )
+    totals = report.as_dict()
+    print(
+        f"Inserted {totals['counties']} counties, {totals['stations']} stations, {totals['drones']} drones, "
+        f"{totals['locations']} locations, {totals['orders']} orders in {totals['seconds']} s."
+    )
+    return 0
 
 
 if __name__ == "__main__":
-    seed_data()
+    raise SystemExit(main())
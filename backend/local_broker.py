@@ -0,0 +1,309 @@
+"""
+In-process MQTT broker stand-in.
+
+``LocalBroker`` routes messages between ``LocalClient`` instances inside one
+process, and ``LocalClient`` implements the part of paho's ``Client`` surface
+the backend uses (connect, subscribe, publish, loop_start/loop_stop and the
+``on_connect``/``on_message`` callbacks). It lets load tests and offline runs
+exercise the real MQTT code paths without a network broker.
+"""
+from __future__ import annotations
+
+import itertools
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger("backend.local_broker")
+
+# Mirrors paho.mqtt.client return codes.
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+MQTT_ERR_QUEUE_SIZE = 15
+
+Payload = Union[str, bytes, bytearray, int, float, None]
+
+
+def topic_matches(subscription: str, topic: str) -> bool:
+    """MQTT topic filter matching with ``+`` and ``#`` wildcards."""
+    sub_parts = subscription.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(sub_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[index]:
+            return False
+    return len(sub_parts) == len(topic_parts)
+
+
+def _to_bytes(payload: Payload) -> bytes:
+    if payload is None:
+        return b""
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    return str(payload).encode("utf-8")
+
+
+@dataclass
+class LocalMessage:
+    """Duck-typed ``paho.mqtt.client.MQTTMessage``."""
+
+    topic: str
+    payload: bytes
+    qos: int = 0
+    retain: bool = False
+    mid: int = 0
+
+
+@dataclass
+class LocalMessageInfo:
+    """Duck-typed ``paho.mqtt.client.MQTTMessageInfo``."""
+
+    mid: int
+    rc: int = MQTT_ERR_SUCCESS
+    _published: threading.Event = field(default_factory=threading.Event)
+
+    def is_published(self) -> bool:
+        return self._published.is_set()
+
+    def wait_for_publish(self, timeout: Optional[float] = None) -> None:
+        self._published.wait(timeout)
+
+
+class LocalBroker:
+    """Routes published messages to subscribed ``LocalClient`` queues."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscriptions: Dict["LocalClient", List[str]] = {}
+        self._retained: Dict[str, LocalMessage] = {}
+        self.online = True
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def set_online(self, online: bool) -> None:
+        """Simulate the broker going away (``False``) and coming back (``True``)."""
+        self.online = online
+        with self._lock:
+            clients = list(self._subscriptions)
+        for client in clients:
+            client._broker_state_changed(online)
+
+    def attach(self, client: "LocalClient") -> None:
+        with self._lock:
+            self._subscriptions.setdefault(client, [])
+
+    def detach(self, client: "LocalClient") -> None:
+        with self._lock:
+            self._subscriptions.pop(client, None)
+
+    def subscribe(self, client: "LocalClient", topic: str) -> None:
+        with self._lock:
+            topics = self._subscriptions.setdefault(client, [])
+            if topic not in topics:
+                topics.append(topic)
+            retained = [msg for name, msg in self._retained.items() if topic_matches(topic, name)]
+        for message in retained:
+            self._deliver(client, message)
+
+    def unsubscribe(self, client: "LocalClient", topic: str) -> None:
+        with self._lock:
+            topics = self._subscriptions.get(client, [])
+            if topic in topics:
+                topics.remove(topic)
+
+    def publish(self, message: LocalMessage) -> bool:
+        if not self.online:
+            return False
+        with self._lock:
+            self.published += 1
+            if message.retain:
+                self._retained[message.topic] = message
+            targets = [
+                client
+                for client, topics in self._subscriptions.items()
+                if any(topic_matches(topic, message.topic) for topic in topics)
+            ]
+        for client in targets:
+            self._deliver(client, message)
+        return True
+
+    def _deliver(self, client: "LocalClient", message: LocalMessage) -> None:
+        if client._enqueue(message):
+            with self._lock:
+                self.delivered += 1
+        else:
+            with self._lock:
+                self.dropped += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"published": self.published, "delivered": self.delivered, "dropped": self.dropped}
+
+
+_default_broker: Optional[LocalBroker] = None
+_default_broker_lock = threading.Lock()
+
+
+def get_default_broker() -> LocalBroker:
+    """Process-wide broker used by clients created without an explicit one."""
+    global _default_broker
+    with _default_broker_lock:
+        if _default_broker is None:
+            _default_broker = LocalBroker()
+        return _default_broker
+
+
+class LocalClient:
+    """Subset of ``paho.mqtt.client.Client`` backed by a ``LocalBroker``."""
+
+    _mids = itertools.count(1)
+
+    def __init__(
+        self,
+        client_id: str = "",
+        userdata: Any = None,
+        broker: Optional[LocalBroker] = None,
+        max_queued_messages: int = 10000,
+    ) -> None:
+        self._client_id = client_id
+        self._userdata = userdata
+        self._broker = broker or get_default_broker()
+        self._inbox: "queue.Queue[Optional[LocalMessage]]" = queue.Queue(maxsize=max_queued_messages)
+        self._thread: Optional[threading.Thread] = None
+        self._connected = False
+        self.on_connect: Optional[Callable[..., None]] = None
+        self.on_disconnect: Optional[Callable[..., None]] = None
+        self.on_message: Optional[Callable[..., None]] = None
+        self.on_publish: Optional[Callable[..., None]] = None
+
+    # Connection -----------------------------------------------------------
+    def user_data_set(self, userdata: Any) -> None:
+        self._userdata = userdata
+
+    def reconnect_delay_set(self, min_delay: int = 1, max_delay: int = 120) -> None:
+        return None
+
+    def connect(self, _host: str = "localhost", _port: int = 1883, _keepalive: int = 60) -> int:
+        self._broker.attach(self)
+        if not self._broker.online:
+            raise ConnectionRefusedError("Local broker is offline")
+        self._set_connected(True)
+        return MQTT_ERR_SUCCESS
+
+    def connect_async(self, host: str = "localhost", port: int = 1883, keepalive: int = 60) -> None:
+        self._broker.attach(self)
+        if self._broker.online:
+            self._set_connected(True)
+
+    def reconnect(self) -> int:
+        return self.connect()
+
+    def disconnect(self) -> int:
+        self._broker.detach(self)
+        was_connected = self._connected
+        self._connected = False
+        if was_connected and self.on_disconnect:
+            self.on_disconnect(self, self._userdata, MQTT_ERR_SUCCESS)
+        return MQTT_ERR_SUCCESS
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def _set_connected(self, connected: bool) -> None:
+        if connected == self._connected:
+            return
+        self._connected = connected
+        if connected and self.on_connect:
+            self.on_connect(self, self._userdata, {}, 0)
+        elif not connected and self.on_disconnect:
+            self.on_disconnect(self, self._userdata, MQTT_ERR_NO_CONN)
+
+    def _broker_state_changed(self, online: bool) -> None:
+        self._set_connected(online)
+
+    # Pub/sub --------------------------------------------------------------
+    def subscribe(self, topic: str, qos: int = 0) -> Tuple[int, int]:
+        if not self._connected:
+            return MQTT_ERR_NO_CONN, 0
+        self._broker.subscribe(self, topic)
+        return MQTT_ERR_SUCCESS, next(self._mids)
+
+    def unsubscribe(self, topic: str) -> Tuple[int, int]:
+        self._broker.unsubscribe(self, topic)
+        return MQTT_ERR_SUCCESS, next(self._mids)
+
+    def publish(self, topic: str, payload: Payload = None, qos: int = 0, retain: bool = False) -> LocalMessageInfo:
+        info = LocalMessageInfo(mid=next(self._mids))
+        if not self._connected:
+            info.rc = MQTT_ERR_NO_CONN
+            return info
+        message = LocalMessage(topic=topic, payload=_to_bytes(payload), qos=qos, retain=retain, mid=info.mid)
+        if not self._broker.publish(message):
+            info.rc = MQTT_ERR_NO_CONN
+            return info
+        info._published.set()
+        if self.on_publish:
+            self.on_publish(self, self._userdata, info.mid)
+        return info
+
+    # Network loop ---------------------------------------------------------
+    def _enqueue(self, message: LocalMessage) -> bool:
+        try:
+            self._inbox.put_nowait(message)
+        except queue.Full:
+            return False
+        return True
+
+    def pending(self) -> int:
+        """Messages delivered by the broker but not yet handed to ``on_message``."""
+        return self._inbox.qsize()
+
+    def loop(self, timeout: float = 1.0) -> int:
+        """Dispatch at most one queued message, like a single paho loop iteration."""
+        try:
+            message = self._inbox.get(timeout=timeout)
+        except queue.Empty:
+            return MQTT_ERR_SUCCESS
+        if message is not None:
+            self._dispatch(message)
+        return MQTT_ERR_SUCCESS
+
+    def loop_start(self) -> int:
+        if self._thread is not None:
+            return MQTT_ERR_SUCCESS
+        self._thread = threading.Thread(target=self._run, name=f"local-mqtt-{self._client_id or id(self)}", daemon=True)
+        self._thread.start()
+        return MQTT_ERR_SUCCESS
+
+    def loop_stop(self, force: bool = False) -> int:
+        thread = self._thread
+        if thread is None:
+            return MQTT_ERR_SUCCESS
+        self._thread = None
+        try:
+            self._inbox.put_nowait(None)
+        except queue.Full:
+            pass
+        thread.join(timeout=5)
+        return MQTT_ERR_SUCCESS
+
+    def _run(self) -> None:
+        while self._thread is not None:
+            message = self._inbox.get()
+            if message is None:
+                break
+            self._dispatch(message)
+
+    def _dispatch(self, message: LocalMessage) -> None:
+        if not self.on_message:
+            return
+        try:
+            self.on_message(self, self._userdata, message)
+        except Exception:  # pragma: no cover - mirrors paho swallowing callback errors
+            logger.exception("Unhandled error in on_message for %s", message.topic)
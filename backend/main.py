@@ -2,25 +2,35 @@ from __future__ import annotations
 
 import asyncio
 import os
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from backend import mqtt_bg, models
-from backend.db import get_session
-
-load_dotenv()
+from backend import cluster, metrics, mqtt_bg, models, profiling, ws_protocol
+from backend.db import SessionLocal, engine, ensure_schema, get_session
+from backend.services import dispatcher, order_lifecycle, order_query, route_history, whatif
 
 APP_ROOT = Path(__file__).resolve().parent
-templates = Jinja2Templates(directory=str(APP_ROOT / "templates"))
+READY_REQUIRES_MQTT = os.getenv("READY_REQUIRES_MQTT", "0").lower() in {"1", "true", "yes", "on"}
+_templates: Any = None
+
+
+def get_templates() -> Any:
+    """Jinja2 is only needed for the UI page, so it is imported on first use."""
+    global _templates
+    if _templates is None:
+        from fastapi.templating import Jinja2Templates
+
+        _templates = Jinja2Templates(directory=str(APP_ROOT / "templates"))
+    return _templates
 
 origins_env = os.getenv("ALLOW_ORIGINS", "*")
 ALLOW_ORIGINS = [origin.strip() for origin in origins_env.split(",") if origin.strip()] or ["*"]
@@ -34,6 +44,40 @@ app.add_middleware(
     allow_credentials=True,
 )
 
+metrics.install_query_counter(engine)
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    if not metrics.enabled():
+        return await call_next(request)
+
+    query_token = metrics.begin_query_count()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route_path)
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status)
+        metrics.DB_QUERIES_PER_REQUEST.observe(metrics.end_query_count(query_token), source="http")
+
+
+if profiling.enabled():
+    app.middleware("http")(profiling.profile_request_middleware)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not profiling.enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling.check_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
 class LocationResponse(BaseModel):
     id: int
     name: str
@@ -79,9 +123,86 @@ class OrderResponse(BaseModel):
         orm_mode = True
 
 
+class OrderPage(BaseModel):
+    items: List[OrderResponse]
+    next_cursor: Optional[str] = None
+
+
+class ScenarioRequest(BaseModel):
+    name: Optional[str] = None
+    county_id: Optional[int] = None
+    station_id: Optional[int] = None
+    drone_id: Optional[int] = None
+    base_range_km: Optional[float] = Field(None, gt=0)
+    max_payload_kg: Optional[float] = Field(None, gt=0)
+    speed_kmh: Optional[float] = Field(None, gt=0)
+    targets: List[int] = Field(..., min_length=1)
+    weights: List[float] = Field(default_factory=list)
+    safety_margin_ratio: float = Field(0.05, ge=0, lt=1)
+
+
+class BatchPlanRequest(BaseModel):
+    scenarios: List[ScenarioRequest] = Field(..., min_length=1, max_length=whatif.MAX_SCENARIOS)
+    include_steps: bool = False
+
+
+def order_filter(
+    county_id: Optional[int] = None,
+    status: Optional[str] = None,
+    drone_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+) -> order_query.OrderFilter:
+    if status is not None and status not in order_lifecycle.STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status: {status}")
+    return order_query.OrderFilter(county_id, status, drone_id, created_from, created_to)
+
+
+def start_mqtt_owner() -> None:
+    """Start what only one worker may run: the MQTT client (with the planner) and the dispatcher."""
+    mqtt_bg.start()
+    if dispatcher.DISPATCHER_ENABLED:
+        dispatcher.start(SessionLocal, mqtt_bg.get_publisher, mqtt_bg.MQTT_TOPIC)
+
+
+def stop_mqtt_owner() -> None:
+    dispatcher.stop()
+    mqtt_bg.stop()
+
+
 @app.on_event("startup")
 async def startup_event() -> None:
-    mqtt_bg.start()
+    if cluster.CLUSTER_ENABLED:
+        # Workers start together; only one may create tables on a fresh database.
+        with cluster.startup_lock():
+            ensure_schema(engine, models.Base.metadata)
+    else:
+        ensure_schema(engine, models.Base.metadata)
+    profiling.install(app)
+    if cluster.CLUSTER_ENABLED:
+        cluster.start(start_mqtt_owner, stop_mqtt_owner, mqtt_bg.state_since)
+    else:
+        start_mqtt_owner()
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    whatif.shutdown()
+    if cluster.CLUSTER_ENABLED:
+        # Hand the MQTT owner lease to another worker right away.
+        cluster.stop()
+    else:
+        stop_mqtt_owner()
+
+
+def last_message() -> Dict[str, Any]:
+    shared = cluster.follower_state()
+    return shared[0] if shared is not None else mqtt_bg.get_last_message()
+
+
+def last_route() -> List[Any]:
+    shared = cluster.follower_state()
+    return shared[1] if shared is not None else mqtt_bg.get_last_route()
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -89,7 +210,7 @@ def serve_index(request: Request) -> HTMLResponse:
     """Serve the main UI."""
     rest_base_url = os.getenv("FRONTEND_REST_BASE_URL", "").rstrip("/")
     ws_url = os.getenv("FRONTEND_WS_URL", "").rstrip("/")
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "index.html",
         {
             "request": request,
@@ -178,7 +299,7 @@ def create_order(payload: OrderCreate, session: Session = Depends(get_session))
         weight_kg=payload.weight_kg,
         county_id=county_id,
         drone_id=drone.id,
-        status="pending",
+        status=order_lifecycle.PENDING,
     )
     session.add(order)
     session.commit()
@@ -186,6 +307,90 @@ def create_order(payload: OrderCreate, session: Session = Depends(get_session))
     return order
 
 
+@app.get("/api/orders", response_model=OrderPage)
+def list_orders(
+    filters: order_query.OrderFilter = Depends(order_filter),
+    limit: int = Query(order_query.DEFAULT_PAGE_SIZE, ge=1, le=order_query.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    session: Session = Depends(get_session),
+) -> Dict[str, Any]:
+    """Orders matching the filters, keyset-paginated by ``created_at``; pass ``next_cursor`` back as ``cursor``."""
+    try:
+        items, next_cursor = order_query.list_orders(session, filters, limit, cursor, descending=order == "desc")
+    except order_query.InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get("/api/orders/export")
+def export_orders(
+    filters: order_query.OrderFilter = Depends(order_filter),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    session: Session = Depends(get_session),
+) -> StreamingResponse:
+    """Stream every matching order as NDJSON or CSV without loading them into memory."""
+    # The request session is closed before the body streams; the export reads on its own connection.
+    batches = order_query.iter_export_batches(session.get_bind(), filters, descending=order == "desc")
+    if format == "csv":
+        body, media_type = order_query.csv_chunks(batches), "text/csv"
+    else:
+        body, media_type = order_query.ndjson_chunks(batches), "application/x-ndjson"
+    filename = f"orders-{datetime.utcnow():%Y%m%dT%H%M%S}.{format}"
+    return StreamingResponse(
+        body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.post("/api/plan/batch")
+def plan_batch(payload: BatchPlanRequest, session: Session = Depends(get_session)) -> Dict[str, Any]:
+    """Plan what-if scenarios side by side; nothing is published, stored or reserved."""
+    specs = [
+        whatif.ScenarioSpec(
+            name=item.name,
+            county_id=item.county_id,
+            station_id=item.station_id,
+            drone_id=item.drone_id,
+            base_range_km=item.base_range_km,
+            max_payload_kg=item.max_payload_kg,
+            speed_kmh=item.speed_kmh,
+            targets=tuple(item.targets),
+            weights=tuple(item.weights),
+            safety_margin_ratio=item.safety_margin_ratio,
+        )
+        for item in payload.scenarios
+    ]
+    try:
+        scenarios = whatif.resolve_scenarios(session, specs)
+    except whatif.ScenarioError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    started = time.perf_counter()
+    results = whatif.evaluate_batch(scenarios, include_steps=payload.include_steps)
+    return {"scenarios": results, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+@app.get("/api/routes")
+def list_routes(
+    county_id: Optional[int] = None,
+    drone_id: Optional[int] = None,
+    limit: int = Query(route_history.DEFAULT_PAGE_SIZE, ge=1, le=route_history.MAX_PAGE_SIZE),
+    before_id: Optional[int] = None,
+    session: Session = Depends(get_session),
+) -> Dict[str, Any]:
+    """Stored routes, newest first; pass ``next_before_id`` back as ``before_id`` for the next page."""
+    items = route_history.list_routes(session, limit, before_id, county_id, drone_id)
+    return {"items": items, "next_before_id": items[-1]["id"] if len(items) == limit else None}
+
+
+@app.get("/api/routes/{route_id}")
+def get_stored_route(route_id: int, include_steps: bool = True, session: Session = Depends(get_session)) -> Dict[str, Any]:
+    record = session.get(models.RouteRecord, route_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Route not found")
+    return route_history.detail(record, include_steps)
+
+
 @app.get("/api/points")
 def get_points(session: Session = Depends(get_session)) -> List[Dict[str, Any]]:
     locations = session.query(models.Location).order_by(models.Location.name).all()
@@ -194,25 +399,133 @@ def get_points(session: Session = Depends(get_session)) -> List[Dict[str, Any]]:
 
 @app.get("/api/route")
 def get_route() -> List[Any]:
-    return mqtt_bg.get_last_route()
+    return last_route()
 
 
 @app.get("/api/last")
 def get_last() -> Dict[str, Any]:
-    return mqtt_bg.get_last_message()
+    return last_message()
+
+
+@app.get("/healthz")
+def healthz() -> Dict[str, str]:
+    """Liveness: the process is up and serving; no dependency is checked."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz() -> JSONResponse:
+    """Readiness: database and MQTT state, reported separately.
+
+    Not ready (503) when the database is unreachable, or when MQTT is not
+    connected on the MQTT owner and ``READY_REQUIRES_MQTT=1``.
+    """
+    checks: Dict[str, Dict[str, Any]] = {}
+    started = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        checks["db"] = {"status": "ok", "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+    except Exception as exc:
+        checks["db"] = {"status": "error", "error": exc.__class__.__name__}
+
+    if not cluster.is_leader():
+        mqtt_state = "follower"
+    else:
+        mqtt_state = mqtt_bg.connection_state()
+    checks["mqtt"] = {"status": mqtt_state}
+
+    ready = checks["db"]["status"] == "ok" and (
+        not READY_REQUIRES_MQTT or mqtt_state in {"connected", "follower"}
+    )
+    return JSONResponse({"ready": ready, **checks}, status_code=200 if ready else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    if not metrics.enabled():
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admin/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+def sample_profile(
+    seconds: float = Query(10.0, gt=0, le=profiling.MAX_SAMPLE_SECONDS),
+    interval_ms: float = Query(5.0, ge=1.0, le=1000.0),
+) -> PlainTextResponse:
+    """Sample all thread stacks and return them as a collapsed-stack flamegraph input."""
+    try:
+        counts = profiling.sample_stacks(seconds, interval_ms / 1000.0)
+    except profiling.ProfilerBusy as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    filename = f"profile-{datetime.utcnow():%Y%m%dT%H%M%S}.collapsed"
+    return PlainTextResponse(
+        profiling.render_collapsed(counts),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+def get_request_profile(profile_id: str) -> PlainTextResponse:
+    report = profiling.get_request_profile(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(report)
+
+
+async def send_frame(websocket: WebSocket, stream: ws_protocol.StreamEncoder, payload: Dict[str, Any]) -> None:
+    frame = stream.encode(payload)
+    if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+    else:
+        await websocket.send_text(frame)
+    metrics.WEBSOCKET_MESSAGES_SENT.inc()
+    if metrics.enabled():
+        size = len(frame) if isinstance(frame, bytes) else len(frame.encode("utf-8"))
+        metrics.WEBSOCKET_BYTES_SENT.inc(size, mode=stream.mode, encoding=stream.encoding)
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket) -> None:
+async def websocket_endpoint(
+    websocket: WebSocket,
+    replay: Optional[int] = None,
+    speed: float = Query(route_history.REPLAY_SPEED, gt=0),
+    mode: str = Query("full", pattern="^(full|delta)$"),
+    encoding: str = Query("json", pattern="^(json|msgpack)$"),
+) -> None:
+    """Live step feed; with ``?replay=<route id>`` a stored route instead, ``speed`` times faster than planned.
+
+    ``mode=delta`` and ``encoding=msgpack`` select the compact stream (see ``ws_protocol``).
+    """
+    steps = None
+    if replay is not None:
+        # Only a replay reads the database, and only up front: the feed itself can stay open for long.
+        with SessionLocal() as session:
+            record = session.get(models.RouteRecord, replay)
+            steps = route_history.steps_of(record) if record is not None else None
     await websocket.accept()
+    if replay is not None and steps is None:
+        await websocket.close(code=4404, reason="Route not found")
+        return
+    metrics.WEBSOCKET_CLIENTS.inc()
+    stream = ws_protocol.StreamEncoder(mode, encoding)
     last_payload: Dict[str, Any] = {}
 
     try:
+        if steps is not None:
+            for wait_s, step in route_history.replay_schedule(steps, speed):
+                await asyncio.sleep(wait_s)
+                await send_frame(websocket, stream, step)
+            await send_frame(websocket, stream, {"route": [step["next"] for step in steps if step.get("next") is not None]})
+            await websocket.close()
+            return
         while True:
-            payload = mqtt_bg.get_last_message()
+            payload = last_message()
             if payload and payload != last_payload:
-                await websocket.send_json(payload)
+                await send_frame(websocket, stream, payload)
                 last_payload = payload
             await asyncio.sleep(0.3)
     except WebSocketDisconnect:
         return
+    finally:
+        metrics.WEBSOCKET_CLIENTS.dec()
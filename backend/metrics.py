@@ -0,0 +1,355 @@
+"""
+Minimal Prometheus-style metrics.
+
+Counters, gauges and histograms live in a module-level registry and are
+rendered in the Prometheus text exposition format by ``/metrics``. Collection
+is controlled by ``METRICS_ENABLED``; when it is off every update returns
+immediately and timers hand back a shared no-op context manager.
+"""
+from __future__ import annotations
+
+import abc
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+F = TypeVar("F", bound=Callable[..., Any])
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_COUNT_BUCKETS: Tuple[float, ...] = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+_enabled = os.getenv("METRICS_ENABLED", "0").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(flag: bool) -> None:
+    """Toggle collection at runtime (used by tests and the load harness)."""
+    global _enabled
+    _enabled = bool(flag)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abc.abstractmethod
+    def reset(self) -> None:
+        """Drop every recorded series."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        if not _enabled:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[key] = series
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        for metric in self._metrics:
+            metric.reset()
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))  # type: ignore[return-value]
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+
+class _NoopTimer:
+    def __enter__(self) -> "_NoopTimer":
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        return None
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_started")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]) -> None:
+        self._histogram = histogram
+        self._labels = labels
+        self._started = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        self._histogram.observe(time.perf_counter() - self._started, **self._labels)
+
+
+def timer(histogram: Histogram, **labels: Any):
+    """Context manager observing the elapsed wall time into ``histogram``."""
+    if not _enabled:
+        return _NOOP_TIMER
+    return _Timer(histogram, labels)
+
+
+def timed(histogram: Histogram, **labels: Any) -> Callable[[F], F]:
+    """Decorator form of :func:`timer`."""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(histogram, labels):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+class Stopwatch:
+    """Accumulates time spent producing items of an iterator (see ``timed_iter``)."""
+
+    __slots__ = ("elapsed",)
+
+    def __init__(self) -> None:
+        self.elapsed = 0.0
+
+
+def timed_iter(items: Iterable[T], stopwatch: Stopwatch) -> Iterable[T]:
+    """Yield from ``items`` while adding the time spent inside ``next()`` to ``stopwatch``."""
+    if not _enabled:
+        return items
+    return _timed_iter(items, stopwatch)
+
+
+def _timed_iter(items: Iterable[T], stopwatch: Stopwatch) -> Iterator[T]:
+    iterator = iter(items)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stopwatch.elapsed += time.perf_counter() - started
+            return
+        stopwatch.elapsed += time.perf_counter() - started
+        yield item
+
+
+# DB query accounting -------------------------------------------------------
+_query_count: ContextVar[Optional[List[int]]] = ContextVar("metrics_query_count", default=None)
+
+
+def begin_query_count() -> Any:
+    """Start counting SQL statements in the current context; returns a reset token."""
+    return _query_count.set([0])
+
+
+def end_query_count(token: Any) -> int:
+    box = _query_count.get()
+    _query_count.reset(token)
+    return box[0] if box else 0
+
+
+def _count_query(*_args: Any, **_kwargs: Any) -> None:
+    box = _query_count.get()
+    if box is not None:
+        box[0] += 1
+
+
+def install_query_counter(engine: Any) -> None:
+    """Count statements executed on ``engine`` towards the active request."""
+    from sqlalchemy import event
+
+    if not event.contains(engine, "before_cursor_execute", _count_query):
+        event.listen(engine, "before_cursor_execute", _count_query)
+
+
+# Application metrics -------------------------------------------------------
+MQTT_MESSAGES_IN = counter("mqtt_messages_in_total", "MQTT messages received.", ("topic",))
+MQTT_MESSAGES_OUT = counter("mqtt_messages_out_total", "MQTT messages published.", ("topic",))
+MQTT_PUBLISH_FAILURES = counter("mqtt_publish_failures_total", "MQTT publishes with a non-zero rc.", ("topic",))
+MQTT_OUTBOX_DEPTH = gauge("mqtt_outbox_depth", "Outbound MQTT messages queued or awaiting acknowledgement.")
+MQTT_OUTBOX_RETRIES = counter("mqtt_outbox_retries_total", "Outbox send pauses and re-sends.", ("reason",))
+MQTT_OUTBOX_DROPPED = counter("mqtt_outbox_dropped_total", "Outbound MQTT messages the outbox gave up on.", ("reason",))
+MQTT_MESSAGES_REJECTED = counter("mqtt_messages_rejected_total", "MQTT payloads rejected by the decoder.", ("topic", "reason"))
+MQTT_HANDLER_ERRORS = counter("mqtt_handler_errors_total", "MQTT messages whose handler raised.", ("topic", "kind"))
+MQTT_ON_MESSAGE_SECONDS = histogram("mqtt_on_message_seconds", "Time spent in the MQTT on_message callback.", ("topic",))
+PLAN_PHASE_SECONDS = histogram(
+    "plan_phase_seconds",
+    "Targets payload handling time by phase (db_resolve, planning, publish, history).",
+    ("phase",),
+)
+PLANNER_SECONDS = histogram("planner_seconds", "Wall time of a complete planner run.", ("planner",))
+HTTP_REQUESTS = counter("http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+HTTP_REQUEST_SECONDS = histogram("http_request_seconds", "HTTP request latency.", ("method", "route"))
+DB_QUERIES_PER_REQUEST = histogram(
+    "db_queries_per_request",
+    "SQL statements executed per HTTP request or MQTT message.",
+    ("source",),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+WEBSOCKET_CLIENTS = gauge("websocket_clients", "Currently connected /ws clients.")
+WEBSOCKET_MESSAGES_SENT = counter("websocket_messages_sent_total", "Payloads pushed to /ws clients.")
+WEBSOCKET_BYTES_SENT = counter(
+    "websocket_bytes_sent_total", "Frame bytes pushed to /ws clients (before compression).", ("mode", "encoding")
+)
+DISPATCH_BATCHES = counter("dispatch_batches_total", "Order batches released by the dispatcher.", ("trigger",))
+DISPATCHED_ORDERS = counter("dispatched_orders_total", "Orders handled by the dispatcher.", ("outcome",))
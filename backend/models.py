@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import DateTime, Float, ForeignKey, Index, Integer, LargeBinary, String, Text, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from backend.db import Base
@@ -79,6 +79,8 @@ class Order(Base):
     drone_id: Mapped[Optional[int]] = mapped_column(ForeignKey("drones.id"), nullable=True)
     status: Mapped[str] = mapped_column(String(50), nullable=False, default="pending")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    status_changed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow, nullable=True)
+    failure_reason: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
 
     county: Mapped[County] = relationship("County", back_populates="orders")
     drone: Mapped[Optional[Drone]] = relationship("Drone", back_populates="orders")
@@ -92,3 +94,83 @@ class Order(Base):
         back_populates="destination_orders",
         foreign_keys=[destination_location_id],
     )
+    events: Mapped[List["OrderEvent"]] = relationship(
+        "OrderEvent",
+        back_populates="order",
+        cascade="all, delete-orphan",
+        order_by="OrderEvent.id",
+    )
+
+
+# One partial index per active lifecycle state: "next N <status> orders for county X"
+# is an index range scan whose size tracks the live queue, not the whole table.
+ORDER_QUEUE_STATUSES = ("pending", "planned", "assigned", "in_flight")
+for _status in ORDER_QUEUE_STATUSES:
+    Index(
+        f"ix_orders_queue_{_status}",
+        Order.county_id,
+        Order.created_at,
+        Order.id,
+        sqlite_where=text(f"status = '{_status}'"),
+        postgresql_where=text(f"status = '{_status}'"),
+    )
+Index("ix_orders_drone_status", Order.drone_id, Order.status)
+# Keyset pagination/export on (created_at, id), alone or behind one equality filter.
+# The county and status variants are partial on an always-true predicate that only
+# the listing query states, so the planner never picks them over the queue indexes
+# above for the dispatcher's "county + status" lookups (SQLite has no stats to tell).
+ORDER_LIST_PREDICATE = "created_at IS NOT NULL"
+Index("ix_orders_created", Order.created_at, Order.id)
+Index("ix_orders_drone_created", Order.drone_id, Order.created_at, Order.id)
+for _name, _column in (("county", Order.county_id), ("status", Order.status)):
+    Index(
+        f"ix_orders_{_name}_created",
+        _column,
+        Order.created_at,
+        Order.id,
+        sqlite_where=text(ORDER_LIST_PREDICATE),
+        postgresql_where=text(ORDER_LIST_PREDICATE),
+    )
+
+
+class OrderEvent(Base):
+    __tablename__ = "order_events"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id"), nullable=False, index=True)
+    from_status: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    to_status: Mapped[str] = mapped_column(String(50), nullable=False)
+    reason: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+    order: Mapped[Order] = relationship("Order", back_populates="events")
+
+
+class RouteRecord(Base):
+    """A published route: its inputs and steps, stored in ``route_codec`` form.
+
+    History outlives the fleet, so the hub/drone/county ids are plain columns
+    (no foreign keys) and ``meta`` keeps the hub and drone as they were.
+    """
+
+    __tablename__ = "route_records"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    source: Mapped[str] = mapped_column(String(30), nullable=False)
+    county_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    station_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    drone_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    stop_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    step_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    distance_km: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    duration_s: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    meta: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    stops: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    steps: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
+# Newest-first history listing, alone or per county/drone, is a keyset scan on id.
+Index("ix_route_records_county", RouteRecord.county_id, RouteRecord.id)
+Index("ix_route_records_drone", RouteRecord.drone_id, RouteRecord.id)
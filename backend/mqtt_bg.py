@@ -1,20 +1,21 @@
 from __future__ import annotations
 
-import json
 import logging
 import os
 import threading
+import time
 from copy import deepcopy
-from typing import Any, Dict, List, Optional
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
-import paho.mqtt.client as mqtt
-from dotenv import load_dotenv
+from sqlalchemy.orm import Session
 
-from backend import models
+from backend import metrics, models, mqtt_codec, mqtt_outbox
 from backend.db import SessionLocal
-from backend.services import route_planner
+from backend.services import order_lifecycle, route_history, route_planner, scheduling, spatial
 
-load_dotenv()
+if TYPE_CHECKING:  # paho is imported when the client is created, not at startup.
+    import paho.mqtt.client as mqtt
 
 logger = logging.getLogger("backend.mqtt_bg")
 
@@ -22,13 +23,24 @@ MQTT_HOST = os.getenv("MQTT_HOST", "broker.hivemq.com")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 MQTT_TOPIC = os.getenv("MQTT_TOPIC", "dron/utvonal")
 MQTT_TOPIC_TARGETS = os.getenv("MQTT_TARGETS_TOPIC", "dron/celpontok")
+MQTT_RECONNECT_MIN_S = int(os.getenv("MQTT_RECONNECT_MIN_S", "1"))
+MQTT_RECONNECT_MAX_S = int(os.getenv("MQTT_RECONNECT_MAX_S", "60"))
+# {lat, lon} targets snap to the county's nearest location within this distance;
+# farther ones are planned as ad-hoc stops (or dropped with TARGET_ADHOC=0).
+TARGET_SNAP_KM = float(os.getenv("TARGET_SNAP_KM", "0.25"))
+TARGET_ADHOC = os.getenv("TARGET_ADHOC", "1").lower() in {"1", "true", "yes", "on"}
+
+_recharge_model = scheduling.RechargeModel.from_env()
 
 _state_lock = threading.Lock()
 _last_message: Dict[str, Any] = {}
 _last_route: List[Any] = []
+# Bumped on every change to the two above, so followers (``backend.cluster``) can skip unchanged state.
+_state_version = 0
 
 _client_lock = threading.Lock()
 _client: Optional[mqtt.Client] = None
+_outbox: Optional[mqtt_outbox.Outbox] = None
 _started = False
 
 
@@ -37,168 +49,387 @@ def _on_connect(client: mqtt.Client, _userdata, _flags, rc: int) -> None:
         logger.info("Connected to MQTT broker %s:%s", MQTT_HOST, MQTT_PORT)
         client.subscribe(MQTT_TOPIC)
         client.subscribe(MQTT_TOPIC_TARGETS)
+        outbox = _outbox
+        if outbox is not None:
+            outbox.wake()
     else:
         logger.error("MQTT connection failed with code %s", rc)
 
 
+def _on_disconnect(_client: mqtt.Client, _userdata, rc: int, *_args) -> None:
+    if rc != 0:
+        logger.warning("MQTT connection lost (rc=%s); reconnecting with backoff", rc)
+
+
+def _default_client() -> mqtt.Client:
+    import paho.mqtt.client as mqtt
+
+    return mqtt.Client()
+
+
 def _on_message(_client: mqtt.Client, _userdata, msg: mqtt.MQTTMessage) -> None:
+    metrics.MQTT_MESSAGES_IN.inc(topic=msg.topic)
+    with metrics.timer(metrics.MQTT_ON_MESSAGE_SECONDS, topic=msg.topic):
+        _process_message(msg)
+
+
+def _process_message(msg: mqtt.MQTTMessage) -> None:
+    decoder = _DECODERS.get(msg.topic)
+    if decoder is None:
+        return
     try:
-        payload = json.loads(msg.payload.decode("utf-8"))
-    except json.JSONDecodeError:
-        logger.warning("Invalid JSON payload on %s: %s", msg.topic, msg.payload)
+        decoded = decoder.decode(msg.payload)
+    except mqtt_codec.DecodeError as exc:
+        metrics.MQTT_MESSAGES_REJECTED.inc(topic=msg.topic, reason=exc.reason)
+        _reject_log.warning(
+            (msg.topic, exc.reason),
+            "Rejected payload on %s (%s): %s",
+            msg.topic,
+            exc.reason,
+            mqtt_codec.payload_preview(msg.payload),
+        )
         return
 
-    if not isinstance(payload, dict):
-        return
+    handlers = _HANDLERS[msg.topic]
+    for kind in decoded.kinds:
+        try:
+            handlers[kind](decoded.payload)
+        except Exception:
+            # paho runs callbacks unguarded; an escaping error would end the network loop.
+            metrics.MQTT_HANDLER_ERRORS.inc(topic=msg.topic, kind=kind)
+            _reject_log.warning(
+                (msg.topic, kind, "handler_error"),
+                "Handler %s failed on %s: %s",
+                kind,
+                msg.topic,
+                mqtt_codec.payload_preview(msg.payload),
+                exc_info=True,
+            )
 
-    if "coordinates" in payload:
-        with _state_lock:
-            _last_message.clear()
-            _last_message.update(payload)
 
-    if "route" in payload and isinstance(payload["route"], list):
-        with _state_lock:
-            _last_route.clear()
-            _last_route.extend(payload["route"])
+def _store_step(payload: Dict[str, Any]) -> None:
+    global _state_version
+    with _state_lock:
+        _last_message.clear()
+        _last_message.update(payload)
+        _state_version += 1
 
-    if msg.topic == MQTT_TOPIC_TARGETS:
-        _handle_targets_payload(payload)
 
+def _store_route(payload: Dict[str, Any]) -> None:
+    global _state_version
+    with _state_lock:
+        _last_route.clear()
+        _last_route.extend(payload["route"])
+        _state_version += 1
 
-def _handle_targets_payload(payload: Dict[str, Any]) -> None:
-    """Receive county + targets payload, compute route from DB, and publish to MQTT_TOPIC."""
+
+def _handle_order_telemetry(payload: Dict[str, Any]) -> None:
+    """Advance order lifecycle states reported by a drone (in_flight/delivered/failed)."""
+    with SessionLocal() as session:
+        moved = order_lifecycle.apply_telemetry(session, payload)
+        if moved:
+            session.commit()
+            logger.info("Orders %s moved to %s from telemetry", moved, payload.get("order_status"))
+
+
+class _ResolvedTargets(NamedTuple):
+    station: models.Station
+    drone: models.Drone
+    locations: List[models.Location]
+    weights_by_id: Dict[int, float]
+
+
+def _resolve_targets(session: Session, payload: Dict[str, Any]) -> Optional[_ResolvedTargets]:
+    """Look up the county, hub, drone and target locations named in a targets payload."""
     targets = payload.get("targets") or []
     weights = payload.get("weights") or payload.get("target_weights") or []
     target_names = payload.get("target_names") or []
     if not targets and not target_names:
         logger.warning("Received targets payload without targets: %s", payload)
-        return
+        return None
 
     county_id = payload.get("county_id")
     county_name = payload.get("county")
 
-    with SessionLocal() as session:
-        county = None
-        if county_id is not None:
-            county = session.get(models.County, int(county_id))
-        elif county_name:
-            county = (
-                session.query(models.County)
-                .filter(models.County.name == str(county_name))
-                .first()
-            )
-
-        if not county:
-            logger.warning("Unknown county in targets payload: %s", payload)
-            return
-
-        station = (
-            session.query(models.Station)
-            .filter(models.Station.county_id == county.id)
-            .order_by(models.Station.id)
+    county = None
+    if county_id is not None:
+        county = session.get(models.County, int(county_id))
+    elif county_name:
+        county = (
+            session.query(models.County)
+            .filter(models.County.name == str(county_name))
             .first()
         )
-        if not station:
-            logger.warning("No station found for county %s", county.name)
-            return
 
-        locations: List[models.Location] = []
-        weights_by_id: Dict[int, float] = {}
-        names = targets or target_names
-
-        def record_weight(loc_id: int, weight_index: int) -> None:
-            try:
-                weights_by_id[loc_id] = float(weights[weight_index])
-            except Exception:
-                weights_by_id.setdefault(loc_id, 0.0)
-
-        if all(isinstance(t, (int, float, str)) and str(t).isdigit() for t in names):
-            ids = [int(t) for t in names]
-            locations = (
-                session.query(models.Location)
-                .filter(models.Location.id.in_(ids), models.Location.county_id == county.id)
-                .all()
-            )
-            missing = [target_id for target_id in ids if target_id not in {loc.id for loc in locations}]
-            if missing:
-                logger.warning("Some target IDs not found for county %s: %s", county.name, missing)
-            for idx, loc_id in enumerate(ids):
-                record_weight(loc_id, idx)
-        else:
-            for idx, name in enumerate(names):
-                loc = (
-                    session.query(models.Location)
-                    .filter(models.Location.county_id == county.id, models.Location.name == str(name))
-                    .first()
-                )
-                if not loc:
-                    logger.warning("Target name not found in county %s: %s", county.name, name)
-                    continue
-                locations.append(loc)
-                record_weight(loc.id, idx)
-
-        if not locations:
-            logger.warning("No valid locations resolved from payload: %s", payload)
-            return
-
-        drone = (
-            session.query(models.Drone)
-            .filter(models.Drone.station_id == station.id)
-            .order_by(models.Drone.id)
-            .first()
+    if not county:
+        logger.warning("Unknown county in targets payload: %s", payload)
+        return None
+
+    station = (
+        session.query(models.Station)
+        .filter(models.Station.county_id == county.id)
+        .order_by(models.Station.id)
+        .first()
+    )
+    if not station:
+        logger.warning("No station found for county %s", county.name)
+        return None
+
+    snap_km = float(payload.get("snap_km", TARGET_SNAP_KM))
+    adhoc = bool(payload.get("adhoc", TARGET_ADHOC))
+    locations, weights_by_id = _resolve_target_entries(session, county, targets or target_names, weights, snap_km, adhoc)
+
+    if not locations:
+        logger.warning("No valid locations resolved from payload: %s", payload)
+        return None
+
+    drone = (
+        session.query(models.Drone)
+        .filter(models.Drone.station_id == station.id)
+        .order_by(models.Drone.id)
+        .first()
+    )
+    if not drone:
+        logger.error("No drone configured for station %s", station.name)
+        return None
+
+    total_payload = sum(weights_by_id.values())
+    if drone.max_payload_kg and total_payload > drone.max_payload_kg:
+        logger.warning(
+            "Total payload %.2f kg exceeds drone max payload %.2f kg; attempting planning anyway.",
+            total_payload,
+            drone.max_payload_kg,
         )
-        if not drone:
-            logger.error("No drone configured for station %s", station.name)
-            return
 
-        total_payload = sum(weights_by_id.values())
-        if drone.max_payload_kg and total_payload > drone.max_payload_kg:
-            logger.warning(
-                "Total payload %.2f kg exceeds drone max payload %.2f kg; attempting planning anyway.",
-                total_payload,
-                drone.max_payload_kg,
-            )
-
-        steps = route_planner.plan_route_with_recharges(
-            locations,
-            station,
-            drone,
-            weights_by_location_id=weights_by_id,
+    return _ResolvedTargets(station, drone, locations, weights_by_id)
+
+
+def _is_point(entry: Any) -> bool:
+    return isinstance(entry, dict) and "lat" in entry and "lon" in entry
+
+
+def _resolve_target_entries(
+    session: Session,
+    county: models.County,
+    entries: List[Any],
+    weights: List[Any],
+    snap_km: float = TARGET_SNAP_KM,
+    adhoc: bool = TARGET_ADHOC,
+) -> Tuple[List[models.Location], Dict[int, float]]:
+    """Resolve target ids, names and ``{lat, lon}`` points in a county, in payload order.
+
+    Each kind is looked up in one go: ids and names with one query each,
+    points with one nearest-location lookup per point on the shared spatial
+    index. A point with no location within ``snap_km`` becomes an ad-hoc stop
+    (a transient ``Location`` with a negative id, never stored) when
+    ``adhoc`` is set, and is dropped otherwise.
+    """
+    points = [(position, entry) for position, entry in enumerate(entries) if _is_point(entry)]
+    snapped: Dict[int, Optional[spatial.Match]] = {}
+    if points:
+        matches = spatial.place_index(session.get_bind()).nearest_each(
+            session,
+            "location",
+            [(float(entry["lat"]), float(entry["lon"])) for _, entry in points],
+            max_km=snap_km,
+            county_id=county.id,
         )
-        client = get_client()
-        if not client:
-            logger.error("MQTT client not available; cannot publish route.")
-            return
-
-        with _state_lock:
-            _last_route.clear()
-            _last_route.extend([step.get("next") for step in steps if step.get("next")])
-
-        route_planner.publish_route_mqtt(client, steps, MQTT_TOPIC)
+        snapped = {position: match for (position, _), match in zip(points, matches)}
+
+    ids = {int(entry) for entry in entries if mqtt_codec.is_id(entry)}
+    ids.update(int(match[1]) for match in snapped.values() if match is not None)
+    names = {str(entry) for entry in entries if not _is_point(entry) and not mqtt_codec.is_id(entry)}
+    by_id: Dict[int, models.Location] = {}
+    if ids:
+        query = session.query(models.Location).filter(models.Location.id.in_(ids), models.Location.county_id == county.id)
+        by_id = {loc.id: loc for loc in query}
+    by_name: Dict[str, models.Location] = {}
+    if names:
+        query = (
+            session.query(models.Location)
+            .filter(models.Location.county_id == county.id, models.Location.name.in_(names))
+            .order_by(models.Location.id)
+        )
+        for loc in query:
+            by_name.setdefault(loc.name, loc)
+
+    locations: Dict[int, models.Location] = {}
+    weights_by_id: Dict[int, float] = {}
+    missing: List[Any] = []
+    for position, entry in enumerate(entries):
+        if _is_point(entry):
+            match = snapped.get(position)
+            if match is not None:
+                loc = by_id.get(int(match[1]))
+            elif adhoc:
+                lat, lon = float(entry["lat"]), float(entry["lon"])
+                name = str(entry.get("name") or f"GPS {lat:.5f},{lon:.5f}")
+                loc = models.Location(id=-(position + 1), name=name, county_id=county.id, lat=lat, lon=lon)
+            else:
+                loc = None
+        elif mqtt_codec.is_id(entry):
+            loc = by_id.get(int(entry))
+        else:
+            loc = by_name.get(str(entry))
+        if loc is None:
+            missing.append(entry)
+            continue
+        locations.setdefault(loc.id, loc)
+        try:
+            weights_by_id[loc.id] = float(weights[position])
+        except Exception:
+            weights_by_id.setdefault(loc.id, 0.0)
+    if missing:
+        logger.warning("Some targets not found for county %s: %s", county.name, missing)
+    return list(locations.values()), weights_by_id
 
 
-def start() -> None:
-    """Initialise the background MQTT client if it isn't running yet."""
-    global _client, _started
+def _handle_targets_payload(payload: Dict[str, Any]) -> None:
+    """Receive county + targets payload, compute route from DB, and publish to MQTT_TOPIC."""
+    global _state_version
+    query_token = metrics.begin_query_count() if metrics.enabled() else None
+    try:
+        with SessionLocal() as session:
+            with metrics.timer(metrics.PLAN_PHASE_SECONDS, phase="db_resolve"):
+                resolved = _resolve_targets(session, payload)
+            if resolved is None:
+                return
+
+            client = get_publisher()
+            if not client:
+                logger.error("MQTT client not available; cannot publish route.")
+                return
+
+            with _state_lock:
+                _last_route.clear()
+                _state_version += 1
+
+            start_time = datetime.utcnow()
+            steps = route_planner.iter_route_with_recharges(
+                resolved.locations,
+                resolved.station,
+                resolved.drone,
+                weights_by_location_id=resolved.weights_by_id,
+                start_time=start_time,
+                recharge_model=_recharge_model,
+                station_schedule=scheduling.default_station_schedule(),
+            )
+            planning = metrics.Stopwatch()
+            started = time.perf_counter()
+            published: List[Dict[str, Any]] = []
+            _names, sent = route_planner.publish_steps(
+                client, _track_route(metrics.timed_iter(steps, planning), published), MQTT_TOPIC
+            )
+            if metrics.enabled():
+                # Planning and publishing interleave; split the streamed time by where it was spent.
+                metrics.PLAN_PHASE_SECONDS.observe(planning.elapsed, phase="planning")
+                metrics.PLAN_PHASE_SECONDS.observe(time.perf_counter() - started - planning.elapsed, phase="publish")
+
+            if not sent:
+                # Same rule as the dispatcher: history holds only routes that fully went out.
+                logger.warning(
+                    "Route for county %s was not fully published; not recording it.", resolved.station.county_id
+                )
+                return
+            with metrics.timer(metrics.PLAN_PHASE_SECONDS, phase="history"):
+                stops = route_history.stop_rows(resolved.locations, resolved.weights_by_id)
+                if route_history.record_route(
+                    session, "mqtt", published, resolved.station, resolved.drone, stops, start_time
+                ) is not None:
+                    session.commit()
+    finally:
+        if query_token is not None:
+            metrics.DB_QUERIES_PER_REQUEST.observe(metrics.end_query_count(query_token), source="mqtt")
+
+
+def _track_route(
+    steps: Iterable[Dict[str, Any]], published: Optional[List[Dict[str, Any]]] = None
+) -> Iterator[Dict[str, Any]]:
+    """Pass steps through while appending each visited name to the cached route (and each step to ``published``)."""
+    global _state_version
+    for step in steps:
+        if step.get("next"):
+            with _state_lock:
+                _last_route.append(step["next"])
+                _state_version += 1
+        if published is not None:
+            published.append(step)
+        yield step
+
+
+# Per-topic decoders and dispatch tables; a payload runs the handler of every kind it matches, in order.
+_DECODERS: Dict[str, mqtt_codec.TopicDecoder] = {
+    MQTT_TOPIC: mqtt_codec.TopicDecoder(
+        [
+            mqtt_codec.MessageKind("step", "coordinates", mqtt_codec.validate_step),
+            mqtt_codec.MessageKind("route", "route", mqtt_codec.validate_route),
+            mqtt_codec.MessageKind(
+                "order_status", "order_status", mqtt_codec.order_status_validator(order_lifecycle.TELEMETRY_STATUSES)
+            ),
+        ]
+    ),
+    MQTT_TOPIC_TARGETS: mqtt_codec.TopicDecoder([mqtt_codec.MessageKind("targets", None, mqtt_codec.validate_targets)]),
+}
+_HANDLERS: Dict[str, Dict[str, Callable[[Dict[str, Any]], None]]] = {
+    MQTT_TOPIC: {"step": _store_step, "route": _store_route, "order_status": _handle_order_telemetry},
+    MQTT_TOPIC_TARGETS: {"targets": _handle_targets_payload},
+}
+_reject_log = mqtt_codec.RateLimitedLog(logger)
+
+
+def start(client_factory: Optional[Callable[[], mqtt.Client]] = None) -> None:
+    """Initialise the background MQTT client if it isn't running yet.
+
+    ``client_factory`` builds the client instead of ``mqtt.Client``; load tests
+    pass one that returns a ``local_broker.LocalClient``.
+    """
+    global _client, _outbox, _started
 
     with _client_lock:
         if _started:
             return
 
-        client = mqtt.Client()
+        if mqtt_outbox.OUTBOX_ENABLED and _outbox is None:
+            _outbox = mqtt_outbox.Outbox(get_client)
+            _outbox.start()
+
+        client = (client_factory or _default_client)()
         client.on_connect = _on_connect
+        client.on_disconnect = _on_disconnect
         client.on_message = _on_message
+        client.reconnect_delay_set(MQTT_RECONNECT_MIN_S, MQTT_RECONNECT_MAX_S)
 
+        # The network loop connects (and keeps reconnecting) in the background,
+        # so a slow or unreachable broker never blocks application startup.
         try:
-            client.connect(MQTT_HOST, MQTT_PORT, 60)
+            client.connect_async(MQTT_HOST, MQTT_PORT, 60)
         except Exception as exc:  # pragma: no cover - defensive
-            logger.error("Failed to connect to MQTT broker: %s", exc)
+            logger.error("Invalid MQTT broker settings %s:%s: %s", MQTT_HOST, MQTT_PORT, exc)
             return
 
         client.loop_start()
         _client = client
         _started = True
-        logger.info("MQTT background client started.")
+        logger.info("MQTT background client started; connecting to %s:%s.", MQTT_HOST, MQTT_PORT)
+
+
+def stop() -> None:
+    """Stop the background MQTT client so ``start`` can be called again."""
+    global _client, _outbox, _started
+
+    with _client_lock:
+        client = _client
+        outbox = _outbox
+        _client = None
+        _outbox = None
+        _started = False
+
+    if outbox is not None:
+        outbox.stop()
+    if client is not None:
+        client.loop_stop()
+        client.disconnect()
+        logger.info("MQTT background client stopped.")
 
 
 def get_client() -> Optional[mqtt.Client]:
@@ -206,6 +437,21 @@ def get_client() -> Optional[mqtt.Client]:
         return _client
 
 
+def connection_state() -> str:
+    """``stopped`` (never started here), ``connected`` or ``connecting``."""
+    client = get_client()
+    if client is None:
+        return "stopped"
+    return "connected" if client.is_connected() else "connecting"
+
+
+def get_publisher() -> Any:
+    """Where route publishes go: the outbox when enabled, else the client itself."""
+    with _client_lock:
+        outbox = _outbox
+    return outbox if outbox is not None else get_client()
+
+
 def get_last_message() -> Dict[str, Any]:
     with _state_lock:
         return deepcopy(_last_message)
@@ -214,3 +460,11 @@ def get_last_message() -> Dict[str, Any]:
 def get_last_route() -> List[Any]:
     with _state_lock:
         return deepcopy(_last_route)
+
+
+def state_since(version: int) -> Optional[Tuple[int, Dict[str, Any], List[Any]]]:
+    """``(version, last message, last route)`` if the state changed after ``version``, else ``None``."""
+    with _state_lock:
+        if _state_version == version:
+            return None
+        return _state_version, deepcopy(_last_message), deepcopy(_last_route)
@@ -0,0 +1,218 @@
+"""
+Per-topic decoders for inbound MQTT payloads.
+
+Each subscribed topic gets a ``TopicDecoder``: a fixed list of message kinds,
+each with a pre-built validator that checks only the fields its handler reads.
+``decode`` parses the raw bytes once (``orjson`` when installed, the stdlib
+``json`` otherwise) and returns the matching kinds together with the parsed
+dict. Malformed input is rejected before any handler, session or lock is
+touched, and rejections are logged through ``RateLimitedLog`` so a misbehaving
+publisher cannot flood the log.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:  # Optional: faster JSON parsing on the MQTT loop thread.
+    import orjson
+except ImportError:  # pragma: no cover - exercised without orjson installed
+    orjson = None  # type: ignore[assignment]
+
+MAX_PAYLOAD_BYTES = int(os.getenv("MQTT_MAX_PAYLOAD_BYTES", str(256 * 1024)))
+REJECT_LOG_INTERVAL_S = float(os.getenv("MQTT_REJECT_LOG_INTERVAL_S", "10"))
+LOG_PAYLOAD_PREFIX = 200
+
+Validator = Callable[[Dict[str, Any]], Optional[str]]
+
+
+class DecodeError(ValueError):
+    """Payload rejected; ``reason`` is a short, metric-friendly label."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+if orjson is not None:
+    _JSON_ERRORS: Tuple[type, ...] = (orjson.JSONDecodeError,)
+
+    def loads(raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+else:  # pragma: no cover - exercised without orjson installed
+    _JSON_ERRORS = (json.JSONDecodeError, UnicodeDecodeError)
+
+    def loads(raw: bytes) -> Any:
+        return json.loads(raw)
+
+
+def parse_object(raw: bytes) -> Dict[str, Any]:
+    """Parse a JSON object payload, rejecting empty, oversized or non-object input cheaply."""
+    if not raw:
+        raise DecodeError("empty")
+    if len(raw) > MAX_PAYLOAD_BYTES:
+        raise DecodeError("too_large")
+    if raw[:1] != b"{" and raw.lstrip()[:1] != b"{":
+        raise DecodeError("not_object")
+    try:
+        payload = loads(raw)
+    except _JSON_ERRORS:
+        raise DecodeError("invalid_json") from None
+    if not isinstance(payload, dict):
+        raise DecodeError("not_object")
+    return payload
+
+
+# Validators: return ``None`` when the payload is usable, else a rejection reason.
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_id(value: Any) -> bool:
+    """A database id as sent over MQTT: a non-negative int or an ASCII digit string."""
+    if isinstance(value, str):
+        return value.isascii() and value.isdigit()
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def validate_step(payload: Dict[str, Any]) -> Optional[str]:
+    coordinates = payload["coordinates"]
+    if not isinstance(coordinates, dict) or not _is_number(coordinates.get("x")) or not _is_number(coordinates.get("y")):
+        return "bad_coordinates"
+    return None
+
+
+def validate_route(payload: Dict[str, Any]) -> Optional[str]:
+    return None if isinstance(payload["route"], list) else "bad_route"
+
+
+def order_status_validator(statuses: Sequence[str]) -> Validator:
+    allowed = frozenset(statuses)
+
+    def validate(payload: Dict[str, Any]) -> Optional[str]:
+        if payload["order_status"] not in allowed:
+            return "bad_order_status"
+        ids = payload.get("order_ids")
+        if isinstance(ids, list):
+            return None if ids else "missing_order_id"
+        return None if payload.get("order_id") is not None else "missing_order_id"
+
+    return validate
+
+
+def _valid_point(entry: Dict[str, Any]) -> bool:
+    lat, lon = entry.get("lat"), entry.get("lon")
+    return (
+        isinstance(lat, (int, float))
+        and isinstance(lon, (int, float))
+        and not isinstance(lat, bool)
+        and not isinstance(lon, bool)
+        and -90.0 <= lat <= 90.0
+        and -180.0 <= lon <= 180.0
+    )
+
+
+def validate_targets(payload: Dict[str, Any]) -> Optional[str]:
+    targets = payload.get("targets")
+    names = payload.get("target_names")
+    if targets is not None and not isinstance(targets, list):
+        return "bad_targets"
+    if names is not None and not isinstance(names, list):
+        return "bad_targets"
+    if not targets and not names:
+        return "missing_targets"
+    for entry in targets or names:
+        # Ids and names pass through; {lat, lon} points need usable coordinates.
+        if isinstance(entry, dict) and not _valid_point(entry):
+            return "bad_targets"
+    county_id = payload.get("county_id")
+    if county_id is not None and not is_id(county_id):
+        return "bad_targets"
+    county = payload.get("county")
+    if county is not None and not isinstance(county, str):
+        return "bad_targets"
+    if county_id is None and not county:
+        return "missing_county"
+    adhoc = payload.get("adhoc")
+    if adhoc is not None and not isinstance(adhoc, bool):
+        return "bad_targets"
+    snap_km = payload.get("snap_km")
+    if snap_km is not None and (not isinstance(snap_km, (int, float)) or isinstance(snap_km, bool) or snap_km < 0):
+        return "bad_targets"
+    weights = payload.get("weights") or payload.get("target_weights")
+    if weights is not None and not isinstance(weights, list):
+        return "bad_weights"
+    return None
+
+
+@dataclass(frozen=True)
+class MessageKind:
+    """A message kind, recognised by its ``key`` (``None``: every payload) and checked by ``validate``."""
+
+    name: str
+    key: Optional[str]
+    validate: Validator
+
+
+@dataclass(frozen=True)
+class Decoded:
+    payload: Dict[str, Any]
+    kinds: Tuple[str, ...]
+
+
+class TopicDecoder:
+    """Decoder for one topic. A payload may match several kinds (e.g. a step reporting an order status)."""
+
+    def __init__(self, kinds: Sequence[MessageKind]) -> None:
+        self.kinds = tuple(kinds)
+
+    def decode(self, raw: bytes) -> Decoded:
+        payload = parse_object(raw)
+        matched: List[str] = []
+        for kind in self.kinds:
+            if kind.key is not None and kind.key not in payload:
+                continue
+            reason = kind.validate(payload)
+            if reason is not None:
+                raise DecodeError(reason)
+            matched.append(kind.name)
+        return Decoded(payload, tuple(matched))
+
+
+class RateLimitedLog:
+    """Logs at most one line per key every ``interval_s``, reporting how many were suppressed."""
+
+    def __init__(self, logger: logging.Logger, interval_s: float = REJECT_LOG_INTERVAL_S) -> None:
+        self.logger = logger
+        self.interval_s = interval_s
+        self._lock = threading.Lock()
+        self._next_at: Dict[Tuple[str, ...], float] = {}
+        self._suppressed: Dict[Tuple[str, ...], int] = {}
+
+    def warning(self, key: Tuple[str, ...], msg: str, *args: Any, exc_info: bool = False) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_at.get(key, 0.0):
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self._next_at[key] = now + self.interval_s
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            msg += " (%d similar suppressed)"
+            args = (*args, suppressed)
+        self.logger.warning(msg, *args, exc_info=exc_info)
+        return True
+
+
+def payload_preview(raw: bytes) -> str:
+    """Short, safe rendering of a rejected payload for the log."""
+    text = raw[:LOG_PAYLOAD_PREFIX].decode("utf-8", errors="replace")
+    if len(raw) > LOG_PAYLOAD_PREFIX:
+        text += f"... ({len(raw)} bytes)"
+    return text
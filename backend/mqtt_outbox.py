@@ -0,0 +1,350 @@
+"""
+Durable outbound MQTT queue.
+
+``Outbox`` duck-types the ``publish`` method of a paho client, so
+``route_planner.publish_route_stream`` and the dispatcher can publish into it
+unchanged. ``publish`` only enqueues and returns at once; a sender thread
+("mqtt-outbox") hands messages to the current client in order, with
+``MQTT_QOS``:
+
+- At most ``OUTBOX_MAX_INFLIGHT`` messages are waiting for their
+  acknowledgement (``is_published``) at a time. If the oldest one is not
+  acknowledged within ``OUTBOX_ACK_TIMEOUT_S``, everything in flight goes back
+  to the front of the queue and is sent again (at-least-once).
+- While the client is missing or disconnected, or when ``publish`` returns a
+  non-zero ``rc``, sending pauses with exponential backoff
+  (``OUTBOX_RETRY_BASE_S`` doubling up to ``OUTBOX_RETRY_MAX_S``). ``wake()``
+  (called from ``on_connect``) ends the pause immediately. A message that is
+  rejected ``OUTBOX_MAX_ATTEMPTS`` times by a connected client is dropped.
+- The queue holds at most ``OUTBOX_MAX_MESSAGES``. Past that, ``publish``
+  returns ``rc=MQTT_ERR_QUEUE_SIZE`` instead of growing without bound. The
+  planner runs on the MQTT loop thread, so the outbox never blocks it.
+- With ``OUTBOX_SPOOL`` set, every queued message is appended to a JSONL spool
+  file and acknowledged ones are marked done there. Messages still pending
+  when the process stops are loaded and re-sent on the next start. The file
+  is truncated whenever the queue drains, and compacted if it never does.
+- After ``stop()`` the outbox is closed: ``publish`` returns
+  ``rc=MQTT_ERR_NO_CONN`` and queues nothing, so threads still holding it
+  fail like a disconnected client would.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from backend import metrics
+
+logger = logging.getLogger("backend.mqtt_outbox")
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+MQTT_ERR_QUEUE_SIZE = 15
+
+MQTT_QOS = int(os.getenv("MQTT_QOS", "1"))
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "1").lower() in {"1", "true", "yes", "on"}
+OUTBOX_SPOOL = os.getenv("OUTBOX_SPOOL", "")
+OUTBOX_MAX_MESSAGES = int(os.getenv("OUTBOX_MAX_MESSAGES", "10000"))
+OUTBOX_MAX_INFLIGHT = int(os.getenv("OUTBOX_MAX_INFLIGHT", "20"))
+OUTBOX_ACK_TIMEOUT_S = float(os.getenv("OUTBOX_ACK_TIMEOUT_S", "10"))
+OUTBOX_RETRY_BASE_S = float(os.getenv("OUTBOX_RETRY_BASE_S", "0.5"))
+OUTBOX_RETRY_MAX_S = float(os.getenv("OUTBOX_RETRY_MAX_S", "30"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+
+
+@dataclass
+class OutboxEntry:
+    seq: int
+    topic: str
+    payload: str
+    qos: int
+    retain: bool = False
+    attempts: int = 0
+
+
+@dataclass
+class OutboxResult:
+    """Stands in for paho's ``MQTTMessageInfo``: ``rc`` tells whether the message was queued."""
+
+    rc: int
+    mid: int = 0
+
+
+class Spool:
+    """Append-only JSONL log of queued messages plus ``{"ack": seq}`` watermarks."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a", encoding="utf-8")
+        self.records = 0
+
+    def load(self) -> List[OutboxEntry]:
+        """Messages that were queued but never acknowledged."""
+        entries: Dict[int, OutboxEntry] = {}
+        acked = 0
+        with self.path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-write.
+                    continue
+                if "ack" in record:
+                    acked = max(acked, int(record["ack"]))
+                else:
+                    entries[int(record["seq"])] = OutboxEntry(
+                        int(record["seq"]), record["topic"], record["payload"], int(record["qos"]), bool(record.get("retain"))
+                    )
+        return [entries[seq] for seq in sorted(entries) if seq > acked]
+
+    def append(self, entry: OutboxEntry) -> None:
+        record = {"seq": entry.seq, "topic": entry.topic, "payload": entry.payload, "qos": entry.qos, "retain": entry.retain}
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self.records += 1
+
+    def ack(self, seq: int) -> None:
+        self._file.write(json.dumps({"ack": seq}) + "\n")
+        self._file.flush()
+        self.records += 1
+
+    def rewrite(self, entries: Iterable[OutboxEntry]) -> None:
+        """Replace the file with just ``entries`` (empty: truncate)."""
+        self._file.close()
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with tmp.open("w", encoding="utf-8") as handle:
+            for entry in entries:
+                record = {"seq": entry.seq, "topic": entry.topic, "payload": entry.payload, "qos": entry.qos, "retain": entry.retain}
+                handle.write(json.dumps(record) + "\n")
+        os.replace(tmp, self.path)
+        self._file = self.path.open("a", encoding="utf-8")
+        self.records = 0
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _is_connected(client: Any) -> bool:
+    check = getattr(client, "is_connected", None)
+    return check() if callable(check) else True
+
+
+def _is_published(info: Any) -> bool:
+    check = getattr(info, "is_published", None)
+    return check() if callable(check) else True
+
+
+class Outbox:
+    """Queue in front of an MQTT client; see the module docstring."""
+
+    def __init__(
+        self,
+        get_client: Callable[[], Any],
+        qos: int = MQTT_QOS,
+        spool_path: Optional[str] = OUTBOX_SPOOL,
+        max_messages: int = OUTBOX_MAX_MESSAGES,
+        max_inflight: int = OUTBOX_MAX_INFLIGHT,
+        ack_timeout_s: float = OUTBOX_ACK_TIMEOUT_S,
+        retry_base_s: float = OUTBOX_RETRY_BASE_S,
+        retry_max_s: float = OUTBOX_RETRY_MAX_S,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+    ) -> None:
+        self.get_client = get_client
+        self.qos = qos
+        self.max_messages = max_messages
+        self.max_inflight = max(1, max_inflight)
+        self.ack_timeout_s = ack_timeout_s
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self.max_attempts = max_attempts
+
+        self._cond = threading.Condition()
+        self._queue: Deque[OutboxEntry] = deque()
+        # (entry, message info, sent at); only the sender thread touches it.
+        self._inflight: Deque[Tuple[OutboxEntry, Any, float]] = deque()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._stop = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.spool = Spool(Path(spool_path)) if spool_path else None
+        recovered: List[OutboxEntry] = []
+        if self.spool is not None:
+            recovered = self.spool.load()
+            # Start from a compact file so new sequence numbers never fall under an old ack watermark.
+            self.spool.rewrite(recovered)
+        self._seq = itertools.count((recovered[-1].seq if recovered else 0) + 1)
+        if recovered:
+            self._queue.extend(recovered)
+            logger.info("Recovered %s unsent MQTT messages from %s", len(recovered), spool_path)
+        self._set_depth()
+
+    # Producer side -----------------------------------------------------------
+    def publish(self, topic: str, payload: Any = None, qos: Optional[int] = None, retain: bool = False) -> OutboxResult:
+        """Queue a message for sending; ``rc`` is non-zero when the queue is full or the outbox stopped."""
+        text = payload.decode("utf-8") if isinstance(payload, (bytes, bytearray)) else ("" if payload is None else str(payload))
+        with self._cond:
+            if self._closed:
+                metrics.MQTT_OUTBOX_DROPPED.inc(reason="closed")
+                logger.warning("MQTT outbox stopped; rejecting publish to %s", topic)
+                return OutboxResult(MQTT_ERR_NO_CONN)
+            if len(self._queue) + len(self._inflight) >= self.max_messages:
+                metrics.MQTT_OUTBOX_DROPPED.inc(reason="full")
+                logger.warning("MQTT outbox full (%s messages); rejecting publish to %s", self.max_messages, topic)
+                return OutboxResult(MQTT_ERR_QUEUE_SIZE)
+            entry = OutboxEntry(next(self._seq), topic, text, self.qos if qos is None else qos, retain)
+            if self.spool is not None:
+                self.spool.append(entry)
+            self._queue.append(entry)
+            self._set_depth()
+            # flush() waiters share the condition; notify() could wake one of them instead of the sender.
+            self._cond.notify_all()
+        return OutboxResult(MQTT_ERR_SUCCESS, entry.seq)
+
+    def pending(self) -> int:
+        """Messages queued or waiting for acknowledgement."""
+        with self._cond:
+            return len(self._queue) + len(self._inflight)
+
+    def wake(self) -> None:
+        """Retry now (e.g. after a reconnect) instead of waiting out the backoff."""
+        with self._cond:
+            self._retry_at = 0.0
+            self._failures = 0
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued message is acknowledged; ``False`` on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.5)
+        return True
+
+    # Sender thread -----------------------------------------------------------
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mqtt-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """Stop the sender and close the outbox; unacknowledged messages stay in the spool for the next start."""
+        self._stop.set()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        thread = self._thread
+        self._thread = None
+        if thread is not None:
+            thread.join(timeout)
+        if self.spool is not None:
+            self.spool.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                wait_s = self.step()
+            except Exception:  # pragma: no cover - keep the sender alive
+                logger.exception("MQTT outbox iteration failed")
+                wait_s = self.retry_base_s
+            with self._cond:
+                if wait_s > 0 and not self._stop.is_set():
+                    self._cond.wait(wait_s)
+
+    def step(self, now: Optional[float] = None) -> float:
+        """One sender pass: reap acks, requeue timeouts, send what the window allows.
+
+        Returns how long the sender may sleep before the next pass.
+        """
+        now = time.monotonic() if now is None else now
+        self._reap_acks()
+        if self._inflight and now - self._inflight[0][2] > self.ack_timeout_s:
+            self._requeue_inflight("ack_timeout")
+
+        while len(self._inflight) < self.max_inflight:
+            with self._cond:
+                if not self._queue:
+                    break
+                if now < self._retry_at:
+                    return self._retry_at - now
+                entry = self._queue[0]
+            client = self.get_client()
+            if client is None or not _is_connected(client):
+                self._backoff(now, count_attempt=False)
+                return self._retry_at - now
+            info = client.publish(entry.topic, entry.payload, qos=entry.qos, retain=entry.retain)
+            rc = getattr(info, "rc", MQTT_ERR_SUCCESS)
+            if rc != MQTT_ERR_SUCCESS:
+                metrics.MQTT_PUBLISH_FAILURES.inc(topic=entry.topic)
+                self._backoff(now, count_attempt=True)
+                return self._retry_at - now
+            with self._cond:
+                if self._queue and self._queue[0] is entry:
+                    self._queue.popleft()
+            self._inflight.append((entry, info, now))
+            self._failures = 0
+        self._reap_acks()
+        # Poll for acknowledgements while anything is in flight.
+        return 0.01 if self._inflight else 1.0
+
+    def _reap_acks(self) -> None:
+        acked = None
+        while self._inflight and _is_published(self._inflight[0][1]):
+            acked = self._inflight.popleft()[0]
+        if acked is None:
+            return
+        with self._cond:
+            drained = not self._queue and not self._inflight
+            if self.spool is not None:
+                if drained:
+                    self.spool.rewrite(())
+                elif self.spool.records > 2 * self.max_messages:
+                    # Never drained for a long while: drop the acknowledged history.
+                    self.spool.rewrite([entry for entry, _info, _sent in self._inflight] + list(self._queue))
+                else:
+                    self.spool.ack(acked.seq)
+            self._set_depth()
+            self._cond.notify_all()
+
+    def _requeue_inflight(self, reason: str) -> None:
+        logger.warning("MQTT outbox: %s message(s) unacknowledged (%s); re-sending", len(self._inflight), reason)
+        with self._cond:
+            for entry, _info, _sent in reversed(self._inflight):
+                entry.attempts += 1
+                self._queue.appendleft(entry)
+            self._inflight.clear()
+        metrics.MQTT_OUTBOX_RETRIES.inc(reason=reason)
+
+    def _backoff(self, now: float, count_attempt: bool) -> None:
+        with self._cond:
+            if count_attempt and self._queue:
+                head = self._queue[0]
+                head.attempts += 1
+                if self.max_attempts and head.attempts >= self.max_attempts:
+                    self._queue.popleft()
+                    metrics.MQTT_OUTBOX_DROPPED.inc(reason="attempts")
+                    logger.error("Dropping MQTT message %s to %s after %s attempts", head.seq, head.topic, head.attempts)
+                    if self.spool is not None and not self._inflight:
+                        self.spool.ack(head.seq)
+                    self._set_depth()
+            delay = min(self.retry_max_s, self.retry_base_s * (2 ** self._failures))
+            self._failures += 1
+            self._retry_at = now + delay
+        metrics.MQTT_OUTBOX_RETRIES.inc(reason="publish_failed" if count_attempt else "disconnected")
+
+    def _set_depth(self) -> None:
+        metrics.MQTT_OUTBOX_DEPTH.set(len(self._queue) + len(self._inflight))
@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+from dataclasses import dataclass, field
 from math import atan2, cos, radians, sin, sqrt
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from sqlalchemy.orm import Session, joinedload
 
-from backend import models
+from backend import metrics, models
+from backend.services import energy, order_lifecycle
+
+# Orders per "id IN (...)" lookup when writing statuses back.
+STATUS_CHUNK = 500
 
 
 def haversine_km(coord_a: Tuple[float, float], coord_b: Tuple[float, float]) -> float:
@@ -21,125 +26,203 @@ def haversine_km(coord_a: Tuple[float, float], coord_b: Tuple[float, float]) ->
     return earth_radius_km * c
 
 
-def effective_range_km(base_range_km: float, weight_kg: float, max_payload_kg: float) -> float:
-    """Simple range model that reduces range linearly with payload."""
-    if max_payload_kg <= 0:
-        return 0.0
-    factor = 1 - 0.5 * (weight_kg / max_payload_kg)
-    return max(0.0, base_range_km * factor)
+@dataclass(frozen=True)
+class PointInput:
+    id: int
+    name: str
+    lat: float
+    lon: float
 
 
-def plan_orders_for_county(county_id: int, session: Session) -> Dict[str, object]:
-    """
-    Load pending/planned orders for a county, check range constraints, and compute a visit order.
+@dataclass(frozen=True)
+class DroneInput:
+    id: int
+    base_range_km: float
+    max_payload_kg: float
 
-    Returns:
-        {
-            "station": {"id": ..., "name": ..., "lat": ..., "lon": ...} | None,
-            "planned_orders": [ ... ordered list ... ],
-            "too_far": [order_id, ...],
-        }
+
+@dataclass(frozen=True)
+class OrderInput:
+    order_id: int
+    origin: PointInput
+    destination: PointInput
+    weight_kg: float
+    drone_id: Optional[int]
+
+
+@dataclass(frozen=True)
+class CountyJob:
+    """Everything ``plan_county_job`` needs, as plain picklable data."""
+
+    county_id: int
+    station: Optional[PointInput]
+    default_drone: Optional[DroneInput]
+    drones: Dict[int, DroneInput]
+    orders: Tuple[OrderInput, ...]
+
+
+@dataclass
+class CountyPlan:
+    county_id: int
+    station: Optional[Dict[str, object]]
+    planned_orders: List[Dict[str, object]] = field(default_factory=list)
+    too_far: List[int] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"station": self.station, "planned_orders": self.planned_orders, "too_far": self.too_far}
+
+
+def point_input(location) -> PointInput:
+    return PointInput(location.id, location.name, location.lat, location.lon)
+
+
+def drone_input(drone: Optional[models.Drone]) -> Optional[DroneInput]:
+    if drone is None:
+        return None
+    return DroneInput(drone.id, drone.base_range_km, drone.max_payload_kg)
+
+
+def order_input(order: models.Order) -> OrderInput:
+    return OrderInput(
+        order.id,
+        point_input(order.origin_location),
+        point_input(order.destination_location),
+        order.weight_kg,
+        order.drone_id,
+    )
+
+
+def plan_county_job(job: CountyJob) -> CountyPlan:
+    """Range-check and order one county's deliveries; pure function over plain data.
+
+    Each order is a station -> origin -> destination -> station trip; orders
+    are visited nearest origin first.
     """
+    if job.station is None:
+        return CountyPlan(job.county_id, None)
+
+    station = job.station
+    plan = CountyPlan(
+        job.county_id,
+        {"id": station.id, "name": station.name, "lat": station.lat, "lon": station.lon},
+    )
+    station_coord = (station.lat, station.lon)
+    # The drone returns to base after every delivery, so "nearest to the current
+    # position" is always "nearest to the station"; the sort is stable on ties.
+    ordered = sorted(job.orders, key=lambda order: haversine_km(station_coord, (order.origin.lat, order.origin.lon)))
+
+    for order in ordered:
+        drone = job.drones.get(order.drone_id) if order.drone_id is not None else None
+        drone = drone or job.default_drone
+        origin_coord = (order.origin.lat, order.origin.lon)
+        destination_coord = (order.destination.lat, order.destination.lon)
+        empty_km = haversine_km(station_coord, origin_coord) + haversine_km(destination_coord, station_coord)
+        loaded_km = haversine_km(origin_coord, destination_coord)
+        total_distance = empty_km + loaded_km
+
+        # The payload is only on board from origin to destination.
+        table = energy.model_for(drone) if drone else energy.NO_RANGE
+        max_range = table.range_km(order.weight_kg)
+        if (
+            table.capacity_km <= 0
+            or order.weight_kg > table.max_payload_kg
+            or empty_km + loaded_km * table.factor(order.weight_kg) > table.capacity_km
+        ):
+            plan.too_far.append(order.order_id)
+            continue
+        plan.planned_orders.append(
+            {
+                "order_id": order.order_id,
+                "drone_id": drone.id if drone else None,
+                "origin": {
+                    "id": order.origin.id,
+                    "name": order.origin.name,
+                    "lat": order.origin.lat,
+                    "lon": order.origin.lon,
+                },
+                "destination": {
+                    "id": order.destination.id,
+                    "name": order.destination.name,
+                    "lat": order.destination.lat,
+                    "lon": order.destination.lon,
+                },
+                "total_distance_km": round(total_distance, 2),
+                "max_range_km": round(max_range, 2),
+            }
+        )
+    return plan
+
+
+def county_job(session: Session, county_id: int) -> CountyJob:
+    """Load a county's hub, drones and pending/planned orders into a ``CountyJob``."""
     station = (
         session.query(models.Station)
         .filter(models.Station.county_id == county_id)
         .order_by(models.Station.id)
         .first()
     )
-
     if not station:
-        return {"station": None, "planned_orders": [], "too_far": []}
+        return CountyJob(county_id, None, None, {}, ())
 
-    orders = (
-        session.query(models.Order)
-        .options(
+    # One indexed queue read per status instead of a status IN (...) table scan.
+    orders = [
+        order
+        for status in (order_lifecycle.PENDING, order_lifecycle.PLANNED)
+        for order in order_lifecycle.queue_query(session, county_id, status).options(
             joinedload(models.Order.origin_location),
             joinedload(models.Order.destination_location),
-            joinedload(models.Order.drone).joinedload(models.Drone.station),
+            joinedload(models.Order.drone),
         )
-        .filter(models.Order.county_id == county_id, models.Order.status.in_(["pending", "planned"]))
-        .all()
+    ]
+    default_drone = (
+        session.query(models.Drone)
+        .filter(models.Drone.station_id == station.id)
+        .order_by(models.Drone.id)
+        .first()
+    )
+    drones = {order.drone.id: drone_input(order.drone) for order in orders if order.drone is not None}
+    return CountyJob(
+        county_id,
+        point_input(station),
+        drone_input(default_drone),
+        drones,  # type: ignore[arg-type]
+        tuple(order_input(order) for order in orders),
     )
 
-    if not orders:
-        return {
-            "station": {"id": station.id, "name": station.name, "lat": station.lat, "lon": station.lon},
-            "planned_orders": [],
-            "too_far": [],
-        }
 
-    remaining: List[models.Order] = orders.copy()
-    planned_output: List[Dict[str, object]] = []
-    too_far: List[int] = []
-    station_coord = (station.lat, station.lon)
-    current_coord = station_coord
-
-    while remaining:
-        next_order = min(
-            remaining,
-            key=lambda order: haversine_km(
-                current_coord,
-                (order.origin_location.lat, order.origin_location.lon),
-            ),
-        )
-        remaining.remove(next_order)
-
-        drone = next_order.drone
-        if not drone:
-            drone = (
-                session.query(models.Drone)
-                .filter(models.Drone.station_id == station.id)
-                .order_by(models.Drone.id)
-                .first()
-            )
-
-        total_distance = (
-            haversine_km(station_coord, (next_order.origin_location.lat, next_order.origin_location.lon))
-            + haversine_km(
-                (next_order.origin_location.lat, next_order.origin_location.lon),
-                (next_order.destination_location.lat, next_order.destination_location.lon),
-            )
-            + haversine_km((next_order.destination_location.lat, next_order.destination_location.lon), station_coord)
+def apply_county_plans(session: Session, plans: Iterable[CountyPlan]) -> None:
+    """Write the plans' order statuses back in one transaction."""
+    plans = list(plans)
+    planned_ids = [entry["order_id"] for plan in plans for entry in plan.planned_orders]
+    too_far_ids = [order_id for plan in plans for order_id in plan.too_far]
+    wanted = planned_ids + too_far_ids
+    orders: Dict[int, models.Order] = {}
+    for offset in range(0, len(wanted), STATUS_CHUNK):
+        chunk = wanted[offset : offset + STATUS_CHUNK]
+        orders.update(
+            (order.id, order) for order in session.query(models.Order).filter(models.Order.id.in_(chunk))
         )
 
-        if drone:
-            max_range = effective_range_km(drone.base_range_km, next_order.weight_kg, drone.max_payload_kg)
-        else:
-            max_range = 0.0
-
-        if max_range <= 0 or total_distance > max_range:
-            next_order.status = "too_far"
-            too_far.append(next_order.id)
-        else:
-            next_order.status = "planned"
-            planned_output.append(
-                {
-                    "order_id": next_order.id,
-                    "drone_id": drone.id if drone else None,
-                    "origin": {
-                        "id": next_order.origin_location.id,
-                        "name": next_order.origin_location.name,
-                        "lat": next_order.origin_location.lat,
-                        "lon": next_order.origin_location.lon,
-                    },
-                    "destination": {
-                        "id": next_order.destination_location.id,
-                        "name": next_order.destination_location.name,
-                        "lat": next_order.destination_location.lat,
-                        "lon": next_order.destination_location.lon,
-                    },
-                    "total_distance_km": round(total_distance, 2),
-                    "max_range_km": round(max_range, 2),
-                }
-            )
-
-        session.add(next_order)
-        current_coord = station_coord  # Return to base before the next delivery in this simple model.
-
+    order_lifecycle.transition_many(
+        session, (orders[i] for i in too_far_ids if i in orders), order_lifecycle.FAILED, reason="too_far"
+    )
+    order_lifecycle.transition_many(session, (orders[i] for i in planned_ids if i in orders), order_lifecycle.PLANNED)
     session.commit()
 
-    return {
-        "station": {"id": station.id, "name": station.name, "lat": station.lat, "lon": station.lon},
-        "planned_orders": planned_output,
-        "too_far": too_far,
-    }
+
+@metrics.timed(metrics.PLANNER_SECONDS, planner="county_orders")
+def plan_orders_for_county(county_id: int, session: Session) -> Dict[str, object]:
+    """
+    Load pending/planned orders for a county, check range constraints, and compute a visit order.
+
+    Returns:
+        {
+            "station": {"id": ..., "name": ..., "lat": ..., "lon": ...} | None,
+            "planned_orders": [ ... ordered list ... ],
+            "too_far": [order_id, ...],
+        }
+    """
+    plan = plan_county_job(county_job(session, county_id))
+    if plan.station is not None:
+        apply_county_plans(session, [plan])
+    return plan.as_dict()
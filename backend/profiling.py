@@ -0,0 +1,184 @@
+"""
+Opt-in profiling for a live process.
+
+Two tools, both gated behind ``ADMIN_TOKEN`` (nothing is installed when it is
+unset):
+
+- ``sample_stacks`` samples every thread's stack (including the paho MQTT
+  loop thread) at a fixed interval and returns flamegraph-compatible
+  collapsed stacks (``frame;frame;frame count`` per line).
+- Per-request cProfile capture: requests carrying ``X-Profile: 1`` and a valid
+  ``X-Admin-Token`` are profiled on the event loop and in the threadpool
+  worker that runs a sync endpoint; the pstats report is kept in memory and
+  its id returned in the ``X-Profile-Id`` response header. One profiled
+  request runs at a time and others get 409: cProfile hooks the whole event
+  loop thread, so a second one would replace the first, and the loop profile
+  also counts whatever else the loop runs while the request awaits.
+"""
+from __future__ import annotations
+
+import cProfile
+import hmac
+import inspect
+import io
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_HEADER = "x-profile"
+ADMIN_HEADER = "x-admin-token"
+MAX_SAMPLE_SECONDS = 60.0
+MIN_INTERVAL_S = 0.001
+KEPT_REQUEST_PROFILES = 20
+
+_sampling_lock = threading.Lock()
+_request_profiles: "OrderedDict[str, str]" = OrderedDict()
+_request_profiles_lock = threading.Lock()
+_profile_ids = itertools.count(1)
+_profiled_request_lock = threading.Lock()
+_active_profiles: ContextVar[Optional[List[cProfile.Profile]]] = ContextVar("active_profiles", default=None)
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a sampling profile is already running."""
+
+
+def enabled() -> bool:
+    return bool(ADMIN_TOKEN)
+
+
+def check_admin_token(token: Optional[str]) -> bool:
+    return enabled() and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+# Sampling profiler -----------------------------------------------------------
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{frame.f_lineno})"
+
+
+def sample_stacks(duration_s: float, interval_s: float = 0.005) -> Dict[str, int]:
+    """Sample all thread stacks for ``duration_s`` and return collapsed stack counts."""
+    duration_s = max(0.0, min(float(duration_s), MAX_SAMPLE_SECONDS))
+    interval_s = max(float(interval_s), MIN_INTERVAL_S)
+    if not _sampling_lock.acquire(blocking=False):
+        raise ProfilerBusy("A sampling profile is already running")
+
+    counts: Dict[str, int] = defaultdict(int)
+    own_ident = threading.get_ident()
+    try:
+        deadline = time.perf_counter() + duration_s
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(f"thread:{names.get(ident, ident)}")
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(interval_s)
+    finally:
+        _sampling_lock.release()
+    return dict(counts)
+
+
+def render_collapsed(counts: Dict[str, int]) -> str:
+    """Format stack counts in the collapsed format read by flamegraph.pl/speedscope."""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+# Per-request cProfile --------------------------------------------------------
+def _store_profile(profiles: List[cProfile.Profile]) -> str:
+    stream = io.StringIO()
+    stats = pstats.Stats(profiles[0], stream=stream)
+    for extra in profiles[1:]:
+        stats.add(extra)
+    stats.sort_stats("cumulative").print_stats(60)
+
+    profile_id = str(next(_profile_ids))
+    with _request_profiles_lock:
+        _request_profiles[profile_id] = stream.getvalue()
+        while len(_request_profiles) > KEPT_REQUEST_PROFILES:
+            _request_profiles.popitem(last=False)
+    return profile_id
+
+
+def get_request_profile(profile_id: str) -> Optional[str]:
+    with _request_profiles_lock:
+        return _request_profiles.get(profile_id)
+
+
+def _wrap_sync_endpoint(call: Callable[..., Any]) -> Callable[..., Any]:
+    def profiled_call(*args: Any, **kwargs: Any) -> Any:
+        profiles = _active_profiles.get()
+        if profiles is None:
+            return call(*args, **kwargs)
+        # cProfile only sees the thread that enabled it, so the threadpool
+        # worker running this endpoint gets its own profiler.
+        profile = cProfile.Profile()
+        profiles.append(profile)
+        profile.enable()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            profile.disable()
+
+    return profiled_call
+
+
+def install(app: FastAPI) -> None:
+    """Enable per-request profiling on ``app``; a no-op unless ``ADMIN_TOKEN`` is set.
+
+    Call after all routes are registered (the startup hook does this).
+    """
+    if not enabled() or getattr(app.state, "profiling_installed", False):
+        return
+    app.state.profiling_installed = True
+
+    for route in app.router.routes:
+        if isinstance(route, APIRoute) and not inspect.iscoroutinefunction(route.dependant.call):
+            route.dependant.call = _wrap_sync_endpoint(route.dependant.call)
+
+
+def profile_requested(value: Optional[str]) -> bool:
+    """Whether an ``X-Profile`` header value asks for profiling; ``0``/``false`` do not."""
+    return value is not None and value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+async def profile_request_middleware(request: Request, call_next):
+    if not profile_requested(request.headers.get(PROFILE_HEADER)) or not check_admin_token(
+        request.headers.get(ADMIN_HEADER)
+    ):
+        return await call_next(request)
+    if not _profiled_request_lock.acquire(blocking=False):
+        return JSONResponse({"detail": "A profiled request is already running"}, status_code=409)
+
+    try:
+        loop_profile = cProfile.Profile()
+        profiles = [loop_profile]
+        token = _active_profiles.set(profiles)
+        loop_profile.enable()
+        try:
+            response = await call_next(request)
+        finally:
+            loop_profile.disable()
+            _active_profiles.reset(token)
+        response.headers["X-Profile-Id"] = _store_profile(profiles)
+        return response
+    finally:
+        _profiled_request_lock.release()
@@ -0,0 +1,315 @@
+"""
+Background dispatcher: turns each county's pending orders into published routes.
+
+Pending orders are batched per county until either window closes:
+
+- size window: ``max_batch`` orders are waiting;
+- time window: the oldest waiting order is ``max_wait_s`` old.
+
+A short window gives low latency, a long one lets more stops share a route.
+The batch is planned as one pickup-and-delivery sortie (``pdp_planner``),
+published with ``route_planner.publish_route_mqtt`` and the orders move
+``pending -> planned -> assigned``. Orders the drone cannot reach are failed
+instead of being retried forever. If a publish fails the orders stay
+``planned``; planned orders are queued ahead of pending ones, so the next
+poll plans and publishes them again.
+
+Each batch goes to the hub drone that is free first. Routes are packed onto
+that drone's timeline with ``scheduling.schedule_routes``: a route starts
+when the batch is released or when the drone has finished its previous route
+(plus ``DISPATCH_TURNAROUND_S``), whichever is later.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload, sessionmaker
+
+from backend import metrics, models
+from backend.services import order_lifecycle, pdp_planner, route_history, route_planner, scheduling
+
+logger = logging.getLogger("backend.dispatcher")
+
+DISPATCHER_ENABLED = os.getenv("DISPATCHER_ENABLED", "0").lower() in {"1", "true", "yes", "on"}
+DISPATCH_TURNAROUND_S = float(os.getenv("DISPATCH_TURNAROUND_S", "0"))
+# Planned orders were released once but never published; they go first.
+QUEUE_STATUSES = (order_lifecycle.PLANNED, order_lifecycle.PENDING)
+
+
+@dataclass(frozen=True)
+class DispatchWindow:
+    """When a county's pending orders are released as a batch."""
+
+    max_wait_s: float = 30.0
+    max_batch: int = 8
+    poll_interval_s: float = 2.0
+
+    @classmethod
+    def from_env(cls) -> "DispatchWindow":
+        return cls(
+            max_wait_s=float(os.getenv("DISPATCH_MAX_WAIT_S", cls.max_wait_s)),
+            max_batch=max(1, int(os.getenv("DISPATCH_MAX_BATCH", cls.max_batch))),
+            poll_interval_s=float(os.getenv("DISPATCH_POLL_S", cls.poll_interval_s)),
+        )
+
+
+@dataclass
+class DispatchResult:
+    """Outcome of dispatching one county batch."""
+
+    county_id: int
+    trigger: str
+    assigned: List[int] = field(default_factory=list)
+    failed: List[int] = field(default_factory=list)
+    unpublished: List[int] = field(default_factory=list)
+    route: List[str] = field(default_factory=list)
+    drone_id: Optional[int] = None
+    start: Optional[datetime] = None
+
+
+def batch_trigger(depth: int, oldest: Optional[datetime], now: datetime, window: DispatchWindow) -> Optional[str]:
+    """``"size"`` or ``"time"`` if a county's queue should be released now, else ``None``."""
+    if depth <= 0:
+        return None
+    if depth >= window.max_batch:
+        return "size"
+    if oldest is not None and (now - oldest).total_seconds() >= window.max_wait_s:
+        return "time"
+    return None
+
+
+def _pending_queues(session: Session) -> List[tuple]:
+    """``(county_id, depth, oldest created_at)`` for every county with queued orders."""
+    queues: Dict[int, list] = {}
+    # One indexed read per status instead of a status IN (...) table scan.
+    for status in QUEUE_STATUSES:
+        for county_id, depth, oldest in (
+            session.query(models.Order.county_id, func.count(models.Order.id), func.min(models.Order.created_at))
+            .filter(models.Order.status == status)
+            .group_by(models.Order.county_id)
+        ):
+            queue = queues.setdefault(county_id, [county_id, 0, oldest])
+            queue[1] += depth
+            queue[2] = min(queue[2], oldest)
+    return [tuple(queue) for queue in queues.values()]
+
+
+def _take_batch(orders: List[models.Order], max_payload_kg: float) -> tuple:
+    """Split FIFO orders into (batch, orders heavier than the drone can ever lift)."""
+    batch: List[models.Order] = []
+    overweight: List[models.Order] = []
+    for order in orders:
+        if max_payload_kg > 0 and order.weight_kg > max_payload_kg:
+            overweight.append(order)
+        else:
+            batch.append(order)
+    return batch, overweight
+
+
+class Dispatcher:
+    """Polls the pending queues and dispatches ready batches on a background thread."""
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        get_client: Callable[[], Any],
+        topic: str,
+        window: Optional[DispatchWindow] = None,
+        recharge_model: Optional[scheduling.RechargeModel] = None,
+        station_schedule: Optional[scheduling.StationSchedule] = None,
+        turnaround_s: float = DISPATCH_TURNAROUND_S,
+    ) -> None:
+        self.session_factory = session_factory
+        self.get_client = get_client
+        self.topic = topic
+        self.window = window or DispatchWindow.from_env()
+        self.recharge_model = recharge_model or scheduling.RechargeModel.from_env()
+        self.station_schedule = station_schedule or scheduling.default_station_schedule()
+        self.turnaround_s = turnaround_s
+        # drone id -> when it is back from its last dispatched route
+        self.drone_available_at: Dict[int, datetime] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # Loop ------------------------------------------------------------------
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="order-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info(
+            "Dispatcher started (max_wait_s=%s, max_batch=%s)", self.window.max_wait_s, self.window.max_batch
+        )
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        self._stop.set()
+        thread = self._thread
+        self._thread = None
+        if thread is not None:
+            thread.join(timeout)
+            logger.info("Dispatcher stopped.")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:  # pragma: no cover - keep the loop alive
+                logger.exception("Dispatcher iteration failed")
+            self._stop.wait(self.window.poll_interval_s)
+
+    # One pass ----------------------------------------------------------------
+    def run_once(self, now: Optional[datetime] = None) -> List[DispatchResult]:
+        """Dispatch every county whose batching window has closed."""
+        now = now or datetime.utcnow()
+        client = self.get_client()
+        if client is None:
+            logger.debug("MQTT client not available; dispatch postponed.")
+            return []
+
+        results: List[DispatchResult] = []
+        with self.session_factory() as session:
+            for county_id, depth, oldest in _pending_queues(session):
+                trigger = batch_trigger(depth, oldest, now, self.window)
+                if trigger is None:
+                    continue
+                result = self.dispatch_county(session, client, county_id, trigger, now)
+                if result is not None:
+                    results.append(result)
+        return results
+
+    def dispatch_county(
+        self,
+        session: Session,
+        client: Any,
+        county_id: int,
+        trigger: str,
+        now: datetime,
+    ) -> Optional[DispatchResult]:
+        """Plan, publish and assign one batch of a county's pending orders."""
+        station = (
+            session.query(models.Station)
+            .filter(models.Station.county_id == county_id)
+            .order_by(models.Station.id)
+            .first()
+        )
+        drone = None
+        if station is not None:
+            drones = session.query(models.Drone).filter(models.Drone.station_id == station.id).order_by(models.Drone.id)
+            drone = min(drones, key=lambda item: max(now, self.drone_available_at.get(item.id, now)), default=None)
+        if station is None or drone is None:
+            logger.warning("County %s has no hub or drone; pending orders stay queued.", county_id)
+            return None
+
+        queued: List[models.Order] = []
+        for status in QUEUE_STATUSES:
+            queued.extend(
+                order_lifecycle.queue_query(session, county_id, status)
+                .options(joinedload(models.Order.origin_location), joinedload(models.Order.destination_location))
+                .limit(self.window.max_batch - len(queued))
+            )
+            if len(queued) >= self.window.max_batch:
+                break
+        batch, overweight = _take_batch(queued, drone.max_payload_kg)
+        start = max(now, self.drone_available_at.get(drone.id, now))
+        result = DispatchResult(county_id=county_id, trigger=trigger, drone_id=drone.id, start=start)
+        result.failed.extend(order_lifecycle.transition_many(session, overweight, order_lifecycle.FAILED, reason="overweight"))
+
+        if batch:
+            plan = pdp_planner.plan_pdp_route(
+                pdp_planner.pdp_orders(batch),
+                station,
+                drone,
+                start_time=start,
+                recharge_model=self.recharge_model,
+                station_schedule=self.station_schedule,
+            )
+            steps = plan.steps
+            served_ids = set(plan.served)
+            stranded_ids = set(plan.stranded)
+            served = [order for order in batch if order.id in served_ids]
+            stranded = [order for order in batch if order.id in stranded_ids]
+            unreachable = [order for order in batch if order.id not in served_ids and order.id not in stranded_ids]
+            result.failed.extend(
+                order_lifecycle.transition_many(session, unreachable, order_lifecycle.FAILED, reason="too_far")
+            )
+            result.failed.extend(
+                order_lifecycle.transition_many(session, stranded, order_lifecycle.FAILED, reason="stranded")
+            )
+            if served:
+                order_lifecycle.transition_many(session, served, order_lifecycle.PLANNED)
+                for order in served:
+                    order.drone_id = drone.id
+                if route_planner.publish_route_mqtt(client, steps, self.topic):
+                    route_history.record_route(
+                        session, "dispatcher", steps, station, drone, route_history.order_rows(served), started_at=start
+                    )
+                    self._book_drone(drone.id, county_id, steps, now)
+                    result.route = [str(step["next"]) for step in steps]
+                    result.assigned.extend(order_lifecycle.transition_many(session, served, order_lifecycle.ASSIGNED))
+                else:
+                    result.unpublished = [order.id for order in served]
+                    # The route never flew; free its pads for the next plan.
+                    for station_id, slot, duration_s in plan.reservations:
+                        self.station_schedule.release(station_id, slot, duration_s)
+                    logger.warning(
+                        "Route for county %s was not published; orders %s stay planned.", county_id, result.unpublished
+                    )
+
+        session.commit()
+        metrics.DISPATCH_BATCHES.inc(trigger=trigger)
+        metrics.DISPATCHED_ORDERS.inc(len(result.assigned), outcome="assigned")
+        metrics.DISPATCHED_ORDERS.inc(len(result.failed), outcome="failed")
+        logger.info(
+            "Dispatched county %s (%s window): assigned=%s failed=%s",
+            county_id,
+            trigger,
+            result.assigned,
+            result.failed,
+        )
+        return result
+
+    def _book_drone(self, drone_id: int, county_id: int, steps: List[Dict[str, Any]], ready_at: datetime) -> None:
+        """Put a published route on the drone's timeline."""
+        job = scheduling.RouteJob(
+            route_id=f"{county_id}@{ready_at.isoformat(timespec='seconds')}",
+            drone_id=drone_id,
+            duration_s=scheduling.route_duration_s(steps),
+            ready_at=ready_at,
+            turnaround_s=self.turnaround_s,
+        )
+        self.drone_available_at = scheduling.schedule_routes([job], self.drone_available_at).drone_available_at
+
+
+_dispatcher: Optional[Dispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def start(
+    session_factory: sessionmaker,
+    get_client: Callable[[], Any],
+    topic: str,
+    window: Optional[DispatchWindow] = None,
+) -> Dispatcher:
+    """Start the process-wide dispatcher (idempotent)."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher(session_factory, get_client, topic, window=window)
+            _dispatcher.start()
+        return _dispatcher
+
+
+def stop() -> None:
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.stop()
+
@@ -0,0 +1,303 @@
+"""
+Drone energy model shared by every planner.
+
+Battery use per kilometre grows linearly with payload::
+
+    pct_per_km(payload_kg) = a + b * payload_kg        (percent of a full charge)
+
+Without calibration ``a`` and ``b`` come from the drone's spec: an empty drone
+flies ``base_range_km`` on a full charge, and a full payload costs
+``FULL_PAYLOAD_EXTRA`` more per km (the in-flight consumption the planners
+used before). ``calibrate`` fits both coefficients per drone from recorded
+step telemetry (``battery_pct`` against ``distance_km`` and ``payload_kg``);
+``ENERGY_CALIBRATION_PATH`` points at the resulting JSON.
+
+Planners count battery in *empty-drone kilometres*: a full charge is
+``capacity_km`` of them, and a leg flown with payload ``p`` costs
+``distance_km * factor(p)``. ``EnergyTable`` precomputes ``factor`` for
+``PAYLOAD_BUCKETS`` payload buckets per drone, rounding the payload up to the
+next bucket so lookups are never optimistic; ``model_for`` caches one table
+per drone.
+
+Run ``python -m backend.services.energy telemetry.jsonl -o calibration.json``
+to calibrate from a file of step messages as published on ``MQTT_TOPIC``.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+import os
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Tuple
+
+logger = logging.getLogger("backend.energy")
+
+ENERGY_CALIBRATION_PATH = os.getenv("ENERGY_CALIBRATION_PATH", "")
+PAYLOAD_BUCKETS = int(os.getenv("ENERGY_PAYLOAD_BUCKETS", "32"))
+MIN_CALIBRATION_SAMPLES = int(os.getenv("ENERGY_MIN_SAMPLES", "20"))
+FULL_PAYLOAD_EXTRA = 0.3
+
+
+class EnergyModel(Protocol):
+    def pct_per_km(self, payload_kg: float) -> float:
+        """Percent of a full charge used per kilometre with ``payload_kg`` on board."""
+        ...
+
+
+@dataclass(frozen=True)
+class LinearEnergyModel:
+    a: float  # % per km, empty
+    b: float = 0.0  # extra % per km per kg of payload
+
+    def pct_per_km(self, payload_kg: float) -> float:
+        return self.a + self.b * max(payload_kg, 0.0)
+
+    @classmethod
+    def from_spec(cls, base_range_km: float, max_payload_kg: float) -> "LinearEnergyModel":
+        a = 100.0 / base_range_km
+        b = a * FULL_PAYLOAD_EXTRA / max_payload_kg
+        return cls(a, b)
+
+
+class EnergyTable:
+    """``model`` precomputed into payload buckets for one drone."""
+
+    __slots__ = ("model", "max_payload_kg", "capacity_km", "_step", "_factors")
+
+    def __init__(self, model: EnergyModel, max_payload_kg: float, buckets: int = PAYLOAD_BUCKETS) -> None:
+        self.model = model
+        self.max_payload_kg = max_payload_kg
+        empty = model.pct_per_km(0.0)
+        self.capacity_km = 100.0 / empty
+        self._step = max_payload_kg / buckets
+        self._factors = [model.pct_per_km(i * self._step) / empty for i in range(buckets + 1)]
+
+    def factor(self, payload_kg: float) -> float:
+        """Battery cost of one km with ``payload_kg``, in empty-drone km (rounded up to the bucket)."""
+        if payload_kg <= 0.0:
+            return 1.0
+        index = math.ceil(payload_kg / self._step - 1e-9)
+        if index < len(self._factors):
+            return self._factors[index]
+        # Overloaded: outside the table, use the model itself.
+        return self.model.pct_per_km(payload_kg) / self.model.pct_per_km(0.0)
+
+    def range_km(self, payload_kg: float) -> float:
+        """Distance a full charge covers with ``payload_kg`` on board the whole way."""
+        return self.capacity_km / self.factor(payload_kg)
+
+
+class _NoRange(EnergyTable):
+    """Drones without a usable spec (no range or no payload capacity) cannot fly anything."""
+
+    def __init__(self) -> None:
+        self.model = LinearEnergyModel(math.inf)
+        self.max_payload_kg = 0.0
+        self.capacity_km = 0.0
+
+    def factor(self, payload_kg: float) -> float:
+        return 1.0
+
+    def range_km(self, payload_kg: float) -> float:
+        return 0.0
+
+
+NO_RANGE = _NoRange()
+
+_calibration_lock = threading.Lock()
+_calibration: Optional[Dict[int, LinearEnergyModel]] = None
+
+
+def calibration() -> Dict[int, LinearEnergyModel]:
+    """Per-drone calibrated models from ``ENERGY_CALIBRATION_PATH`` (loaded once)."""
+    global _calibration
+    with _calibration_lock:
+        if _calibration is None:
+            _calibration = load_calibration(ENERGY_CALIBRATION_PATH) if ENERGY_CALIBRATION_PATH else {}
+        return _calibration
+
+
+def set_calibration(models: Optional[Dict[int, LinearEnergyModel]]) -> None:
+    """Replace the calibration (``None``: reload from the file on next use) and drop cached tables."""
+    global _calibration
+    with _calibration_lock:
+        _calibration = models
+    _table.cache_clear()
+
+
+@lru_cache(maxsize=4096)
+def _table(drone_id: Optional[int], base_range_km: float, max_payload_kg: float) -> EnergyTable:
+    if base_range_km <= 0 or max_payload_kg <= 0:
+        return NO_RANGE
+    model = calibration().get(drone_id) if drone_id is not None else None
+    return EnergyTable(model or LinearEnergyModel.from_spec(base_range_km, max_payload_kg), max_payload_kg)
+
+
+def model_for(drone: Any) -> EnergyTable:
+    """The energy table for a drone (ORM ``Drone``, ``DroneSpec`` or ``DroneInput``).
+
+    A calibration applies to the drone id whatever range and payload are passed,
+    so a spec that differs from the stored drone must carry ``id=None``.
+    """
+    return _table(getattr(drone, "id", None), float(drone.base_range_km), float(drone.max_payload_kg))
+
+
+# Calibration ----------------------------------------------------------------------
+@dataclass(frozen=True)
+class Sample:
+    distance_km: float
+    payload_kg: float
+    used_pct: float
+
+
+def samples_from_steps(steps: Iterable[Dict[str, Any]]) -> Dict[int, List[Sample]]:
+    """Battery used per leg, per drone, from consecutive step messages.
+
+    A leg's use is the drop in ``battery_pct`` from the drone's previous step;
+    a recharge (``recharge_s``) resets the battery to 100 %, and a route
+    summary or a rise in battery starts over without a sample.
+    """
+    samples: Dict[int, List[Sample]] = {}
+    previous: Dict[int, Optional[float]] = {}
+    for step in steps:
+        if "route" in step:
+            previous.clear()
+            continue
+        drone_id = step.get("drone_id")
+        battery = step.get("battery_pct")
+        distance = step.get("distance_km")
+        if drone_id is None or not isinstance(battery, (int, float)) or not isinstance(distance, (int, float)):
+            continue
+        before = previous.get(drone_id)
+        if before is not None and distance > 0 and battery <= before:
+            samples.setdefault(drone_id, []).append(
+                Sample(float(distance), float(step.get("payload_kg") or 0.0), before - float(battery))
+            )
+        previous[drone_id] = 100.0 if step.get("recharge_s") is not None else float(battery)
+    return samples
+
+
+def fit_linear(samples: Sequence[Sample], fallback_b: Optional[float] = None) -> Optional[Tuple[LinearEnergyModel, float]]:
+    """Least-squares fit of ``used = d * (a + b * p)``; returns the model and its RMSE in percent.
+
+    When every sample has the same payload ``b`` cannot be separated from
+    ``a``; ``fallback_b`` (e.g. the spec's) is kept and only ``a`` is fitted.
+    """
+    if len(samples) < MIN_CALIBRATION_SAMPLES:
+        return None
+    s11 = s12 = s22 = t1 = t2 = 0.0
+    for sample in samples:
+        x1 = sample.distance_km
+        x2 = sample.distance_km * sample.payload_kg
+        s11 += x1 * x1
+        s12 += x1 * x2
+        s22 += x2 * x2
+        t1 += x1 * sample.used_pct
+        t2 += x2 * sample.used_pct
+    det = s11 * s22 - s12 * s12
+    if det > 1e-9 * s11 * s22:
+        a = (t1 * s22 - t2 * s12) / det
+        b = (s11 * t2 - s12 * t1) / det
+    else:
+        b = fallback_b or 0.0
+        a = (t1 - b * s12) / s11
+    if a <= 0:
+        return None
+    model = LinearEnergyModel(a, max(b, 0.0))
+    error = sum((s.used_pct - s.distance_km * model.pct_per_km(s.payload_kg)) ** 2 for s in samples)
+    return model, math.sqrt(error / len(samples))
+
+
+def _spec_b(step: Dict[str, Any]) -> Optional[float]:
+    """The spec model's ``b`` for the drone that published ``step``, if the step names its spec."""
+    base_range_km = step.get("base_range_km")
+    max_payload_kg = step.get("max_payload_kg")
+    if not isinstance(base_range_km, (int, float)) or not isinstance(max_payload_kg, (int, float)):
+        return None
+    if base_range_km <= 0 or max_payload_kg <= 0:
+        return None
+    return LinearEnergyModel.from_spec(float(base_range_km), float(max_payload_kg)).b
+
+
+def _collect_spec_b(steps: Iterable[Dict[str, Any]], spec_b: Dict[int, float]) -> Iterator[Dict[str, Any]]:
+    for step in steps:
+        drone_id = step.get("drone_id")
+        if drone_id is not None:
+            b = _spec_b(step)
+            if b is not None:
+                spec_b[drone_id] = b
+        yield step
+
+
+def calibrate(steps: Iterable[Dict[str, Any]]) -> Dict[int, Dict[str, float]]:
+    """Fit every drone with enough samples; returns the JSON-ready calibration.
+
+    A drone whose samples all carry the same payload keeps its spec ``b``
+    (from the ``base_range_km``/``max_payload_kg`` its steps report).
+    """
+    spec_b: Dict[int, float] = {}
+    result: Dict[int, Dict[str, float]] = {}
+    for drone_id, samples in sorted(samples_from_steps(_collect_spec_b(steps, spec_b)).items()):
+        fitted = fit_linear(samples, fallback_b=spec_b.get(drone_id))
+        if fitted is None:
+            logger.info("Drone %s: %d samples, not calibrated", drone_id, len(samples))
+            continue
+        model, rmse = fitted
+        result[drone_id] = {"a": model.a, "b": model.b, "samples": len(samples), "rmse_pct": round(rmse, 4)}
+    return result
+
+
+def load_calibration(path: str) -> Dict[int, LinearEnergyModel]:
+    """Calibrated models by drone id; unreadable files and malformed entries fall back to the spec model."""
+    try:
+        raw = json.loads(Path(path).read_text(encoding="utf-8"))
+        drones = raw.get("drones", {})
+        entries = drones.items()
+    except (OSError, ValueError, AttributeError) as exc:
+        logger.warning("Ignoring energy calibration %s: %s", path, exc)
+        return {}
+    models: Dict[int, LinearEnergyModel] = {}
+    for drone_id, entry in entries:
+        try:
+            models[int(drone_id)] = LinearEnergyModel(float(entry["a"]), float(entry["b"]))
+        except (KeyError, TypeError, ValueError) as exc:
+            logger.warning("Ignoring energy calibration %s for drone %r: %r", path, drone_id, exc)
+    return models
+
+
+def _read_steps(path: Path) -> Iterable[Dict[str, Any]]:
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                payload = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(payload, dict):
+                yield payload
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibrate per-drone energy models from recorded step telemetry.")
+    parser.add_argument("telemetry", type=Path, help="JSONL file of step messages (one JSON object per line).")
+    parser.add_argument("-o", "--output", type=Path, help="Write the calibration JSON here (ENERGY_CALIBRATION_PATH).")
+    args = parser.parse_args(argv)
+
+    drones = calibrate(_read_steps(args.telemetry))
+    text = json.dumps({"drones": {str(drone_id): entry for drone_id, entry in drones.items()}}, indent=2)
+    print(text)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text, encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,414 @@
+"""
+Battery-feasibility kernels for the planner's inner loop.
+
+Each planning step asks: which remaining stop is nearest to the drone among
+those it can reach and still fly home from (``dist_to_next + dist_back <=
+budget``)? After a recharge it asks whether any stop is reachable from the hub
+at all. A kernel answers both over the remaining stops:
+
+- ``PythonKernel``: the reference loop, no dependencies.
+- ``NumpyKernel``: vectorised haversine over masked arrays (needs NumPy).
+- ``NumbaKernel``: the same with a JIT-compiled distance loop, picked
+  automatically when Numba is installed.
+- ``GridKernel``: ring search over a ``spatial.GridIndex`` of the remaining
+  stops, so a step reads the stops near the drone instead of all of them;
+  picked automatically from ``GRID_MIN_STOPS`` stops up.
+- ``MatrixKernel``: reads rows of a ``DistanceMatrix`` shared by several
+  plans over the same points (what-if batches); each row is computed once
+  with the exact haversine, so it needs no border re-check either.
+
+Vectorised trigonometry can differ from ``math`` in the last bits, so the
+array kernels only use their distances to narrow the search: stops within
+``BORDER_KM`` of the budget or of the best distance are re-checked with the
+exact ``planner_core.haversine_km``. Results are therefore identical to the
+Python loop, and the returned distance is always the exact one.
+
+``FEASIBILITY_KERNEL`` (``auto``/``python``/``numpy``/``numba``/``grid``)
+forces a kernel; ``auto`` uses the array kernels from ``VECTOR_MIN_STOPS``
+stops up and the grid from ``GRID_MIN_STOPS``.
+"""
+from __future__ import annotations
+
+import importlib.util
+import logging
+import math
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# NumPy and Numba are optional and slow to import (Numba alone takes ~0.3 s), so
+# they are only imported when an array kernel is first built.
+HAVE_NUMPY = importlib.util.find_spec("numpy") is not None
+HAVE_NUMBA = HAVE_NUMPY and importlib.util.find_spec("numba") is not None
+np: Any = None
+_numba_distances: Any = None
+
+logger = logging.getLogger("backend.feasibility")
+
+Coord = Tuple[float, float]
+HaversineFn = Callable[[Coord, Coord], float]
+
+EARTH_RADIUS_KM = 6371.0
+# Far above the float error of a haversine distance (~1e-12 km), far below any real distance.
+BORDER_KM = 1e-6
+VECTOR_MIN_STOPS = 64
+GRID_MIN_STOPS = int(os.getenv("FEASIBILITY_GRID_MIN_STOPS", "1000"))
+# Grid cells are sized for about this many stops each.
+GRID_STOPS_PER_CELL = 2.0
+KERNEL = os.getenv("FEASIBILITY_KERNEL", "auto").lower()
+
+
+class PythonKernel:
+    """Reference implementation: a plain loop over the remaining stops."""
+
+    name = "python"
+
+    def __init__(self, coords: Sequence[Coord], out_km: Sequence[float], back_km: Sequence[float], ids: Sequence[int], haversine: HaversineFn) -> None:
+        self.coords = list(coords)
+        self.out_km = list(out_km)
+        self.back_km = list(back_km)
+        self.ids = list(ids)
+        self.haversine = haversine
+        self.alive: List[int] = list(range(len(self.coords)))
+
+    def __len__(self) -> int:
+        return len(self.alive)
+
+    def nearest_feasible(self, current: Coord, budget_km: float) -> Tuple[int, float]:
+        """Index and exact distance of the nearest feasible stop, or ``(-1, 0.0)``."""
+        best = -1
+        best_km = 0.0
+        for index in self.alive:
+            dist = self.haversine(current, self.coords[index])
+            if dist + self.back_km[index] <= budget_km and (best < 0 or dist < best_km):
+                best, best_km = index, dist
+        return best, best_km
+
+    def any_round_trip_within(self, limit_km: float) -> bool:
+        """Whether any remaining stop is a hub round trip of at most ``limit_km``."""
+        return any(self.out_km[index] + self.back_km[index] <= limit_km for index in self.alive)
+
+    def remove(self, index: int) -> None:
+        """Drop the stop at ``index`` and any other stop sharing its id."""
+        stop_id = self.ids[index]
+        self.alive = [i for i in self.alive if self.ids[i] != stop_id]
+
+
+def _load_numpy() -> Any:
+    global np
+    if np is None:
+        import numpy
+
+        np = numpy
+    return np
+
+
+class NumpyKernel(PythonKernel):
+    """Masked-array kernel; exact on the borderline via the Python haversine."""
+
+    name = "numpy"
+
+    def __init__(self, coords: Sequence[Coord], out_km: Sequence[float], back_km: Sequence[float], ids: Sequence[int], haversine: HaversineFn) -> None:
+        super().__init__(coords, out_km, back_km, ids, haversine)
+        _load_numpy()
+        lat = np.radians(np.array([c[0] for c in self.coords], dtype=np.float64))
+        lon = np.radians(np.array([c[1] for c in self.coords], dtype=np.float64))
+        self.lat_r = lat
+        self.lon_r = lon
+        self.cos_lat = np.cos(lat)
+        self.out_arr = np.array(self.out_km, dtype=np.float64)
+        self.back_arr = np.array(self.back_km, dtype=np.float64)
+        self.ids_arr = np.array(self.ids, dtype=np.int64)
+        self.mask = np.ones(len(self.coords), dtype=bool)
+        self.count = len(self.coords)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _approx_km(self, current: Coord) -> "np.ndarray":
+        lat1 = np.radians(current[0])
+        lon1 = np.radians(current[1])
+        a = np.sin((self.lat_r - lat1) / 2) ** 2 + np.cos(lat1) * self.cos_lat * np.sin((self.lon_r - lon1) / 2) ** 2
+        np.clip(a, 0.0, 1.0, out=a)
+        return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    def nearest_feasible(self, current: Coord, budget_km: float) -> Tuple[int, float]:
+        if not self.count:
+            return -1, 0.0
+        approx = self._approx_km(current)
+        total = approx + self.back_arr
+        maybe = self.mask & (total <= budget_km + BORDER_KM)
+        if not maybe.any():
+            return -1, 0.0
+
+        # Exact distances for the stops whose feasibility the approximation can't settle.
+        exact = {}
+        for index in np.flatnonzero(maybe & (total > budget_km - BORDER_KM)).tolist():
+            dist = self.haversine(current, self.coords[index])
+            exact[index] = dist
+            if dist + self.back_km[index] > budget_km:
+                maybe[index] = False
+        if not maybe.any():
+            return -1, 0.0
+
+        candidates = np.flatnonzero(maybe)
+        nearest = approx[candidates].min()
+        best = -1
+        best_km = 0.0
+        # Everything that might tie with the minimum is compared exactly, in index order.
+        for index in candidates[approx[candidates] <= nearest + BORDER_KM].tolist():
+            dist = exact.get(index)
+            if dist is None:
+                dist = self.haversine(current, self.coords[index])
+            if best < 0 or dist < best_km:
+                best, best_km = index, dist
+        return best, best_km
+
+    def any_round_trip_within(self, limit_km: float) -> bool:
+        # Sums of the exact precomputed distances: float addition matches Python's.
+        return bool((self.mask & (self.out_arr + self.back_arr <= limit_km)).any())
+
+    def remove(self, index: int) -> None:
+        self.mask &= self.ids_arr != self.ids_arr[index]
+        self.count = int(self.mask.sum())
+
+
+def _load_numba_distances() -> Callable[..., Any]:
+    global _numba_distances
+    if _numba_distances is None:
+        import numba
+
+        _load_numpy()
+
+        @numba.njit(cache=True, fastmath=False)
+        def distances(lat_r, lon_r, cos_lat, lat1, lon1):  # pragma: no cover - compiled
+            n = lat_r.shape[0]
+            out = np.empty(n, dtype=np.float64)
+            cos1 = np.cos(lat1)
+            for i in range(n):
+                s_lat = np.sin((lat_r[i] - lat1) / 2)
+                s_lon = np.sin((lon_r[i] - lon1) / 2)
+                a = s_lat * s_lat + cos1 * cos_lat[i] * s_lon * s_lon
+                a = min(max(a, 0.0), 1.0)
+                out[i] = EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+            return out
+
+        _numba_distances = distances
+    return _numba_distances
+
+
+class NumbaKernel(NumpyKernel):
+    """``NumpyKernel`` with the distance pass compiled by Numba."""
+
+    name = "numba"
+
+    def __init__(self, coords: Sequence[Coord], out_km: Sequence[float], back_km: Sequence[float], ids: Sequence[int], haversine: HaversineFn) -> None:
+        super().__init__(coords, out_km, back_km, ids, haversine)
+        self._distances = _load_numba_distances()
+
+    def _approx_km(self, current: Coord) -> "np.ndarray":
+        return self._distances(self.lat_r, self.lon_r, self.cos_lat, np.radians(current[0]), np.radians(current[1]))
+
+
+class GridKernel(PythonKernel):
+    """Nearest feasible stop by ring search over a grid of the remaining stops.
+
+    ``spatial.GridIndex`` returns exactly the linear scan's answer (nearest by
+    exact distance, lowest index on ties), and the grid only grows outward
+    until no unread stop can beat the best one or fit the budget. Round trips
+    from the hub are kept in a heap, so the post-recharge check is cheap too.
+    """
+
+    name = "grid"
+
+    def __init__(self, coords: Sequence[Coord], out_km: Sequence[float], back_km: Sequence[float], ids: Sequence[int], haversine: HaversineFn) -> None:
+        super().__init__(coords, out_km, back_km, ids, haversine)
+        from backend.services import spatial
+
+        self.alive = []  # tracked by the grid instead
+        self.grid = spatial.GridIndex(_grid_cell_km(self.coords))
+        self.by_id: Dict[int, List[int]] = {}
+        for index, (lat, lon) in enumerate(self.coords):
+            self.grid.insert(index, lat, lon)
+            self.by_id.setdefault(self.ids[index], []).append(index)
+        self.round_trips = sorted((out + back, index) for index, (out, back) in enumerate(zip(self.out_km, self.back_km)))
+        self.round_trips.reverse()  # cheapest last, popped as stops go
+
+    def __len__(self) -> int:
+        return len(self.grid)
+
+    def nearest_feasible(self, current: Coord, budget_km: float) -> Tuple[int, float]:
+        back_km = self.back_km
+        found = self.grid.nearest(
+            current[0], current[1], max_km=budget_km, where=lambda index, dist: dist + back_km[index] <= budget_km
+        )
+        if not found:
+            return -1, 0.0
+        dist, index = found[0]
+        return index, dist  # type: ignore[return-value]
+
+    def any_round_trip_within(self, limit_km: float) -> bool:
+        trips = self.round_trips
+        while trips and trips[-1][1] not in self.grid:
+            trips.pop()
+        return bool(trips) and trips[-1][0] <= limit_km
+
+    def remove(self, index: int) -> None:
+        for other in self.by_id.pop(self.ids[index], ()):
+            self.grid.remove(other)
+
+
+def _grid_cell_km(coords: Sequence[Coord]) -> float:
+    """Cell size giving about ``GRID_STOPS_PER_CELL`` stops per cell over the stops' bounding box."""
+    lats = [lat for lat, _ in coords]
+    lons = [lon for _, lon in coords]
+    mid_lat = math.radians((min(lats) + max(lats)) / 2)
+    height = (max(lats) - min(lats)) * 111.2
+    width = (max(lons) - min(lons)) * 111.2 * math.cos(mid_lat)
+    area = max(height, 0.1) * max(width, 0.1)
+    return max(0.05, math.sqrt(area * GRID_STOPS_PER_CELL / len(coords)))
+
+
+class DistanceMatrix:
+    """Exact distances between a fixed set of points, one row per origin computed on first use.
+
+    Rows hold exactly ``planner_core.haversine_km`` values: the same
+    operations in the same order, with each point's radians and cosine
+    computed once. Shared by every plan over (a subset of) the same points;
+    concurrent readers at worst compute a row twice.
+    """
+
+    def __init__(self, coords: Sequence[Coord]) -> None:
+        self.coords: List[Coord] = list(dict.fromkeys(coords))
+        self.index: Dict[Coord, int] = {coord: i for i, coord in enumerate(self.coords)}
+        self._lat_r = [math.radians(lat) for lat, _ in self.coords]
+        self._lon_r = [math.radians(lon) for _, lon in self.coords]
+        self._cos_lat = [math.cos(lat) for lat in self._lat_r]
+        self._rows: Dict[int, List[float]] = {}
+        self._arrays: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def row(self, origin: Coord) -> List[float]:
+        i = self.index[origin]
+        row = self._rows.get(i)
+        if row is None:
+            lat1, lon1, cos1 = self._lat_r[i], self._lon_r[i], self._cos_lat[i]
+            sin, atan2, sqrt = math.sin, math.atan2, math.sqrt
+            row = []
+            for lat2, lon2, cos2 in zip(self._lat_r, self._lon_r, self._cos_lat):
+                a = sin((lat2 - lat1) / 2) ** 2 + cos1 * cos2 * sin((lon2 - lon1) / 2) ** 2
+                row.append(EARTH_RADIUS_KM * (2 * atan2(sqrt(a), sqrt(1 - a))))
+            self._rows[i] = row
+        return row
+
+    def array_row(self, origin: Coord) -> "np.ndarray":
+        """``row`` as a NumPy array (same values), cached alongside it."""
+        i = self.index[origin]
+        array = self._arrays.get(i)
+        if array is None:
+            array = self._arrays[i] = _load_numpy().array(self.row(origin), dtype=np.float64)
+        return array
+
+    def __call__(self, coord_a: Coord, coord_b: Coord) -> float:
+        return self.row(coord_a)[self.index[coord_b]]
+
+
+
+class MatrixKernel(PythonKernel):
+    """``PythonKernel`` over precomputed ``DistanceMatrix`` rows instead of per-step haversines.
+
+    From ``VECTOR_MIN_STOPS`` stops up (and with NumPy installed) the rows are
+    scanned as arrays; the distances are the exact ones either way, so both
+    paths pick the same stop.
+    """
+
+    name = "matrix"
+
+    def __init__(self, coords: Sequence[Coord], out_km: Sequence[float], back_km: Sequence[float], ids: Sequence[int], matrix: DistanceMatrix) -> None:
+        super().__init__(coords, out_km, back_km, ids, matrix)
+        self.matrix = matrix
+        self.count = len(self.coords)
+        self.columns = [matrix.index[coord] for coord in self.coords]
+        self.vector = HAVE_NUMPY and KERNEL != "python" and len(self.coords) >= VECTOR_MIN_STOPS
+        if self.vector:
+            _load_numpy()
+            self.columns_arr = np.array(self.columns, dtype=np.int64)
+            self.out_arr = np.array(self.out_km, dtype=np.float64)
+            self.back_arr = np.array(self.back_km, dtype=np.float64)
+            self.ids_arr = np.array(self.ids, dtype=np.int64)
+            self.mask = np.ones(len(self.coords), dtype=bool)
+
+    def __len__(self) -> int:
+        return self.count if self.vector else len(self.alive)
+
+    def any_round_trip_within(self, limit_km: float) -> bool:
+        if self.vector:
+            return bool((self.mask & (self.out_arr + self.back_arr <= limit_km)).any())
+        return super().any_round_trip_within(limit_km)
+
+    def remove(self, index: int) -> None:
+        if self.vector:
+            self.mask &= self.ids_arr != self.ids_arr[index]
+            self.count = int(self.mask.sum())
+        else:
+            super().remove(index)
+
+    def nearest_feasible(self, current: Coord, budget_km: float) -> Tuple[int, float]:
+        if self.vector:
+            dist = self.matrix.array_row(current)[self.columns_arr]
+            feasible = self.mask & (dist + self.back_arr <= budget_km)
+            if not feasible.any():
+                return -1, 0.0
+            # argmin returns the first of equal minima: the lowest index, as in the loop.
+            best = int(np.argmin(np.where(feasible, dist, np.inf)))
+            return best, float(dist[best])
+        row = self.matrix.row(current)
+        columns = self.columns
+        back_km = self.back_km
+        best = -1
+        best_km = 0.0
+        for index in self.alive:
+            dist = row[columns[index]]
+            if dist + back_km[index] <= budget_km and (best < 0 or dist < best_km):
+                best, best_km = index, dist
+        return best, best_km
+
+
+def available_kernels() -> List[str]:
+    names = ["python", "grid"]
+    if HAVE_NUMPY:
+        names.append("numpy")
+    if HAVE_NUMBA:
+        names.append("numba")
+    return names
+
+
+def make_kernel(
+    coords: Sequence[Coord],
+    out_km: Sequence[float],
+    back_km: Sequence[float],
+    ids: Sequence[int],
+    haversine: HaversineFn,
+    kernel: Optional[str] = None,
+) -> PythonKernel:
+    """Build the requested kernel (default ``FEASIBILITY_KERNEL``), falling back to what is installed."""
+    choice = (kernel or KERNEL).lower()
+    if choice == "auto":
+        if len(coords) >= GRID_MIN_STOPS:
+            choice = "grid"
+        elif len(coords) < VECTOR_MIN_STOPS or not HAVE_NUMPY:
+            choice = "python"
+        else:
+            choice = "numba" if HAVE_NUMBA else "numpy"
+    if choice == "numba" and not HAVE_NUMBA:
+        logger.debug("Numba not installed; using the NumPy feasibility kernel.")
+        choice = "numpy"
+    if choice == "numpy" and not HAVE_NUMPY:
+        logger.debug("NumPy not installed; using the Python feasibility kernel.")
+        choice = "python"
+
+    cls = {"python": PythonKernel, "numpy": NumpyKernel, "numba": NumbaKernel, "grid": GridKernel}.get(
+        choice, PythonKernel
+    )
+    return cls(coords, out_km, back_km, ids, haversine)
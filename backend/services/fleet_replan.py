@@ -0,0 +1,125 @@
+"""
+Fleet-wide replan: plans every county in parallel on a process pool.
+
+Counties are independent (own hub, drone and orders), so the main process
+loads all of them in a few batched queries, ships plain-data ``CountyJob``
+values to worker processes running ``optimizer_service.plan_county_job``,
+merges the results and writes all order statuses back in one transaction.
+Workers never see ORM objects or a database session.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session, joinedload
+
+from backend import metrics, models, optimizer_service
+from backend.optimizer_service import CountyJob, CountyPlan
+from backend.services import order_lifecycle
+
+logger = logging.getLogger("backend.fleet_replan")
+
+
+def load_county_jobs(session: Session, county_ids: Optional[Sequence[int]] = None) -> List[CountyJob]:
+    """Build a ``CountyJob`` per county with one query per table rather than per county."""
+    if county_ids is None:
+        county_ids = [county_id for (county_id,) in session.query(models.County.id).order_by(models.County.id)]
+    county_ids = list(county_ids)
+    if not county_ids:
+        return []
+
+    stations: Dict[int, models.Station] = {}
+    for station in (
+        session.query(models.Station).filter(models.Station.county_id.in_(county_ids)).order_by(models.Station.id)
+    ):
+        stations.setdefault(station.county_id, station)
+
+    default_drones: Dict[int, models.Drone] = {}
+    station_ids = [station.id for station in stations.values()]
+    for drone in session.query(models.Drone).filter(models.Drone.station_id.in_(station_ids)).order_by(models.Drone.id):
+        default_drones.setdefault(drone.station_id, drone)
+
+    queue_rank = {order_lifecycle.PENDING: 0, order_lifecycle.PLANNED: 1}
+    orders_by_county: Dict[int, List[models.Order]] = {county_id: [] for county_id in county_ids}
+    for order in (
+        session.query(models.Order)
+        .filter(models.Order.county_id.in_(county_ids), models.Order.status.in_(tuple(queue_rank)))
+        .options(
+            joinedload(models.Order.origin_location),
+            joinedload(models.Order.destination_location),
+            joinedload(models.Order.drone),
+        )
+    ):
+        orders_by_county[order.county_id].append(order)
+
+    jobs: List[CountyJob] = []
+    for county_id in county_ids:
+        station = stations.get(county_id)
+        if station is None:
+            jobs.append(CountyJob(county_id, None, None, {}, ()))
+            continue
+        # Same order as the per-county queue reads: pending before planned, oldest first.
+        orders = sorted(
+            orders_by_county[county_id], key=lambda order: (queue_rank[order.status], order.created_at, order.id)
+        )
+        drones = {order.drone.id: optimizer_service.drone_input(order.drone) for order in orders if order.drone}
+        jobs.append(
+            CountyJob(
+                county_id,
+                optimizer_service.point_input(station),
+                optimizer_service.drone_input(default_drones.get(station.id)),
+                drones,  # type: ignore[arg-type]
+                tuple(optimizer_service.order_input(order) for order in orders),
+            )
+        )
+    return jobs
+
+
+def default_workers(n_jobs: int) -> int:
+    return max(1, min(n_jobs, os.cpu_count() or 1))
+
+
+def plan_jobs(
+    jobs: Sequence[CountyJob],
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> List[CountyPlan]:
+    """Run ``plan_county_job`` over ``jobs``, in parallel unless one worker suffices."""
+    if executor is not None:
+        return list(executor.map(optimizer_service.plan_county_job, jobs))
+
+    workers = max_workers or default_workers(len(jobs))
+    if workers <= 1 or len(jobs) <= 1:
+        return [optimizer_service.plan_county_job(job) for job in jobs]
+
+    # "spawn" keeps the workers clear of the MQTT and dispatcher threads of a live process.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return list(pool.map(optimizer_service.plan_county_job, jobs))
+
+
+@metrics.timed(metrics.PLANNER_SECONDS, planner="fleet_replan")
+def replan_counties(
+    session: Session,
+    county_ids: Optional[Sequence[int]] = None,
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> Dict[int, Dict[str, object]]:
+    """Replan ``county_ids`` (default: all counties) and persist the statuses.
+
+    Returns the ``plan_orders_for_county`` result per county id.
+    """
+    jobs = load_county_jobs(session, county_ids)
+    plans = plan_jobs(jobs, max_workers=max_workers, executor=executor)
+    optimizer_service.apply_county_plans(session, [plan for plan in plans if plan.station is not None])
+    logger.info(
+        "Replanned %d counties: %d planned, %d too far",
+        len(plans),
+        sum(len(plan.planned_orders) for plan in plans),
+        sum(len(plan.too_far) for plan in plans),
+    )
+    return {plan.county_id: plan.as_dict() for plan in plans}
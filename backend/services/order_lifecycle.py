@@ -0,0 +1,191 @@
+"""
+Order lifecycle: statuses, allowed transitions and indexed queue access.
+
+    pending -> planned -> assigned -> in_flight -> delivered
+        \\________\\___________\\___________\\______-> failed
+
+Planned/assigned orders can fall back to pending for a replan, and failed
+orders can be retried. Every transition is recorded as an ``OrderEvent`` and
+stamps ``Order.status_changed_at``.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from backend import models
+
+logger = logging.getLogger("backend.order_lifecycle")
+
+PENDING = "pending"
+PLANNED = "planned"
+ASSIGNED = "assigned"
+IN_FLIGHT = "in_flight"
+DELIVERED = "delivered"
+FAILED = "failed"
+
+STATUSES = (PENDING, PLANNED, ASSIGNED, IN_FLIGHT, DELIVERED, FAILED)
+ACTIVE_STATUSES = models.ORDER_QUEUE_STATUSES
+TERMINAL_STATUSES = (DELIVERED, FAILED)
+
+# Values written before the lifecycle existed.
+LEGACY_STATUSES = {"too_far": FAILED}
+
+TRANSITIONS: Dict[str, frozenset] = {
+    PENDING: frozenset({PLANNED, FAILED}),
+    PLANNED: frozenset({PLANNED, ASSIGNED, PENDING, FAILED}),
+    ASSIGNED: frozenset({IN_FLIGHT, PENDING, FAILED}),
+    IN_FLIGHT: frozenset({DELIVERED, FAILED}),
+    DELIVERED: frozenset(),
+    FAILED: frozenset({PENDING}),
+}
+
+# Statuses a drone may report for an order over the telemetry topic.
+TELEMETRY_STATUSES = frozenset({IN_FLIGHT, DELIVERED, FAILED})
+
+
+class InvalidTransition(ValueError):
+    """Raised when an order cannot move from its current status to the requested one."""
+
+
+def normalize_status(status: str) -> str:
+    return LEGACY_STATUSES.get(status, status)
+
+
+def can_transition(current: str, target: str) -> bool:
+    return target in TRANSITIONS.get(normalize_status(current), frozenset())
+
+
+def transition(
+    session: Session,
+    order: models.Order,
+    target: str,
+    reason: Optional[str] = None,
+    at: Optional[datetime] = None,
+) -> Optional[models.OrderEvent]:
+    """Move ``order`` to ``target`` and record the event; returns ``None`` for a same-status no-op."""
+    if target not in STATUSES:
+        raise InvalidTransition(f"Unknown order status: {target}")
+    current = normalize_status(order.status)
+    if not can_transition(current, target):
+        raise InvalidTransition(f"Order {order.id}: {current} -> {target} is not allowed")
+    if current == target:
+        return None
+
+    at = at or datetime.utcnow()
+    event = models.OrderEvent(order=order, from_status=current, to_status=target, reason=reason, created_at=at)
+    order.status = target
+    order.status_changed_at = at
+    order.failure_reason = reason if target == FAILED else None
+    session.add(event)
+    session.add(order)
+    return event
+
+
+def transition_many(
+    session: Session,
+    orders: Iterable[models.Order],
+    target: str,
+    reason: Optional[str] = None,
+) -> List[int]:
+    """Apply ``transition`` to each order, skipping (and logging) disallowed moves."""
+    at = datetime.utcnow()
+    moved: List[int] = []
+    for order in orders:
+        try:
+            transition(session, order, target, reason=reason, at=at)
+        except InvalidTransition as exc:
+            logger.warning("%s", exc)
+            continue
+        moved.append(order.id)
+    return moved
+
+
+def queue_query(session: Session, county_id: int, status: str = PENDING):
+    """Orders of one county in one active status, oldest first (served by a partial index)."""
+    return (
+        session.query(models.Order)
+        .filter(models.Order.county_id == county_id, models.Order.status == status)
+        .order_by(models.Order.created_at, models.Order.id)
+    )
+
+
+def next_orders(session: Session, county_id: int, status: str = PENDING, limit: int = 50) -> List[models.Order]:
+    """Next ``limit`` orders in a county's ``status`` queue."""
+    return queue_query(session, county_id, status).limit(limit).all()
+
+
+def queue_depth(session: Session, county_id: int, status: str = PENDING) -> int:
+    return queue_query(session, county_id, status).order_by(None).count()
+
+
+def _order_ids(payload: Dict[str, Any]) -> List[int]:
+    raw: Sequence[Any]
+    if "order_ids" in payload and isinstance(payload["order_ids"], list):
+        raw = payload["order_ids"]
+    elif "order_id" in payload:
+        raw = [payload["order_id"]]
+    else:
+        return []
+    ids: List[int] = []
+    for value in raw:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def apply_telemetry(session: Session, payload: Dict[str, Any], at: Optional[datetime] = None) -> List[int]:
+    """Advance orders named in a drone telemetry message.
+
+    Expects ``order_id`` or ``order_ids`` plus ``order_status`` (``in_flight``,
+    ``delivered`` or ``failed``). Orders still ``planned``/``assigned`` are
+    stepped through the intermediate states so a late ``delivered`` is not lost.
+    ``at`` overrides the event time (the simulator passes simulated time).
+    """
+    target = payload.get("order_status")
+    if target not in TELEMETRY_STATUSES:
+        return []
+    ids = _order_ids(payload)
+    if not ids:
+        return []
+
+    orders = session.query(models.Order).filter(models.Order.id.in_(ids)).all()
+    at = at or datetime.utcnow()
+    reason = payload.get("reason") if target == FAILED else None
+    moved: List[int] = []
+    for order in orders:
+        path = _path_to(normalize_status(order.status), target)
+        if path is None:
+            logger.warning("Ignoring telemetry %s for order %s in status %s", target, order.id, order.status)
+            continue
+        for status in path:
+            transition(session, order, status, reason=reason if status == FAILED else None, at=at)
+        moved.append(order.id)
+    return moved
+
+
+def _path_to(current: str, target: str) -> Optional[List[str]]:
+    """Shortest chain of allowed transitions from ``current`` to ``target``."""
+    if current == target:
+        return []
+    frontier: List[List[str]] = [[current]]
+    seen = {current}
+    while frontier:
+        path = frontier.pop(0)
+        for status in sorted(TRANSITIONS.get(path[-1], ())):
+            if status in seen:
+                continue
+            # Telemetry never sends an order back for replanning.
+            if status == PENDING:
+                continue
+            candidate = path + [status]
+            if status == target:
+                return candidate[1:]
+            seen.add(status)
+            frontier.append(candidate)
+    return None
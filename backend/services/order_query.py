@@ -0,0 +1,163 @@
+"""
+Order listing and export.
+
+Pages are keyset-paginated on ``(created_at, id)``: the cursor carries the
+last row's key and the next page starts right after it, so page N costs the
+same as page 1 however deep it is. Each filter combination is served by an
+index whose trailing columns are ``(created_at, id)`` (see ``models``), so
+SQLite and PostgreSQL walk the index in order instead of sorting.
+
+Exports stream the same filtered query from a server-side cursor in
+``EXPORT_BATCH`` row batches, encoded to NDJSON or CSV as they are read.
+"""
+from __future__ import annotations
+
+import base64
+import csv
+import io
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterator, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import Select, select, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from backend import models
+
+try:  # Optional: several times faster NDJSON encoding for large exports.
+    import orjson
+except ImportError:  # pragma: no cover - exercised without orjson installed
+    orjson = None  # type: ignore[assignment]
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPORT_BATCH = 1000
+EXPORT_FORMATS = ("ndjson", "csv")
+
+EXPORT_COLUMNS = (
+    models.Order.id,
+    models.Order.origin_location_id,
+    models.Order.destination_location_id,
+    models.Order.weight_kg,
+    models.Order.county_id,
+    models.Order.drone_id,
+    models.Order.status,
+    models.Order.created_at,
+    models.Order.status_changed_at,
+    models.Order.failure_reason,
+)
+EXPORT_FIELDS = tuple(column.key for column in EXPORT_COLUMNS)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class OrderFilter:
+    county_id: Optional[int] = None
+    status: Optional[str] = None
+    drone_id: Optional[int] = None
+    created_from: Optional[datetime] = None  # inclusive
+    created_to: Optional[datetime] = None  # exclusive
+
+    def apply(self, query: Select) -> Select:
+        order = models.Order
+        # Always true; lets the planner use the partial listing indexes (see models).
+        query = query.where(order.created_at.is_not(None))
+        if self.county_id is not None:
+            query = query.where(order.county_id == self.county_id)
+        if self.status is not None:
+            query = query.where(order.status == self.status)
+        if self.drone_id is not None:
+            query = query.where(order.drone_id == self.drone_id)
+        if self.created_from is not None:
+            query = query.where(order.created_at >= self.created_from)
+        if self.created_to is not None:
+            query = query.where(order.created_at < self.created_to)
+        return query
+
+
+def encode_cursor(created_at: datetime, order_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{order_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, order_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+
+
+def ordered(query: Select, descending: bool) -> Select:
+    key = (models.Order.created_at, models.Order.id)
+    return query.order_by(*(column.desc() for column in key)) if descending else query.order_by(*key)
+
+
+def list_orders(
+    session: Session,
+    filters: OrderFilter,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    descending: bool = True,
+) -> Tuple[List[models.Order], Optional[str]]:
+    """One page of orders (newest first by default) and the cursor of the next page, if any."""
+    query = filters.apply(select(models.Order))
+    if cursor:
+        key = tuple_(models.Order.created_at, models.Order.id)
+        after = tuple_(*decode_cursor(cursor))
+        query = query.where(key < after if descending else key > after)
+    rows = session.execute(ordered(query, descending).limit(limit + 1)).scalars().all()
+    if len(rows) <= limit:
+        return list(rows), None
+    last = rows[limit - 1]
+    return list(rows[:limit]), encode_cursor(last.created_at, last.id)
+
+
+def export_query(filters: OrderFilter, descending: bool = False) -> Select:
+    return ordered(filters.apply(select(*EXPORT_COLUMNS)), descending)
+
+
+def iter_export_batches(
+    bind: Engine, filters: OrderFilter, descending: bool = False, batch: int = EXPORT_BATCH
+) -> Iterator[Sequence[Any]]:
+    """Row batches from a server-side cursor; the connection is held only while iterating."""
+    with bind.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch).execute(
+            export_query(filters, descending)
+        )
+        for rows in result.partitions(batch):
+            yield rows
+
+
+def _json_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def ndjson_chunks(batches: Iterator[Sequence[Any]]) -> Iterator[Union[str, bytes]]:
+    for rows in batches:
+        if orjson is not None:
+            yield b"".join(orjson.dumps(dict(zip(EXPORT_FIELDS, row))) + b"\n" for row in rows)
+        else:  # pragma: no cover - exercised without orjson installed
+            yield "".join(
+                json.dumps(dict(zip(EXPORT_FIELDS, map(_json_value, row))), separators=(",", ":")) + "\n"
+                for row in rows
+            )
+
+
+def csv_chunks(batches: Iterator[Sequence[Any]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_FIELDS)
+    for rows in batches:
+        writer.writerows([_json_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
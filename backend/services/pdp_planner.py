@@ -0,0 +1,244 @@
+"""
+Pickup-and-delivery planner: chains several orders into one sortie.
+
+Each order is picked up at its origin before it is dropped at its
+destination. The drone carries every picked-up order until its drop, so the
+payload (and with it ``consumption_factor``, the battery cost per km) changes
+along the route. The full charge, ``effective_capacity_km``, does not depend on
+the payload, so a recharge at the station always restores the same capacity.
+
+The planner is greedy: from the current position it moves to the nearest
+pickup or drop that keeps the route completable. An action is only taken if,
+after it, the drone can still drop everything on board and fly home on the
+remaining charge (the feasible-completion invariant), so cargo should never
+be stranded. When nothing qualifies the drone returns to the station to
+recharge; orders that are infeasible even from a full charge are reported as
+unserved. Should picked-up cargo still be undeliverable from a full charge
+(the estimate behind the invariant was off), it stays at the station and
+those orders are reported as stranded, not as unserved.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from backend import metrics, models
+from backend.services import scheduling
+from backend.services.planner_core import (
+    calc_battery_pct,
+    consumption_factor,
+    effective_capacity_km,
+    haversine_km,
+)
+
+logger = logging.getLogger("backend.pdp_planner")
+
+Coord = Tuple[float, float]
+
+
+@dataclass(frozen=True)
+class PdpOrder:
+    """One pickup-and-delivery request."""
+
+    order_id: int
+    pickup: models.Location
+    dropoff: models.Location
+    weight_kg: float
+
+
+@dataclass
+class PdpPlan:
+    steps: List[Dict[str, object]] = field(default_factory=list)
+    served: List[int] = field(default_factory=list)
+    unserved: List[int] = field(default_factory=list)
+    # Picked up but brought back to the station undelivered.
+    stranded: List[int] = field(default_factory=list)
+    total_km: float = 0.0
+    # Pad slots booked on the station schedule, as (station id, start, duration_s).
+    reservations: List[Tuple[int, datetime, float]] = field(default_factory=list)
+
+
+def pdp_orders(orders: Iterable[models.Order]) -> List[PdpOrder]:
+    """Adapt ORM orders (with origin/destination loaded) to planner input."""
+    return [
+        PdpOrder(order.id, order.origin_location, order.destination_location, float(order.weight_kg))
+        for order in orders
+    ]
+
+
+def _coord(location: models.Location) -> Coord:
+    return (location.lat, location.lon)
+
+
+def round_trip_km(orders: Sequence[PdpOrder], station: models.Station) -> float:
+    """Distance flown when every order is a separate station -> origin -> destination -> station trip."""
+    station_coord = (station.lat, station.lon)
+    return sum(
+        haversine_km(station_coord, _coord(order.pickup))
+        + haversine_km(_coord(order.pickup), _coord(order.dropoff))
+        + haversine_km(_coord(order.dropoff), station_coord)
+        for order in orders
+    )
+
+
+def _completion_cost(
+    start: Coord,
+    onboard: Sequence[PdpOrder],
+    payload_kg: float,
+    station_coord: Coord,
+    drone: models.Drone,
+) -> float:
+    """Range needed to drop ``onboard`` (nearest drop first) and return to the station."""
+    cost = 0.0
+    position = start
+    left = list(onboard)
+    while left:
+        nxt = min(left, key=lambda order: haversine_km(position, _coord(order.dropoff)))
+        cost += haversine_km(position, _coord(nxt.dropoff)) * consumption_factor(payload_kg, drone)
+        payload_kg = max(0.0, payload_kg - nxt.weight_kg)
+        position = _coord(nxt.dropoff)
+        left.remove(nxt)
+    return cost + haversine_km(position, station_coord) * consumption_factor(payload_kg, drone)
+
+
+@metrics.timed(metrics.PLANNER_SECONDS, planner="pdp")
+def plan_pdp_route(
+    orders: Sequence[PdpOrder],
+    station: models.Station,
+    drone: models.Drone,
+    safety_margin_ratio: float = 0.05,
+    start_time: Optional[datetime] = None,
+    recharge_model: Optional[scheduling.RechargeModel] = None,
+    station_schedule: Optional[scheduling.StationSchedule] = None,
+) -> PdpPlan:
+    """Plan one sortie serving ``orders`` with pickup-before-drop precedence.
+
+    Steps use the ``route_planner`` step format plus ``pickups``/``drops``
+    (order ids handled at that stop) and ``order_ids``.
+    """
+    station_coord = (station.lat, station.lon)
+    waiting: List[PdpOrder] = []
+    plan = PdpPlan()
+    for order in orders:
+        if drone.max_payload_kg > 0 and order.weight_kg > drone.max_payload_kg:
+            plan.unserved.append(order.order_id)
+        else:
+            waiting.append(order)
+
+    onboard: List[PdpOrder] = []
+    payload_kg = 0.0
+    capacity_km = effective_capacity_km(drone)
+    remaining_km = capacity_km
+    position = station_coord
+    position_name = station.name
+    cumulative_km = 0.0
+    clock = scheduling.StepClock(drone.speed_kmh, start_time, recharge_model, station_schedule)
+
+    def fly_to(name: str, coord: Coord) -> Dict[str, object]:
+        nonlocal remaining_km, cumulative_km, position, position_name
+        distance_km = haversine_km(position, coord)
+        remaining_km = max(0.0, remaining_km - distance_km * consumption_factor(payload_kg, drone))
+        cumulative_km += distance_km
+        step: Dict[str, object] = {
+            "previous": position_name,
+            "next": name,
+            "coordinates": {"x": coord[1], "y": coord[0]},
+            "distance": round(distance_km * 1000, 2),
+            "distance_km": round(distance_km, 3),
+            "cumulative_distance_km": round(cumulative_km, 3),
+            "battery_pct": round(calc_battery_pct(remaining_km, capacity_km), 1),
+            "speed_kmh": drone.speed_kmh,
+            "drone_id": drone.id,
+            "max_payload_kg": drone.max_payload_kg,
+            "base_range_km": drone.base_range_km,
+            **clock.fly(distance_km),
+        }
+        position, position_name = coord, name
+        return step
+
+    def budget() -> float:
+        return remaining_km - capacity_km * safety_margin_ratio
+
+    def candidates() -> List[Tuple[float, str, PdpOrder]]:
+        """Feasible next actions as (distance, kind, order)."""
+        found: List[Tuple[float, str, PdpOrder]] = []
+        factor = consumption_factor(payload_kg, drone)
+        for order in onboard:
+            leg = haversine_km(position, _coord(order.dropoff))
+            rest = [other for other in onboard if other is not order]
+            cost = leg * factor + _completion_cost(
+                _coord(order.dropoff), rest, payload_kg - order.weight_kg, station_coord, drone
+            )
+            if cost <= budget():
+                found.append((leg, "drop", order))
+        for order in waiting:
+            if drone.max_payload_kg > 0 and payload_kg + order.weight_kg > drone.max_payload_kg:
+                continue
+            leg = haversine_km(position, _coord(order.pickup))
+            cost = leg * factor + _completion_cost(
+                _coord(order.pickup), onboard + [order], payload_kg + order.weight_kg, station_coord, drone
+            )
+            if cost <= budget():
+                found.append((leg, "pickup", order))
+        # Nearest first; on ties drop before picking up.
+        found.sort(key=lambda item: (item[0], item[1] != "drop", item[2].order_id))
+        return found
+
+    while waiting or onboard:
+        options = candidates()
+        if not options:
+            if position != station_coord:
+                step = fly_to(station.name, station_coord)
+                step["payload_kg"] = round(payload_kg, 3)
+                step.update(clock.recharge(station.id, float(step["battery_pct"])))
+                plan.steps.append(step)
+            remaining_km = capacity_km
+            if not candidates():
+                if waiting:
+                    logger.warning("PDP: %d orders infeasible from a full charge; leaving them unserved.", len(waiting))
+                    plan.unserved.extend(order.order_id for order in waiting)
+                    waiting.clear()
+                if onboard:
+                    logger.warning("PDP: %d picked-up orders cannot be dropped; leaving them at the station.", len(onboard))
+                    plan.stranded.extend(order.order_id for order in onboard)
+                    onboard.clear()
+                    payload_kg = 0.0
+            continue
+
+        _leg, _kind, chosen = options[0]
+        target = chosen.dropoff if _kind == "drop" else chosen.pickup
+        step = fly_to(target.name, _coord(target))
+        drops: List[int] = []
+        pickups: List[int] = []
+        # Handle everything due at this stop: drops first, then pickups that keep the route completable.
+        for order in [o for o in onboard if _coord(o.dropoff) == position]:
+            onboard.remove(order)
+            payload_kg = max(0.0, payload_kg - order.weight_kg)
+            drops.append(order.order_id)
+            plan.served.append(order.order_id)
+        for order in [o for o in waiting if _coord(o.pickup) == position]:
+            if drone.max_payload_kg > 0 and payload_kg + order.weight_kg > drone.max_payload_kg:
+                continue
+            cost = _completion_cost(position, onboard + [order], payload_kg + order.weight_kg, station_coord, drone)
+            if cost > budget():
+                continue
+            waiting.remove(order)
+            onboard.append(order)
+            payload_kg += order.weight_kg
+            pickups.append(order.order_id)
+        step["payload_kg"] = round(payload_kg, 3)
+        step["pickups"] = pickups
+        step["drops"] = drops
+        step["order_ids"] = sorted(pickups + drops)
+        plan.steps.append(step)
+
+    if position != station_coord:
+        step = fly_to(station.name, station_coord)
+        step["payload_kg"] = round(payload_kg, 3)
+        plan.steps.append(step)
+
+    plan.total_km = round(cumulative_km, 3)
+    plan.reservations = clock.reservations
+    return plan
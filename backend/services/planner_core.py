@@ -0,0 +1,206 @@
+"""
+Plain-data route planner core.
+
+The planner works on slotted dataclasses instead of ORM instances, so the hot
+loop reads plain attributes (no SQLAlchemy instrumentation), needs no
+session, and its inputs pickle cheaply for worker processes and benchmarks.
+``route_planner`` adapts ORM objects to these types.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from math import atan2, cos, radians, sin, sqrt
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from backend.services import energy, feasibility, scheduling
+
+logger = logging.getLogger("backend.route_planner")
+
+EARTH_RADIUS_KM = 6371.0
+
+
+@dataclass(frozen=True, slots=True)
+class Hub:
+    id: int
+    name: str
+    lat: float
+    lon: float
+
+
+@dataclass(frozen=True, slots=True)
+class Stop:
+    id: int
+    name: str
+    lat: float
+    lon: float
+    weight_kg: float = 0.0
+
+
+@dataclass(frozen=True, slots=True)
+class DroneSpec:
+    id: Optional[int]
+    base_range_km: float
+    max_payload_kg: float
+    speed_kmh: Optional[float] = None
+
+
+def haversine_km(coord_a: Tuple[float, float], coord_b: Tuple[float, float]) -> float:
+    """Great-circle distance in kilometers between two (lat, lon) coordinates."""
+    lat1, lon1 = map(radians, coord_a)
+    lat2, lon2 = map(radians, coord_b)
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def effective_capacity_km(drone: DroneSpec) -> float:
+    """Full charge in empty-drone km (see ``energy``); payload changes the cost per km, not this."""
+    return energy.model_for(drone).capacity_km
+
+
+def consumption_factor(payload_kg: float, drone: DroneSpec) -> float:
+    """Battery cost of one km with ``payload_kg`` on board, in empty-drone km."""
+    return energy.model_for(drone).factor(payload_kg)
+
+
+def calc_battery_pct(remaining_range_km: float, capacity_km: float) -> float:
+    if capacity_km <= 0:
+        return 0.0
+    return max(0.0, min(100.0, (remaining_range_km / capacity_km) * 100.0))
+
+
+def iter_route(
+    stops: Sequence[Stop],
+    hub: Hub,
+    drone: DroneSpec,
+    safety_margin_ratio: float = 0.05,
+    start_time: Optional[datetime] = None,
+    recharge_model: Optional[scheduling.RechargeModel] = None,
+    station_schedule: Optional[scheduling.StationSchedule] = None,
+    kernel: Optional[str] = None,
+    matrix: Optional[feasibility.DistanceMatrix] = None,
+) -> Iterator[Dict[str, object]]:
+    """Nearest-neighbour planner with battery and recharge at the hub.
+
+    Yields each step as soon as its leg is decided. See
+    ``route_planner.iter_route_with_recharges`` for the step format.
+    ``kernel`` picks the feasibility kernel (see ``feasibility.make_kernel``);
+    with a ``matrix`` covering the hub and every stop, distances are read from
+    it instead (same values, computed once across plans sharing it).
+    """
+    station_coord = (hub.lat, hub.lon)
+    coords = [(stop.lat, stop.lon) for stop in stops]
+    weights = [float(stop.weight_kg) for stop in stops]
+    distance = matrix if matrix is not None else haversine_km
+    # Each stop's distance from and back to the hub never changes; compute it once.
+    out_km = [distance(station_coord, coord) for coord in coords]
+    back_km = [distance(coord, station_coord) for coord in coords]
+    ids = [stop.id for stop in stops]
+    if matrix is not None:
+        remaining: feasibility.PythonKernel = feasibility.MatrixKernel(coords, out_km, back_km, ids, matrix)
+    else:
+        remaining = feasibility.make_kernel(coords, out_km, back_km, ids, haversine_km, kernel=kernel)
+    current_coord = station_coord
+    current_name = hub.name
+    total_payload = sum(weights)
+    energy_table = energy.model_for(drone)
+    capacity_km = energy_table.capacity_km
+    remaining_range_km = capacity_km
+    cumulative_km = 0.0
+    clock = scheduling.StepClock(drone.speed_kmh, start_time, recharge_model, station_schedule)
+    speed_kmh = drone.speed_kmh
+    drone_id = drone.id
+    max_payload_kg = drone.max_payload_kg
+    base_range_km = drone.base_range_km
+
+    def make_step(prev_name: str, next_name: str, next_coord: Tuple[float, float], distance_km: float) -> Dict[str, object]:
+        nonlocal cumulative_km
+        cumulative_km += distance_km
+        battery_pct = calc_battery_pct(remaining_range_km, capacity_km)
+        return {
+            "previous": prev_name,
+            "next": next_name,
+            "coordinates": {"x": next_coord[1], "y": next_coord[0]},
+            "distance": round(distance_km * 1000, 2),
+            "distance_km": round(distance_km, 3),
+            "cumulative_distance_km": round(cumulative_km, 3),
+            "battery_pct": round(battery_pct, 1),
+            "speed_kmh": speed_kmh,
+            "drone_id": drone_id,
+            "max_payload_kg": max_payload_kg,
+            "base_range_km": base_range_km,
+            "payload_kg": round(total_payload, 3),
+            **clock.fly(distance_km),
+        }
+
+    while len(remaining):
+        # The kernel measures plain km; flying there and back at the current
+        # payload is the conservative cost (payload only drops after a delivery).
+        factor = energy_table.factor(total_payload)
+        budget_km = (remaining_range_km - capacity_km * safety_margin_ratio) / factor
+        best, best_km = remaining.nearest_feasible(current_coord, budget_km)
+
+        if best < 0:
+            if current_coord != station_coord:
+                # Return to station to recharge.
+                return_km = distance(current_coord, station_coord)
+                remaining_range_km = max(0.0, remaining_range_km - return_km * factor)
+                step = make_step(current_name, hub.name, station_coord, return_km)
+                step.update(clock.recharge(hub.id, float(step["battery_pct"])))
+                yield step
+                current_coord = station_coord
+                current_name = hub.name
+            remaining_range_km = capacity_km
+            # If still nothing feasible from the hub, abort to avoid infinite loop.
+            if not remaining.any_round_trip_within((remaining_range_km - capacity_km * safety_margin_ratio) / factor):
+                logger.warning("No feasible targets within range for current payload; aborting planning.")
+                break
+            continue
+
+        next_stop, weight, next_coord = stops[best], weights[best], coords[best]
+        # Consume battery based on payload.
+        remaining_range_km = max(0.0, remaining_range_km - best_km * factor)
+        yield make_step(current_name, next_stop.name, next_coord, best_km)
+
+        total_payload = max(0.0, total_payload - weight)
+        remaining_range_km = min(remaining_range_km, capacity_km)
+        current_coord = next_coord
+        current_name = next_stop.name
+        remaining.remove(best)
+
+    if current_coord != station_coord:
+        return_km = distance(current_coord, station_coord)
+        remaining_range_km = max(0.0, remaining_range_km - return_km * energy_table.factor(total_payload))
+        yield make_step(current_name, hub.name, station_coord, return_km)
+
+
+def plan_route(
+    stops: Sequence[Stop],
+    hub: Hub,
+    drone: DroneSpec,
+    safety_margin_ratio: float = 0.05,
+    start_time: Optional[datetime] = None,
+    recharge_model: Optional[scheduling.RechargeModel] = None,
+    station_schedule: Optional[scheduling.StationSchedule] = None,
+    kernel: Optional[str] = None,
+    matrix: Optional[feasibility.DistanceMatrix] = None,
+) -> List[Dict[str, object]]:
+    """List form of :func:`iter_route`."""
+    return list(
+        iter_route(
+            stops,
+            hub,
+            drone,
+            safety_margin_ratio=safety_margin_ratio,
+            start_time=start_time,
+            recharge_model=recharge_model,
+            station_schedule=station_schedule,
+            kernel=kernel,
+            matrix=matrix,
+        )
+    )
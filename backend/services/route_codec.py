@@ -0,0 +1,310 @@
+"""
+Compact, lossless binary form for lists of step dicts (planned routes).
+
+Rows are stored column by column. Every key becomes one column, typed by
+the values it holds:
+
+- ``int``: integers, delta-encoded as zigzag varints;
+- ``dec``: floats that are exact at ``d`` decimals (``round(x, d)`` output,
+  which is what the planners publish), delta-encoded as scaled integers;
+- ``time``: ``YYYY-MM-DDTHH:MM:SS`` timestamps, delta-encoded as epoch seconds;
+- ``path``: ``{"x": lon, "y": lat}`` points, as an encoded polyline (Google's
+  algorithm at the smallest precision of 5-10 digits that is exact; precision 6
+  is the "polyline6" of OSRM and Valhalla);
+- ``ref``: anything else, as indexes into one table of distinct JSON values
+  shared by all columns (names, lists, ``None``).
+
+A column that does not fit a compact type falls back to ``ref``, so
+``decode_rows(encode_rows(rows)) == rows`` for any JSON-serialisable rows.
+Keys absent from some rows carry a presence bitmap. The body is
+zlib-compressed behind a two-byte magic and a version byte.
+"""
+from __future__ import annotations
+
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+MAGIC = b"RC"
+VERSION = 1
+MAX_DECIMALS = 9
+POLYLINE_MIN_PRECISION = 5
+POLYLINE_MAX_PRECISION = 10
+ZLIB_LEVEL = 6
+
+INT, DEC, TIME, PATH, REF = range(5)
+_EPOCH = datetime(1970, 1, 1)
+
+
+class RouteCodecError(ValueError):
+    pass
+
+
+# Varints -------------------------------------------------------------------------
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _put_varint(buf: bytearray, value: int) -> None:
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _put_bytes(buf: bytearray, data: bytes) -> None:
+    _put_varint(buf, len(data))
+    buf.extend(data)
+
+
+def _put_deltas(buf: bytearray, values: Sequence[int]) -> None:
+    previous = 0
+    for value in values:
+        _put_varint(buf, _zigzag(value - previous))
+        previous = value
+
+
+class _Reader:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.pos = 0
+
+    def varint(self) -> int:
+        result = shift = 0
+        data = self.data
+        while True:
+            if self.pos >= len(data):
+                raise RouteCodecError("truncated route blob")
+            byte = data[self.pos]
+            self.pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def bytes(self) -> bytes:
+        size = self.varint()
+        chunk = self.data[self.pos : self.pos + size]
+        if len(chunk) != size:
+            raise RouteCodecError("truncated route blob")
+        self.pos += size
+        return chunk
+
+    def deltas(self, count: int) -> List[int]:
+        values: List[int] = []
+        value = 0
+        for _ in range(count):
+            value += _unzigzag(self.varint())
+            values.append(value)
+        return values
+
+
+# Polylines -----------------------------------------------------------------------
+def encode_polyline(coords: Sequence[Tuple[float, float]], precision: int = 5) -> str:
+    """Google encoded polyline of ``(lat, lon)`` pairs at ``precision`` decimal digits."""
+    scale = 10**precision
+    chunks: List[str] = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        ilat, ilon = round(lat * scale), round(lon * scale)
+        for delta in (ilat - prev_lat, ilon - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        prev_lat, prev_lon = ilat, ilon
+    return "".join(chunks)
+
+
+def decode_polyline(text: str, precision: int = 5) -> List[Tuple[float, float]]:
+    scale = 10**precision
+    coords: List[Tuple[float, float]] = []
+    index = lat = lon = 0
+    while index < len(text):
+        pair = []
+        for _ in range(2):
+            result = shift = 0
+            while True:
+                if index >= len(text):
+                    raise RouteCodecError("truncated polyline")
+                byte = ord(text[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            pair.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += pair[0]
+        lon += pair[1]
+        coords.append((lat / scale, lon / scale))
+    return coords
+
+
+# Column typing -------------------------------------------------------------------
+def _decimals(values: Sequence[Any]) -> Optional[int]:
+    """Smallest number of decimals at which every value is exact, or ``None``."""
+    if not all(type(value) is float and value == value and abs(value) < 1e15 for value in values):
+        return None
+    return _precision(values, 0, MAX_DECIMALS)
+
+
+def _precision(values: Sequence[float], lowest: int, highest: int) -> Optional[int]:
+    """One pass: raise the precision whenever a value is not exact at the current one."""
+    precision = lowest
+    scale = 10**precision
+    for value in values:
+        while round(value * scale) / scale != value:
+            if precision == highest:
+                return None
+            precision += 1
+            scale *= 10
+    return precision
+
+
+def _epoch_seconds(values: Sequence[Any]) -> Optional[List[int]]:
+    seconds: List[int] = []
+    for value in values:
+        if type(value) is not str or len(value) != 19:
+            return None
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        if moment.tzinfo is not None or moment.isoformat(timespec="seconds") != value:
+            return None
+        seconds.append(int((moment - _EPOCH).total_seconds()))
+    return seconds
+
+
+def _path(values: Sequence[Any]) -> Optional[Tuple[int, str]]:
+    coords: List[Tuple[float, float]] = []
+    for value in values:
+        if type(value) is not dict or list(value) != ["x", "y"]:
+            return None
+        lon, lat = value["x"], value["y"]
+        if type(lat) is not float or type(lon) is not float:
+            return None
+        coords.append((lat, lon))
+    precision = _precision([part for coord in coords for part in coord], POLYLINE_MIN_PRECISION, POLYLINE_MAX_PRECISION)
+    if precision is None:
+        return None
+    return precision, encode_polyline(coords, precision)
+
+
+# Rows ----------------------------------------------------------------------------
+def encode_rows(rows: Sequence[Dict[str, Any]]) -> bytes:
+    """Encode a list of flat-ish dicts (JSON-serialisable values) column by column."""
+    keys: Dict[str, None] = {}
+    for row in rows:
+        keys.update(dict.fromkeys(row))
+
+    table: Dict[str, int] = {}
+    columns = bytearray()
+    for key in keys:
+        present = [index for index, row in enumerate(rows) if key in row]
+        values = [rows[index][key] for index in present]
+        _put_bytes(columns, key.encode("utf-8"))
+        _put_varint(columns, len(present))
+        if len(present) != len(rows):
+            bitmap = bytearray((len(rows) + 7) // 8)
+            for index in present:
+                bitmap[index >> 3] |= 1 << (index & 7)
+            columns.extend(bitmap)
+
+        if all(type(value) is int for value in values):
+            columns.append(INT)
+            _put_deltas(columns, values)
+            continue
+        decimals = _decimals(values)
+        if decimals is not None:
+            scale = 10**decimals
+            columns.append(DEC)
+            columns.append(decimals)
+            _put_deltas(columns, [round(value * scale) for value in values])
+            continue
+        seconds = _epoch_seconds(values)
+        if seconds is not None:
+            columns.append(TIME)
+            _put_deltas(columns, seconds)
+            continue
+        path = _path(values)
+        if path is not None:
+            columns.append(PATH)
+            columns.append(path[0])
+            _put_bytes(columns, path[1].encode("ascii"))
+            continue
+        columns.append(REF)
+        for value in values:
+            text = json.dumps(value, separators=(",", ":"), sort_keys=False)
+            _put_varint(columns, table.setdefault(text, len(table)))
+
+    body = bytearray()
+    _put_varint(body, len(rows))
+    _put_varint(body, len(table))
+    for text in table:
+        _put_bytes(body, text.encode("utf-8"))
+    _put_varint(body, len(keys))
+    body.extend(columns)
+    return MAGIC + bytes([VERSION]) + zlib.compress(bytes(body), ZLIB_LEVEL)
+
+
+def decode_rows(blob: bytes) -> List[Dict[str, Any]]:
+    if blob[:2] != MAGIC:
+        raise RouteCodecError("not a route blob")
+    if blob[2] != VERSION:
+        raise RouteCodecError(f"unsupported route blob version {blob[2]}")
+    try:
+        reader = _Reader(zlib.decompress(blob[3:]))
+    except zlib.error as exc:
+        raise RouteCodecError(str(exc)) from exc
+
+    count = reader.varint()
+    table = [json.loads(reader.bytes().decode("utf-8")) for _ in range(reader.varint())]
+    rows: List[Dict[str, Any]] = [{} for _ in range(count)]
+    for _ in range(reader.varint()):
+        key = reader.bytes().decode("utf-8")
+        present_count = reader.varint()
+        if present_count == count:
+            present = range(count)
+        else:
+            bitmap = reader.data[reader.pos : reader.pos + (count + 7) // 8]
+            reader.pos += len(bitmap)
+            present = [index for index in range(count) if bitmap[index >> 3] >> (index & 7) & 1]
+
+        kind = reader.data[reader.pos]
+        reader.pos += 1
+        values: List[Any]
+        if kind == INT:
+            values = reader.deltas(present_count)
+        elif kind == DEC:
+            scale = 10 ** reader.data[reader.pos]
+            reader.pos += 1
+            values = [value / scale for value in reader.deltas(present_count)]
+        elif kind == TIME:
+            values = [
+                (_EPOCH + timedelta(seconds=value)).isoformat(timespec="seconds") for value in reader.deltas(present_count)
+            ]
+        elif kind == PATH:
+            precision = reader.data[reader.pos]
+            reader.pos += 1
+            values = [{"x": lon, "y": lat} for lat, lon in decode_polyline(reader.bytes().decode("ascii"), precision)]
+        elif kind == REF:
+            # Each row gets its own copy of shared lists and dicts.
+            values = [_copy(table[reader.varint()]) for _ in range(present_count)]
+        else:
+            raise RouteCodecError(f"unknown column type {kind}")
+        for index, value in zip(present, values):
+            rows[index][key] = value
+    return rows
+
+
+def _copy(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        return json.loads(json.dumps(value))
+    return value
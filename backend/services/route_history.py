@@ -0,0 +1,163 @@
+"""
+Route history: every published route, stored compactly and readable again.
+
+``record_route`` adds a ``models.RouteRecord`` holding the route's inputs
+(hub and drone as planned, the stops or orders it served) and its steps.
+Stops and steps go through ``route_codec``: columns of delta-encoded
+numbers, a polyline path and a shared string table, about 5 % of the
+published JSON. That keeps months of routes small. ``steps_of`` returns
+the published steps exactly.
+
+``replay_schedule`` paces stored steps by their arrival offsets, sped up by
+a factor, for re-streaming a route over ``/ws``.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from backend import models
+from backend.services import route_codec, scheduling
+
+ROUTE_HISTORY_ENABLED = os.getenv("ROUTE_HISTORY_ENABLED", "1").lower() in {"1", "true", "yes", "on"}
+REPLAY_SPEED = float(os.getenv("ROUTE_REPLAY_SPEED", "60"))
+# Long recharges would stall a sped-up replay; no single wait is longer than this.
+REPLAY_MAX_GAP_S = float(os.getenv("ROUTE_REPLAY_MAX_GAP_S", "5"))
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def stop_rows(locations: Iterable[models.Location], weights_by_id: Dict[int, float]) -> List[Dict[str, Any]]:
+    """A targets route's inputs: its locations (ad-hoc ones included) and their weights."""
+    return [
+        {"id": loc.id, "name": loc.name, "lat": loc.lat, "lon": loc.lon, "weight_kg": float(weights_by_id.get(loc.id, 0.0))}
+        for loc in locations
+    ]
+
+
+def order_rows(orders: Iterable[models.Order]) -> List[Dict[str, Any]]:
+    """A dispatched route's inputs: the orders it carries."""
+    return [
+        {
+            "order_id": order.id,
+            "origin_id": order.origin_location_id,
+            "destination_id": order.destination_location_id,
+            "weight_kg": order.weight_kg,
+        }
+        for order in orders
+    ]
+
+
+def record_route(
+    session: Session,
+    source: str,
+    steps: Sequence[Dict[str, Any]],
+    station: models.Station,
+    drone: models.Drone,
+    stops: Sequence[Dict[str, Any]] = (),
+    started_at=None,
+) -> Optional[models.RouteRecord]:
+    """Add a history record for a published route; the caller commits. ``None`` when disabled or empty."""
+    if not ROUTE_HISTORY_ENABLED or not steps:
+        return None
+    meta = {
+        "hub": {"id": station.id, "name": station.name, "lat": station.lat, "lon": station.lon},
+        "drone": {
+            "id": drone.id,
+            "base_range_km": drone.base_range_km,
+            "max_payload_kg": drone.max_payload_kg,
+            "speed_kmh": drone.speed_kmh,
+        },
+    }
+    record = models.RouteRecord(
+        source=source,
+        county_id=station.county_id,
+        station_id=station.id,
+        drone_id=drone.id,
+        started_at=started_at,
+        stop_count=len(stops),
+        step_count=len(steps),
+        distance_km=float(steps[-1].get("cumulative_distance_km") or 0.0),
+        duration_s=scheduling.route_duration_s(steps),
+        meta=json.dumps(meta, separators=(",", ":")),
+        stops=route_codec.encode_rows(stops) if stops else None,
+        steps=route_codec.encode_rows(steps),
+    )
+    session.add(record)
+    return record
+
+
+def steps_of(record: models.RouteRecord) -> List[Dict[str, Any]]:
+    return route_codec.decode_rows(record.steps)
+
+
+def summary(record: models.RouteRecord) -> Dict[str, Any]:
+    return {
+        "id": record.id,
+        "created_at": record.created_at,
+        "source": record.source,
+        "county_id": record.county_id,
+        "station_id": record.station_id,
+        "drone_id": record.drone_id,
+        "started_at": record.started_at,
+        "stop_count": record.stop_count,
+        "step_count": record.step_count,
+        "distance_km": record.distance_km,
+        "duration_s": record.duration_s,
+        "stored_bytes": len(record.steps) + len(record.stops or b""),
+    }
+
+
+def detail(record: models.RouteRecord, include_steps: bool = True) -> Dict[str, Any]:
+    """Summary plus inputs, the visited names and the flown path (precision-5 polyline, from the hub)."""
+    meta = json.loads(record.meta) if record.meta else {}
+    steps = steps_of(record)
+    hub = meta.get("hub")
+    coords = [(hub["lat"], hub["lon"])] if hub else []
+    coords += [(step["coordinates"]["y"], step["coordinates"]["x"]) for step in steps if step.get("coordinates")]
+    result = summary(record)
+    result.update(
+        hub=hub,
+        drone=meta.get("drone"),
+        stops=route_codec.decode_rows(record.stops) if record.stops else [],
+        route=[step["next"] for step in steps if step.get("next") is not None],
+        path=route_codec.encode_polyline(coords),
+    )
+    if include_steps:
+        result["steps"] = steps
+    return result
+
+
+def list_routes(
+    session: Session,
+    limit: int = DEFAULT_PAGE_SIZE,
+    before_id: Optional[int] = None,
+    county_id: Optional[int] = None,
+    drone_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Newest-first summaries, keyset-paginated on id: pass the last id back as ``before_id``."""
+    record = models.RouteRecord
+    query = session.query(record)
+    if before_id is not None:
+        query = query.filter(record.id < before_id)
+    if county_id is not None:
+        query = query.filter(record.county_id == county_id)
+    if drone_id is not None:
+        query = query.filter(record.drone_id == drone_id)
+    return [summary(row) for row in query.order_by(record.id.desc()).limit(limit)]
+
+
+def replay_schedule(
+    steps: Iterable[Dict[str, Any]],
+    speed: float = REPLAY_SPEED,
+    max_gap_s: float = REPLAY_MAX_GAP_S,
+) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """``(seconds to wait, step)`` pairs: each step at its arrival, ``speed`` times faster than planned."""
+    previous_s = 0.0
+    for step in steps:
+        arrive_s = float(step.get("arrive_offset_s") or previous_s)
+        yield min(max(arrive_s - previous_s, 0.0) / speed, max_gap_s), step
+        previous_s = arrive_s
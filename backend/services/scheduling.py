@@ -0,0 +1,246 @@
+"""
+Time model for planned routes: leg durations, recharge durations, charging-pad
+occupancy at stations, and packing of many routes onto each drone's timeline.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from bisect import insort
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_SPEED_KMH = 60.0
+# Pad reservations that ended this long before a new request are dropped.
+STATION_SCHEDULE_RETENTION_S = float(os.getenv("STATION_SCHEDULE_RETENTION_S", "3600"))
+
+
+def leg_duration_s(distance_km: float, speed_kmh: Optional[float]) -> float:
+    """Flight time of one leg; falls back to ``DEFAULT_SPEED_KMH`` for unset speeds."""
+    speed = speed_kmh if speed_kmh and speed_kmh > 0 else DEFAULT_SPEED_KMH
+    return max(distance_km, 0.0) / speed * 3600.0
+
+
+@dataclass(frozen=True)
+class RechargeModel:
+    """Recharge time = fixed handling time + time proportional to the charge added."""
+
+    fixed_s: float = 120.0
+    seconds_per_pct: float = 30.0
+
+    def duration_s(self, from_pct: float, to_pct: float = 100.0) -> float:
+        added = max(0.0, min(to_pct, 100.0) - max(from_pct, 0.0))
+        return self.fixed_s + added * self.seconds_per_pct
+
+    @classmethod
+    def from_env(cls) -> "RechargeModel":
+        return cls(
+            fixed_s=float(os.getenv("RECHARGE_FIXED_S", cls.fixed_s)),
+            seconds_per_pct=float(os.getenv("RECHARGE_SECONDS_PER_PCT", cls.seconds_per_pct)),
+        )
+
+
+class StationSchedule:
+    """Charging-pad occupancy per station.
+
+    Each station has ``pads_per_station`` pads; ``reserve`` books the earliest
+    slot on any pad that starts no earlier than requested. Each ``reserve``
+    also drops the station's reservations that ended more than
+    ``retention_s`` before the requested time, so a long-running process
+    does not accumulate them.
+    """
+
+    def __init__(self, pads_per_station: int = 1, retention_s: float = STATION_SCHEDULE_RETENTION_S) -> None:
+        self.pads_per_station = max(1, int(pads_per_station))
+        self.retention = timedelta(seconds=max(0.0, retention_s))
+        self._lock = threading.Lock()
+        # station id -> per-pad sorted list of (start, end)
+        self._pads: Dict[int, List[List[Tuple[datetime, datetime]]]] = {}
+
+    def _station_pads(self, station_id: int) -> List[List[Tuple[datetime, datetime]]]:
+        pads = self._pads.get(station_id)
+        if pads is None:
+            pads = [[] for _ in range(self.pads_per_station)]
+            self._pads[station_id] = pads
+        return pads
+
+    @staticmethod
+    def _earliest_on_pad(intervals: Sequence[Tuple[datetime, datetime]], earliest: datetime, duration: timedelta) -> datetime:
+        start = earliest
+        for busy_start, busy_end in intervals:
+            if busy_end <= start:
+                continue
+            if start + duration <= busy_start:
+                break
+            start = max(start, busy_end)
+        return start
+
+    def reserve(self, station_id: int, earliest: datetime, duration_s: float) -> datetime:
+        """Book a pad for ``duration_s`` at or after ``earliest``; returns the slot start."""
+        duration = timedelta(seconds=duration_s)
+        with self._lock:
+            pads = self._station_pads(station_id)
+            self._prune_pads(pads, earliest - self.retention)
+            candidates = [(self._earliest_on_pad(pad, earliest, duration), index) for index, pad in enumerate(pads)]
+            start, index = min(candidates)
+            insort(pads[index], (start, start + duration))
+            return start
+
+    def release(self, station_id: int, start: datetime, duration_s: float) -> bool:
+        """Cancel a slot returned by ``reserve``; False if it is no longer booked."""
+        slot = (start, start + timedelta(seconds=duration_s))
+        with self._lock:
+            for pad in self._pads.get(station_id, ()):
+                if slot in pad:
+                    pad.remove(slot)
+                    return True
+        return False
+
+    def prune(self, before: datetime) -> None:
+        """Forget reservations that ended before ``before``."""
+        with self._lock:
+            for pads in self._pads.values():
+                self._prune_pads(pads, before)
+
+    def reservation_count(self, station_id: int) -> int:
+        with self._lock:
+            return sum(len(pad) for pad in self._pads.get(station_id, ()))
+
+    @staticmethod
+    def _prune_pads(pads: List[List[Tuple[datetime, datetime]]], before: datetime) -> None:
+        for pad in pads:
+            # Pads are sorted by start and never overlap, so ended intervals form a prefix.
+            ended = 0
+            while ended < len(pad) and pad[ended][1] < before:
+                ended += 1
+            if ended:
+                del pad[:ended]
+
+
+_default_schedule: Optional[StationSchedule] = None
+_default_schedule_lock = threading.Lock()
+
+
+def default_station_schedule() -> StationSchedule:
+    """Process-wide station occupancy shared by the live planners."""
+    global _default_schedule
+    with _default_schedule_lock:
+        if _default_schedule is None:
+            _default_schedule = StationSchedule(pads_per_station=int(os.getenv("STATION_CHARGING_PADS", "1")))
+        return _default_schedule
+
+
+class StepClock:
+    """Advances a drone's clock along a route and stamps each step with times."""
+
+    def __init__(
+        self,
+        speed_kmh: Optional[float],
+        start_time: Optional[datetime] = None,
+        recharge_model: Optional[RechargeModel] = None,
+        station_schedule: Optional[StationSchedule] = None,
+    ) -> None:
+        self.speed_kmh = speed_kmh
+        self.start_time = start_time
+        self.recharge_model = recharge_model or RechargeModel()
+        self.station_schedule = station_schedule
+        self.elapsed_s = 0.0
+        # (station id, slot start, duration) of every pad booked, so a caller can release them.
+        self.reservations: List[Tuple[int, datetime, float]] = []
+
+    def fly(self, distance_km: float) -> Dict[str, object]:
+        """Advance by one leg and return the timing fields for its step."""
+        depart_s = self.elapsed_s
+        self.elapsed_s += leg_duration_s(distance_km, self.speed_kmh)
+        fields: Dict[str, object] = {
+            "depart_offset_s": round(depart_s, 1),
+            "arrive_offset_s": round(self.elapsed_s, 1),
+        }
+        if self.start_time is not None:
+            fields["depart_at"] = _isoformat(self.start_time + timedelta(seconds=depart_s))
+            fields["arrive_at"] = _isoformat(self.start_time + timedelta(seconds=self.elapsed_s))
+        return fields
+
+    def recharge(self, station_id: int, battery_pct: float) -> Dict[str, object]:
+        """Wait for a free pad (if a schedule is set) and recharge to full."""
+        duration_s = self.recharge_model.duration_s(battery_pct)
+        wait_s = 0.0
+        if self.station_schedule is not None and self.start_time is not None:
+            arrival = self.start_time + timedelta(seconds=self.elapsed_s)
+            slot = self.station_schedule.reserve(station_id, arrival, duration_s)
+            self.reservations.append((station_id, slot, duration_s))
+            wait_s = (slot - arrival).total_seconds()
+        self.elapsed_s += wait_s + duration_s
+        fields: Dict[str, object] = {
+            "recharge_wait_s": round(wait_s, 1),
+            "recharge_s": round(duration_s, 1),
+            "ready_offset_s": round(self.elapsed_s, 1),
+        }
+        if self.start_time is not None:
+            fields["ready_at"] = _isoformat(self.start_time + timedelta(seconds=self.elapsed_s))
+        return fields
+
+
+def _isoformat(value: datetime) -> str:
+    return value.isoformat(timespec="seconds")
+
+
+@dataclass
+class RouteJob:
+    """A planned route waiting to be placed on its drone's timeline."""
+
+    route_id: str
+    drone_id: int
+    duration_s: float
+    ready_at: datetime
+    turnaround_s: float = 0.0
+
+
+@dataclass
+class ScheduledRoute:
+    route_id: str
+    drone_id: int
+    start: datetime
+    end: datetime
+
+
+@dataclass
+class FleetSchedule:
+    routes: List[ScheduledRoute] = field(default_factory=list)
+    drone_available_at: Dict[int, datetime] = field(default_factory=dict)
+
+    def makespan_s(self) -> float:
+        if not self.routes:
+            return 0.0
+        first = min(route.start for route in self.routes)
+        last = max(route.end for route in self.routes)
+        return (last - first).total_seconds()
+
+
+def route_duration_s(steps: Sequence[Dict[str, object]]) -> float:
+    """Total duration of a timed route (flight plus recharges)."""
+    if not steps:
+        return 0.0
+    last = steps[-1]
+    return float(last.get("ready_offset_s") or last.get("arrive_offset_s") or 0.0)
+
+
+def schedule_routes(
+    jobs: Sequence[RouteJob],
+    drone_available_at: Optional[Dict[int, datetime]] = None,
+) -> FleetSchedule:
+    """Pack routes onto each drone's timeline, earliest-ready first.
+
+    A drone flies one route at a time; a route starts once it is ready and the
+    drone has finished its previous route plus ``turnaround_s``.
+    """
+    available = dict(drone_available_at or {})
+    schedule = FleetSchedule()
+    for job in sorted(jobs, key=lambda item: (item.ready_at, item.route_id)):
+        start = max(job.ready_at, available.get(job.drone_id, job.ready_at))
+        end = start + timedelta(seconds=job.duration_s)
+        available[job.drone_id] = end + timedelta(seconds=job.turnaround_s)
+        schedule.routes.append(ScheduledRoute(job.route_id, job.drone_id, start, end))
+    schedule.drone_available_at = available
+    return schedule
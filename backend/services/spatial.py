@@ -0,0 +1,302 @@
+"""
+Uniform-grid spatial index with exact haversine refinement.
+
+Points go into square-ish cells of ``cell_km`` (longitude cells are widened
+by ``1 / cos(lat)`` at the reference latitude). A query visits cells in
+rings of growing Chebyshev distance around the query cell and measures the
+points it meets with ``planner_core.haversine_km``. It stops once a proven
+lower bound on the distance to any point in the next ring exceeds what is
+still wanted (the k-th best distance, or the radius), so answers are exactly
+those of a linear scan, ties broken by key, while only nearby cells are
+read.
+
+``GridIndex`` works on any hashable, orderable keys. ``PlaceIndex`` keeps
+one per table for ``Location`` and ``Station`` coordinates. It loads rows
+incrementally, by id above the last row it has seen, and ``place_index``
+shares one per database. Moved or deleted rows need ``rebuild``.
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import math
+import os
+import threading
+import weakref
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from backend import models
+from backend.services.planner_core import EARTH_RADIUS_KM, haversine_km
+
+logger = logging.getLogger("backend.spatial")
+
+Coord = Tuple[float, float]
+Cell = Tuple[int, int]
+Match = Tuple[float, Hashable]  # (distance_km, key)
+
+DEFAULT_CELL_KM = 2.0
+# Places cluster (towns, depots), so their cells are small: a snap within a few
+# hundred metres then reads a handful of cells holding a few dozen points.
+PLACE_CELL_KM = float(os.getenv("SPATIAL_CELL_KM", "0.25"))
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180.0
+# Lower bounds are shaved by this much so float rounding can never prune a real match.
+BOUND_SLACK = 1e-9
+
+
+class GridIndex:
+    """Points keyed by ``key`` in a uniform lat/lon grid; see the module docstring."""
+
+    def __init__(self, cell_km: float = DEFAULT_CELL_KM, ref_lat: Optional[float] = None) -> None:
+        if cell_km <= 0:
+            raise ValueError("cell_km must be positive")
+        self.cell_km = cell_km
+        self._ref_lat = ref_lat
+        self._cell_lat = cell_km / KM_PER_DEG_LAT
+        self._cell_lon = self._cell_lat
+        if ref_lat is not None:
+            self._set_ref(ref_lat)
+        self._cells: Dict[Cell, Set[Hashable]] = {}
+        self._points: Dict[Hashable, Coord] = {}
+        self._max_abs_lat = 0.0
+
+    def _set_ref(self, lat: float) -> None:
+        self._ref_lat = lat
+        self._cell_lon = self._cell_lat / max(math.cos(math.radians(lat)), 0.01)
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._points
+
+    def coord(self, key: Hashable) -> Coord:
+        return self._points[key]
+
+    def cell_of(self, lat: float, lon: float) -> Cell:
+        return (math.floor(lat / self._cell_lat), math.floor(lon / self._cell_lon))
+
+    def insert(self, key: Hashable, lat: float, lon: float) -> None:
+        """Add or move ``key``."""
+        if self._ref_lat is None:
+            self._set_ref(lat)
+        if key in self._points:
+            self.remove(key)
+        self._points[key] = (lat, lon)
+        self._cells.setdefault(self.cell_of(lat, lon), set()).add(key)
+        self._max_abs_lat = max(self._max_abs_lat, abs(lat))
+
+    def insert_many(self, items: Iterable[Tuple[Hashable, float, float]]) -> int:
+        count = 0
+        for key, lat, lon in items:
+            self.insert(key, lat, lon)
+            count += 1
+        return count
+
+    def remove(self, key: Hashable) -> None:
+        lat, lon = self._points.pop(key)
+        cell = self.cell_of(lat, lon)
+        members = self._cells[cell]
+        members.discard(key)
+        if not members:
+            del self._cells[cell]
+
+    # Queries ----------------------------------------------------------------------
+    def _ring_bound(self, ring: int, query_lat: float) -> float:
+        """Lower bound on the distance from the query to any point ``ring`` cells away.
+
+        Such a point is more than ``ring - 1`` cells away along one axis. Along
+        a meridian the distance is at least ``R * dlat``. Across longitudes the
+        haversine gives at least ``2R asin(cos(lat_max) sin(dlon / 2))``, with
+        ``lat_max`` the largest absolute latitude of the query or any point.
+        """
+        if ring <= 1:
+            return 0.0
+        dlat = math.radians((ring - 1) * self._cell_lat)
+        dlon = math.radians((ring - 1) * self._cell_lon)
+        cos_min = math.cos(math.radians(min(90.0, max(self._max_abs_lat, abs(query_lat)))))
+        across = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, cos_min * math.sin(min(dlon, math.pi) / 2)))
+        return min(EARTH_RADIUS_KM * dlat, across) * (1 - BOUND_SLACK) - BOUND_SLACK
+
+    def _ring_cells(self, center: Cell, ring: int) -> Iterator[Cell]:
+        ci, cj = center
+        if ring == 0:
+            yield center
+            return
+        for dj in range(-ring, ring + 1):
+            yield (ci - ring, cj + dj)
+            yield (ci + ring, cj + dj)
+        for di in range(-ring + 1, ring):
+            yield (ci + di, cj - ring)
+            yield (ci + di, cj + ring)
+
+    def _scan(self, lat: float, lon: float, limit_km: Callable[[], float]) -> Iterator[Tuple[float, Hashable]]:
+        """Points ring by ring until the next ring's bound exceeds ``limit_km()``."""
+        if not self._points:
+            return
+        center = self.cell_of(lat, lon)
+        ring = 0
+        seen_cells = 0
+        while seen_cells < len(self._cells):
+            if self._ring_bound(ring, lat) > limit_km():
+                return
+            if 8 * ring > len(self._cells):
+                # Sparse grid: cheaper to read the occupied cells left than to walk empty rings.
+                ci, cj = center
+                for cell, members in list(self._cells.items()):
+                    if max(abs(cell[0] - ci), abs(cell[1] - cj)) >= ring:
+                        for key in list(members):
+                            yield haversine_km((lat, lon), self._points[key]), key
+                return
+            for cell in self._ring_cells(center, ring):
+                members = self._cells.get(cell)
+                if members:
+                    seen_cells += 1
+                    for key in list(members):
+                        yield haversine_km((lat, lon), self._points[key]), key
+            ring += 1
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 1,
+        max_km: float = math.inf,
+        where: Optional[Callable[[Hashable, float], bool]] = None,
+    ) -> List[Match]:
+        """The ``k`` nearest points within ``max_km`` (and passing ``where``), nearest first."""
+        if k <= 0:
+            return []
+        best: List[Tuple[float, _Reversed]] = []  # max-heap on (distance, key) via negation
+
+        def limit() -> float:
+            return -best[0][0] if len(best) >= k else max_km
+
+        for dist, key in self._scan(lat, lon, limit):
+            if dist > max_km or (where is not None and not where(key, dist)):
+                continue
+            entry = (-dist, _Reversed(key))
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+        return sorted((-neg, wrapped.key) for neg, wrapped in best)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Match]:
+        """Every point within ``radius_km``, nearest first."""
+        return sorted(
+            (dist, key) for dist, key in self._scan(lat, lon, lambda: radius_km) if dist <= radius_km
+        )
+
+
+class _Reversed:
+    """Inverts key order inside the max-heap, so the larger key is evicted first on distance ties."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: Hashable) -> None:
+        self.key = key
+
+    def __lt__(self, other: "_Reversed") -> bool:
+        return other.key < self.key  # type: ignore[operator]
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Reversed) and other.key == self.key
+
+
+class PlaceIndex:
+    """``GridIndex`` per table for ``Location`` and ``Station``, loaded incrementally by id."""
+
+    TABLES = {"location": models.Location, "station": models.Station}
+
+    def __init__(self, cell_km: float = PLACE_CELL_KM) -> None:
+        self.cell_km = cell_km
+        self._lock = threading.RLock()
+        self._indexes: Dict[str, GridIndex] = {}
+        self._county: Dict[str, Dict[int, int]] = {}
+        self._last_id: Dict[str, int] = {}
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        with self._lock:
+            self._indexes = {kind: GridIndex(self.cell_km) for kind in self.TABLES}
+            self._county = {kind: {} for kind in self.TABLES}
+            self._last_id = {kind: 0 for kind in self.TABLES}
+
+    def refresh(self, session: Session) -> int:
+        """Load rows inserted since the last refresh; returns how many were added."""
+        added = 0
+        with self._lock:
+            for kind, model in self.TABLES.items():
+                rows = (
+                    session.query(model.id, model.lat, model.lon, model.county_id)
+                    .filter(model.id > self._last_id[kind])
+                    .order_by(model.id)
+                    .all()
+                )
+                for row_id, lat, lon, county_id in rows:
+                    self._indexes[kind].insert(row_id, lat, lon)
+                    self._county[kind][row_id] = county_id
+                if rows:
+                    self._last_id[kind] = rows[-1][0]
+                    added += len(rows)
+        if added:
+            logger.debug("Spatial index: %d new places", added)
+        return added
+
+    def nearest(
+        self,
+        session: Session,
+        kind: str,
+        lat: float,
+        lon: float,
+        k: int = 1,
+        max_km: float = math.inf,
+        county_id: Optional[int] = None,
+    ) -> List[Match]:
+        """The ``k`` nearest ``kind`` ids (``"location"``/``"station"``), optionally within one county."""
+        self.refresh(session)
+        with self._lock:
+            counties = self._county[kind]
+            where = None if county_id is None else (lambda key, _dist: counties.get(key) == county_id)
+            return self._indexes[kind].nearest(lat, lon, k=k, max_km=max_km, where=where)
+
+    def nearest_each(
+        self,
+        session: Session,
+        kind: str,
+        coords: Sequence[Coord],
+        max_km: float = math.inf,
+        county_id: Optional[int] = None,
+    ) -> List[Optional[Match]]:
+        """The nearest ``kind`` id for each coordinate (``None`` beyond ``max_km``), after one refresh."""
+        self.refresh(session)
+        with self._lock:
+            counties = self._county[kind]
+            where = None if county_id is None else (lambda key, _dist: counties.get(key) == county_id)
+            index = self._indexes[kind]
+            found: List[Optional[Match]] = []
+            for lat, lon in coords:
+                match = index.nearest(lat, lon, max_km=max_km, where=where)
+                found.append(match[0] if match else None)
+            return found
+
+    def within(self, session: Session, kind: str, lat: float, lon: float, radius_km: float) -> List[Match]:
+        self.refresh(session)
+        with self._lock:
+            return self._indexes[kind].within(lat, lon, radius_km)
+
+
+_place_indexes: "weakref.WeakKeyDictionary[Engine, PlaceIndex]" = weakref.WeakKeyDictionary()
+_place_lock = threading.Lock()
+
+
+def place_index(bind: Engine) -> PlaceIndex:
+    """The shared ``PlaceIndex`` for a database engine."""
+    with _place_lock:
+        index = _place_indexes.get(bind)
+        if index is None:
+            index = _place_indexes[bind] = PlaceIndex()
+        return index
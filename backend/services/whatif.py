@@ -0,0 +1,278 @@
+"""
+What-if route planning: many scenarios in one call, nothing published or stored.
+
+A scenario is a hub, a drone (optionally with its spec overridden), target
+stops with weights, and a safety margin. ``resolve_scenarios`` loads what
+every scenario names in a few batched queries and turns it into plain
+``Scenario`` values; ``evaluate_batch`` plans them with
+``planner_core.plan_route`` and returns per-scenario summaries (distance,
+recharges, duration), with the steps only on request.
+
+Scenarios over the same targets (the usual comparison: other drone, margin
+or hub) share one ``feasibility.DistanceMatrix``, so every distance is
+computed once per group instead of once per plan. Groups are independent;
+with more than one worker and enough work they are spread over a process
+pool that is started on first use and kept for later batches.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from backend import metrics, models
+from backend.services import feasibility, planner_core, scheduling
+
+logger = logging.getLogger("backend.whatif")
+
+MAX_SCENARIOS = int(os.getenv("WHATIF_MAX_SCENARIOS", "200"))
+WORKERS = int(os.getenv("WHATIF_WORKERS", "0"))  # 0: one per CPU
+# Below this much planning work (sum of stops squared) a batch runs in-process;
+# shipping it to the pool would cost more than it saves.
+PARALLEL_MIN_WORK = int(os.getenv("WHATIF_PARALLEL_MIN_WORK", "2000000"))
+LOOKUP_CHUNK = 500
+# Filling a group's matrix costs about as much as planning one scenario per this
+# many stops with the vector kernels; smaller groups plan independently.
+MATRIX_STOPS_PER_SCENARIO = 50
+
+RECHARGE_MODEL = scheduling.RechargeModel.from_env()
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class ScenarioSpec:
+    """A scenario as requested: ids into the database plus overrides."""
+
+    name: Optional[str] = None
+    county_id: Optional[int] = None
+    station_id: Optional[int] = None  # default: the county's first station
+    drone_id: Optional[int] = None  # default: the hub's first drone
+    base_range_km: Optional[float] = None
+    max_payload_kg: Optional[float] = None
+    speed_kmh: Optional[float] = None
+    targets: Tuple[int, ...] = ()
+    weights: Tuple[float, ...] = ()
+    safety_margin_ratio: float = 0.05
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """A resolved scenario: plain, picklable planner input."""
+
+    name: str
+    hub: planner_core.Hub
+    drone: planner_core.DroneSpec
+    stops: Tuple[planner_core.Stop, ...]
+    safety_margin_ratio: float = 0.05
+    # The drone the scenario is based on; ``drone.id`` is ``None`` when its spec is overridden.
+    drone_id: Optional[int] = None
+
+
+def _by_id(session: Session, model, ids: Sequence[int]) -> Dict[int, object]:
+    found: Dict[int, object] = {}
+    ids = sorted(set(ids))
+    for offset in range(0, len(ids), LOOKUP_CHUNK):
+        chunk = ids[offset : offset + LOOKUP_CHUNK]
+        found.update((row.id, row) for row in session.query(model).filter(model.id.in_(chunk)))
+    return found
+
+
+def resolve_scenarios(session: Session, specs: Sequence[ScenarioSpec]) -> List[Scenario]:
+    """Look up every hub, drone and target the specs name; raises ``ScenarioError`` on the first bad one."""
+    stations: Dict[int, models.Station] = _by_id(session, models.Station, [s.station_id for s in specs if s.station_id is not None])  # type: ignore[assignment]
+    county_ids = sorted({s.county_id for s in specs if s.station_id is None and s.county_id is not None})
+    county_hubs: Dict[int, models.Station] = {}
+    if county_ids:
+        for station in (
+            session.query(models.Station).filter(models.Station.county_id.in_(county_ids)).order_by(models.Station.id)
+        ):
+            county_hubs.setdefault(station.county_id, station)
+            stations[station.id] = station
+
+    drones: Dict[int, models.Drone] = _by_id(session, models.Drone, [s.drone_id for s in specs if s.drone_id is not None])  # type: ignore[assignment]
+    hub_drones: Dict[int, models.Drone] = {}
+    if stations:
+        for drone in (
+            session.query(models.Drone).filter(models.Drone.station_id.in_(list(stations))).order_by(models.Drone.id)
+        ):
+            hub_drones.setdefault(drone.station_id, drone)
+
+    locations: Dict[int, models.Location] = _by_id(session, models.Location, [t for s in specs for t in s.targets])  # type: ignore[assignment]
+
+    scenarios: List[Scenario] = []
+    for index, spec in enumerate(specs):
+        name = spec.name or f"scenario-{index}"
+        if spec.station_id is not None:
+            station = stations.get(spec.station_id)
+        elif spec.county_id is not None:
+            station = county_hubs.get(spec.county_id)
+        else:
+            raise ScenarioError(f"{name}: county_id or station_id is required")
+        if station is None:
+            raise ScenarioError(f"{name}: no such station or county without a station")
+
+        drone = drones.get(spec.drone_id) if spec.drone_id is not None else hub_drones.get(station.id)
+        if drone is None and None in (spec.base_range_km, spec.max_payload_kg):
+            raise ScenarioError(f"{name}: no such drone, and no full drone spec given")
+
+        missing = [target for target in spec.targets if target not in locations]
+        if missing:
+            raise ScenarioError(f"{name}: unknown target location ids {missing}")
+        if not spec.targets:
+            raise ScenarioError(f"{name}: no targets")
+        # Same semantics as a targets message: one stop per location, the last weight given wins.
+        weights: Dict[int, float] = {}
+        for position, target in enumerate(spec.targets):
+            weight = spec.weights[position] if position < len(spec.weights) else 0.0
+            weights[target] = float(weight)
+        stops = tuple(
+            planner_core.Stop(loc.id, loc.name, loc.lat, loc.lon, weights[loc.id])
+            for loc in (locations[target] for target in weights)
+        )
+
+        base_range_km = spec.base_range_km if spec.base_range_km is not None else drone.base_range_km  # type: ignore[union-attr]
+        max_payload_kg = spec.max_payload_kg if spec.max_payload_kg is not None else drone.max_payload_kg  # type: ignore[union-attr]
+        # The energy model is looked up by drone id; a calibration only describes the
+        # stored drone, so a changed range or payload plans with the spec model instead.
+        as_stored = drone is not None and (base_range_km, max_payload_kg) == (drone.base_range_km, drone.max_payload_kg)
+        scenarios.append(
+            Scenario(
+                name,
+                planner_core.Hub(station.id, station.name, station.lat, station.lon),
+                planner_core.DroneSpec(
+                    drone.id if as_stored else None,  # type: ignore[union-attr]
+                    base_range_km,
+                    max_payload_kg,
+                    spec.speed_kmh if spec.speed_kmh is not None else (drone.speed_kmh if drone else None),
+                ),
+                stops,
+                spec.safety_margin_ratio,
+                drone_id=spec.drone_id if spec.drone_id is not None else (drone.id if drone else None),
+            )
+        )
+    return scenarios
+
+
+def summarize(scenario: Scenario, steps: Sequence[Dict[str, object]], include_steps: bool = False) -> Dict[str, object]:
+    recharges = sum(1 for step in steps if "recharge_s" in step)
+    returns_home = bool(steps) and "recharge_s" not in steps[-1] and steps[-1]["next"] == scenario.hub.name
+    served = len(steps) - recharges - (1 if returns_home else 0)
+    summary: Dict[str, object] = {
+        "name": scenario.name,
+        "station_id": scenario.hub.id,
+        "drone_id": scenario.drone_id if scenario.drone_id is not None else scenario.drone.id,
+        "stops": len({stop.id for stop in scenario.stops}),
+        "served": served,
+        "unserved": len({stop.id for stop in scenario.stops}) - served,
+        "distance_km": float(steps[-1]["cumulative_distance_km"]) if steps else 0.0,  # type: ignore[arg-type]
+        "recharges": recharges,
+        "recharge_s": round(sum(float(step["recharge_s"]) for step in steps if "recharge_s" in step), 1),  # type: ignore[arg-type]
+        "duration_s": scheduling.route_duration_s(steps),
+    }
+    if include_steps:
+        summary["steps"] = list(steps)
+    return summary
+
+
+def evaluate(
+    scenario: Scenario,
+    include_steps: bool = False,
+    matrix: Optional[feasibility.DistanceMatrix] = None,
+) -> Dict[str, object]:
+    steps = planner_core.plan_route(
+        scenario.stops,
+        scenario.hub,
+        scenario.drone,
+        safety_margin_ratio=scenario.safety_margin_ratio,
+        recharge_model=RECHARGE_MODEL,
+        matrix=matrix,
+    )
+    return summarize(scenario, steps, include_steps)
+
+
+def evaluate_group(scenarios: Sequence[Scenario], include_steps: bool = False) -> List[Dict[str, object]]:
+    """Evaluate scenarios over the same targets, sharing one distance matrix when it pays off."""
+    matrix = None
+    stops = len(scenarios[0].stops) if scenarios else 0
+    if len(scenarios) > 1 and len(scenarios) * MATRIX_STOPS_PER_SCENARIO >= stops:
+        coords = [(s.hub.lat, s.hub.lon) for s in scenarios]
+        coords += [(stop.lat, stop.lon) for stop in scenarios[0].stops]
+        matrix = feasibility.DistanceMatrix(coords)
+    return [evaluate(scenario, include_steps, matrix) for scenario in scenarios]
+
+
+def group_scenarios(scenarios: Sequence[Scenario]) -> List[List[int]]:
+    """Indices of scenarios grouped by target set, in order of first appearance."""
+    groups: Dict[frozenset, List[int]] = {}
+    for index, scenario in enumerate(scenarios):
+        groups.setdefault(frozenset(stop.id for stop in scenario.stops), []).append(index)
+    return list(groups.values())
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def default_workers() -> int:
+    return WORKERS if WORKERS > 0 else (os.cpu_count() or 1)
+
+
+def _shared_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn" keeps the workers clear of the MQTT and dispatcher threads of a live process.
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+@metrics.timed(metrics.PLANNER_SECONDS, planner="whatif")
+def evaluate_batch(
+    scenarios: Sequence[Scenario],
+    include_steps: bool = False,
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> List[Dict[str, object]]:
+    """Summaries for ``scenarios``, in order."""
+    groups = group_scenarios(scenarios)
+    work = sum(len(scenario.stops) ** 2 for scenario in scenarios)
+    workers = max_workers or default_workers()
+    parallel = executor is not None or (workers > 1 and len(scenarios) > 1 and work >= PARALLEL_MIN_WORK)
+    if parallel:
+        # One group is the common case; split groups so every worker gets a share.
+        groups = [part for group in groups for part in _split(group, min(workers, len(group)))]
+    jobs = [[scenarios[index] for index in group] for group in groups]
+
+    if parallel:
+        pool = executor or _shared_pool(workers)
+        outputs = list(pool.map(evaluate_group, jobs, [include_steps] * len(jobs)))
+    else:
+        outputs = [evaluate_group(job, include_steps) for job in jobs]
+
+    results: List[Dict[str, object]] = [{} for _ in scenarios]
+    for group, output in zip(groups, outputs):
+        for index, summary in zip(group, output):
+            results[index] = summary
+    return results
+
+
+def _split(items: List[int], parts: int) -> List[List[int]]:
+    size = -(-len(items) // max(parts, 1))
+    return [items[offset : offset + size] for offset in range(0, len(items), size)]
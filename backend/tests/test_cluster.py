@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import cluster  # noqa: E402
+
+
+class Worker:
+    """One uvicorn worker's view: its role callbacks and local MQTT state."""
+
+    def __init__(self, store_path: str, name: str) -> None:
+        self.events: List[str] = []
+        self.version = 0
+        self.message: Dict[str, Any] = {}
+        self.route: List[Any] = []
+        self.cluster = cluster.Cluster(
+            cluster.ClusterStore(store_path),
+            on_elected=lambda: self.events.append("elected"),
+            on_demoted=lambda: self.events.append("demoted"),
+            state_source=self.state_since,
+            owner_id=name,
+            ttl_s=10.0,
+            sync_s=0.0,
+        )
+
+    def state_since(self, version: int) -> Optional[Tuple[int, Dict[str, Any], List[Any]]]:
+        if version == self.version:
+            return None
+        return self.version, dict(self.message), list(self.route)
+
+    def receive(self, message: Dict[str, Any], route: List[Any]) -> None:
+        self.message, self.route = message, route
+        self.version += 1
+
+
+def test_only_one_worker_owns_mqtt_and_the_lease_fails_over(tmp_path) -> None:
+    path = str(tmp_path / "cluster.db")
+    first, second = Worker(path, "w1"), Worker(path, "w2")
+
+    assert first.cluster.tick(now=100.0)
+    assert not second.cluster.tick(now=101.0)
+    # Renewal keeps the lease past the original expiry.
+    assert first.cluster.tick(now=105.0)
+    assert not second.cluster.tick(now=112.0)
+    assert first.events == ["elected"] and second.events == []
+
+    # The owner hangs: the lease expires and the other worker takes over.
+    assert second.cluster.tick(now=116.0)
+    assert second.events == ["elected"]
+    assert not first.cluster.tick(now=117.0)
+    assert first.events == ["elected", "demoted"]
+    assert second.cluster.store.holder(cluster.LEASE_NAME, now=117.0) == "w2"
+
+
+def test_stopping_the_owner_releases_the_lease(tmp_path) -> None:
+    path = str(tmp_path / "cluster.db")
+    first, second = Worker(path, "w1"), Worker(path, "w2")
+    first.cluster.tick()
+
+    first.cluster.stop()
+
+    assert first.events == ["elected", "demoted"]
+    assert second.cluster.tick()
+
+
+def test_followers_read_the_owners_latest_state(tmp_path) -> None:
+    path = str(tmp_path / "cluster.db")
+    owner, follower = Worker(path, "w1"), Worker(path, "w2")
+    owner.cluster.tick()
+    follower.cluster.tick()
+
+    owner.receive({"coordinates": {"x": 19.1, "y": 47.5}, "next": "A"}, ["A"])
+    owner.cluster.sync_state()
+    assert follower.cluster.shared_state() == ({"coordinates": {"x": 19.1, "y": 47.5}, "next": "A"}, ["A"])
+
+    owner.receive({"coordinates": {"x": 19.2, "y": 47.6}, "next": "B"}, ["A", "B"])
+    owner.cluster.sync_state()
+    owner.cluster.sync_state()  # unchanged: no write
+    assert follower.cluster.store.version(cluster.STATE_KEY) == 2
+    assert follower.cluster.shared_state()[1] == ["A", "B"]
+
+    # A new owner's own counter restarts, but followers still see its writes.
+    owner.cluster.stop()
+    follower.cluster.tick()
+    follower.receive({"next": "C"}, ["C"])
+    follower.cluster.sync_state()
+    late = Worker(path, "w3")
+    assert late.cluster.shared_state() == ({"next": "C"}, ["C"])
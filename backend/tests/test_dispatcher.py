@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import json
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import models  # noqa: E402
+from backend.benchmarks.synthetic import create_synthetic_database  # noqa: E402
+from backend.services import dispatcher, order_lifecycle, route_history, scheduling  # noqa: E402
+
+
+class RecordingClient:
+    def __init__(self) -> None:
+        self.messages: List[Dict[str, Any]] = []
+
+    def publish(self, topic: str, payload: str, *_args, **_kwargs) -> Any:
+        self.messages.append({"topic": topic, "payload": json.loads(payload)})
+
+        class Result:
+            rc = 0
+
+        return Result()
+
+
+class OfflineClient(RecordingClient):
+    """Accepts nothing, like paho while disconnected (MQTT_ERR_NO_CONN)."""
+
+    def publish(self, topic: str, payload: str, *_args, **_kwargs) -> Any:
+        class Result:
+            rc = 4
+
+        return Result()
+
+
+@pytest.fixture()
+def db():
+    database = create_synthetic_database(n_locations=8, n_orders=3, seed=11)
+    yield database
+    database.engine.dispose()
+
+
+def _dispatcher(db, client: RecordingClient, **window: Any) -> dispatcher.Dispatcher:
+    return dispatcher.Dispatcher(
+        db.session_factory,
+        lambda: client,
+        "dron/utvonal",
+        window=dispatcher.DispatchWindow(**window),
+        station_schedule=scheduling.StationSchedule(),
+    )
+
+
+def test_batch_trigger_windows() -> None:
+    window = dispatcher.DispatchWindow(max_wait_s=30, max_batch=4)
+    now = datetime(2024, 5, 1, 8, 0, 0)
+    assert dispatcher.batch_trigger(0, None, now, window) is None
+    assert dispatcher.batch_trigger(4, now, now, window) == "size"
+    assert dispatcher.batch_trigger(1, now - timedelta(seconds=10), now, window) is None
+    assert dispatcher.batch_trigger(1, now - timedelta(seconds=30), now, window) == "time"
+
+
+def test_time_window_dispatches_and_assigns_orders(db) -> None:
+    client = RecordingClient()
+    worker = _dispatcher(db, client, max_wait_s=60, max_batch=10)
+
+    assert worker.run_once(now=datetime.utcnow()) == []
+    assert client.messages == []
+
+    results = worker.run_once(now=datetime.utcnow() + timedelta(minutes=5))
+    assert len(results) == 1 and results[0].trigger == "time"
+    result = results[0]
+    handled = sorted(result.assigned + result.failed)
+    # FIFO, cut at the drone's payload limit.
+    assert handled and handled == list(range(1, len(handled) + 1))
+
+    payloads = [message["payload"] for message in client.messages]
+    assert payloads[-1] == {"route": result.route}
+    tagged = {order_id for step in payloads[:-1] for order_id in step.get("order_ids", [])}
+    assert tagged == set(result.assigned)
+
+    with db.session_factory() as session:
+        for order in session.query(models.Order):
+            if order.id in result.assigned:
+                assert order.status == order_lifecycle.ASSIGNED
+            elif order.id in result.failed:
+                assert order.status == order_lifecycle.FAILED
+            else:
+                assert order.status == order_lifecycle.PENDING
+        assigned = session.query(models.Order).filter(models.Order.status == order_lifecycle.ASSIGNED).first()
+        if assigned is not None:
+            assert [event.to_status for event in assigned.events] == ["planned", "assigned"]
+
+        records = session.query(models.RouteRecord).all()
+        assert len(records) == (1 if result.assigned else 0)
+        if records:
+            assert records[0].source == "dispatcher"
+            assert route_history.steps_of(records[0]) == payloads[:-1]
+
+
+def test_size_window_releases_at_most_one_batch(db) -> None:
+    client = RecordingClient()
+    worker = _dispatcher(db, client, max_wait_s=3600, max_batch=2)
+
+    results = worker.run_once(now=datetime.utcnow())
+    assert len(results) == 1 and results[0].trigger == "size"
+    handled = results[0].assigned + results[0].failed
+    assert 1 <= len(handled) <= 2
+
+    with db.session_factory() as session:
+        county_id = db.county_ids[0]
+        assert order_lifecycle.queue_depth(session, county_id) == 3 - len(handled)
+
+
+def test_routes_wait_for_their_drone(db) -> None:
+    client = RecordingClient()
+    worker = _dispatcher(db, client, max_wait_s=3600, max_batch=1)
+    worker.turnaround_s = 120.0
+    now = datetime.utcnow()
+
+    first = worker.run_once(now=now)[0]
+    assert first.start == now
+    if not first.assigned:
+        pytest.skip("first synthetic order is unreachable")
+    back_at = worker.drone_available_at[first.drone_id]
+    assert back_at > now + timedelta(seconds=120)
+
+    second = worker.run_once(now=now + timedelta(seconds=1))[0]
+    # The county's only drone is still out, so the next route starts when it is back.
+    assert second.drone_id == first.drone_id
+    assert second.start == back_at
+    if second.assigned:
+        first_step = client.messages[-len(second.route) - 1]["payload"]
+        assert first_step["depart_at"] == back_at.isoformat(timespec="seconds")
+
+
+def test_failed_publish_leaves_orders_planned_for_the_next_poll(db) -> None:
+    client: RecordingClient = OfflineClient()
+    worker = dispatcher.Dispatcher(
+        db.session_factory,
+        lambda: client,
+        "dron/utvonal",
+        window=dispatcher.DispatchWindow(max_wait_s=3600, max_batch=3),
+        station_schedule=scheduling.StationSchedule(),
+    )
+    now = datetime.utcnow()
+
+    result = worker.run_once(now=now)[0]
+    assert result.assigned == [] and result.route == []
+    assert result.unpublished
+    assert worker.drone_available_at == {}
+    with db.session_factory() as session:
+        statuses = {order.id: order.status for order in session.query(models.Order)}
+        assert {statuses[order_id] for order_id in result.unpublished} == {order_lifecycle.PLANNED}
+        assert session.query(models.RouteRecord).count() == 0
+
+    client = RecordingClient()
+    retried = worker.run_once(now=now + timedelta(seconds=5))[0]
+    assert sorted(retried.assigned) == sorted(result.unpublished)
+    assert client.messages[-1]["payload"] == {"route": retried.route}
+    with db.session_factory() as session:
+        assert session.query(models.RouteRecord).count() == 1
+
+
+def test_failed_publish_releases_its_charging_pads(db) -> None:
+    with db.session_factory() as session:
+        drone = session.query(models.Drone).first()
+        drone.base_range_km = 40.0  # the batch needs a recharge mid-route
+        station_id = drone.station_id
+        session.commit()
+    client: RecordingClient = OfflineClient()
+    worker = dispatcher.Dispatcher(
+        db.session_factory,
+        lambda: client,
+        "dron/utvonal",
+        window=dispatcher.DispatchWindow(max_wait_s=3600, max_batch=3),
+        station_schedule=scheduling.StationSchedule(),
+    )
+    now = datetime.utcnow()
+
+    booked: List[Any] = []
+    reserve = worker.station_schedule.reserve
+    with patch.object(worker.station_schedule, "reserve", lambda *args: booked.append(args) or reserve(*args)):
+        result = worker.run_once(now=now)[0]
+    assert result.unpublished and booked
+    assert worker.station_schedule.reservation_count(station_id) == 0
+
+    client = RecordingClient()
+    retried = worker.run_once(now=now + timedelta(seconds=5))[0]
+    assert sorted(retried.assigned) == sorted(result.unpublished)
+    assert worker.station_schedule.reservation_count(station_id) == len(booked)
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import json
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import optimizer_service  # noqa: E402
+from backend.benchmarks.synthetic import synthetic_route  # noqa: E402
+from backend.services import energy, planner_core, route_planner  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_calibration():
+    energy.set_calibration({})
+    yield
+    energy.set_calibration(None)
+
+
+def test_fit_recovers_known_coefficients() -> None:
+    rng = random.Random(7)
+    samples = []
+    for _ in range(200):
+        distance, payload = rng.uniform(0.5, 8.0), rng.uniform(0.0, 5.0)
+        used = distance * (2.0 + 0.15 * payload) + rng.gauss(0.0, 0.05)
+        samples.append(energy.Sample(distance, payload, used))
+
+    model, rmse = energy.fit_linear(samples)
+    assert model.a == pytest.approx(2.0, rel=0.02)
+    assert model.b == pytest.approx(0.15, rel=0.05)
+    assert rmse < 0.1
+
+    assert energy.fit_linear(samples[:5]) is None
+    # A single payload cannot separate b from a; the fallback b is kept.
+    flat = [energy.Sample(s.distance_km, 1.0, s.distance_km * 2.15) for s in samples]
+    model, _ = energy.fit_linear(flat, fallback_b=0.15)
+    assert (model.a, model.b) == (pytest.approx(2.0), 0.15)
+
+
+def test_samples_follow_recharges_and_routes() -> None:
+    steps = [
+        {"route": [], "drone_id": 1},
+        {"drone_id": 1, "distance_km": 2.0, "battery_pct": 90.0, "payload_kg": 1.0},
+        {"drone_id": 1, "distance_km": 3.0, "battery_pct": 80.0, "payload_kg": 0.5, "recharge_s": 600},
+        {"drone_id": 1, "distance_km": 1.0, "battery_pct": 97.0, "payload_kg": 0.0},
+        {"route": [], "drone_id": 1},
+        {"drone_id": 1, "distance_km": 4.0, "battery_pct": 50.0},
+    ]
+    samples = energy.samples_from_steps(steps)[1]
+    assert [(s.distance_km, s.payload_kg, s.used_pct) for s in samples] == [(3.0, 0.5, 10.0), (1.0, 0.0, 3.0)]
+
+
+def test_calibration_round_trips_planner_telemetry(tmp_path) -> None:
+    steps = []
+    for seed in range(4):
+        route = synthetic_route(80, seed=seed)
+        route.drone.base_range_km = 25.0
+        steps.append({"route": []})
+        steps.extend(route_planner.plan_route_with_recharges(route.locations, route.station, route.drone, route.weights))
+    telemetry = tmp_path / "telemetry.jsonl"
+    telemetry.write_text("\n".join(json.dumps(step, default=str) for step in steps), encoding="utf-8")
+    output = tmp_path / "calibration.json"
+
+    assert energy.main([str(telemetry), "-o", str(output)]) == 0
+    models = energy.load_calibration(str(output))
+    spec = energy.LinearEnergyModel.from_spec(25.0, route.drone.max_payload_kg)
+    fitted = models[route.drone.id]
+    # Battery is reported to 0.1 % and payloads are bucketed; close is enough.
+    assert fitted.a == pytest.approx(spec.a, rel=0.05)
+    assert fitted.pct_per_km(route.drone.max_payload_kg) == pytest.approx(
+        spec.pct_per_km(route.drone.max_payload_kg), rel=0.05
+    )
+
+
+def test_single_payload_telemetry_keeps_the_spec_b() -> None:
+    spec = energy.LinearEnergyModel.from_spec(25.0, 5.0)
+    steps = [{"route": []}]
+    battery = 100.0
+    for leg in range(30):
+        distance = 0.5 + leg % 4
+        battery -= distance * spec.pct_per_km(2.0)
+        step = {
+            "drone_id": 3,
+            "battery_pct": battery,
+            "distance_km": distance,
+            "payload_kg": 2.0,
+            "base_range_km": 25.0,
+            "max_payload_kg": 5.0,
+        }
+        if battery < 20.0:
+            step["recharge_s"] = 60.0
+            battery = 100.0
+        steps.append(step)
+
+    fitted = energy.calibrate(steps)[3]
+    # Every leg carried 2 kg, so a and b are not separable: b stays the spec's.
+    assert fitted["b"] == pytest.approx(spec.b)
+    assert fitted["a"] == pytest.approx(spec.a)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "not json",
+        "[]",
+        '{"drones": []}',
+        '{"drones": {"1": {"a": 4.0}}}',
+        '{"drones": {"1": {"a": null, "b": 0.1}}}',
+        '{"drones": {"1": ["a", "b"]}}',
+        '{"drones": {"x": {"a": 4.0, "b": 0.1}}}',
+    ],
+)
+def test_malformed_calibration_falls_back_to_the_spec(tmp_path, text) -> None:
+    path = tmp_path / "calibration.json"
+    path.write_text(text, encoding="utf-8")
+    assert energy.load_calibration(str(path)) == {}
+
+    energy.set_calibration(energy.load_calibration(str(path)))
+    assert energy.model_for(planner_core.DroneSpec(1, 20.0, 4.0)).capacity_km == pytest.approx(20.0)
+
+
+def test_bad_calibration_entries_do_not_drop_good_ones(tmp_path) -> None:
+    path = tmp_path / "calibration.json"
+    path.write_text('{"drones": {"1": {"a": 4.0, "b": 0.1}, "2": {"b": 0.2}}}', encoding="utf-8")
+    assert energy.load_calibration(str(path)) == {1: energy.LinearEnergyModel(4.0, 0.1)}
+
+
+def test_table_rounds_payload_up_to_its_bucket() -> None:
+    drone = planner_core.DroneSpec(1, 20.0, 4.0)
+    table = energy.model_for(drone)
+    spec = energy.LinearEnergyModel.from_spec(20.0, 4.0)
+    assert table.capacity_km == pytest.approx(20.0)
+    assert table is energy.model_for(planner_core.DroneSpec(1, 20.0, 4.0))
+    for payload in (0.0, 0.01, 0.9, 2.0, 3.99, 4.0, 6.0):
+        exact = spec.pct_per_km(payload) / spec.a
+        assert exact <= table.factor(payload) <= exact + 0.3 / energy.PAYLOAD_BUCKETS + 1e-12
+    assert table.range_km(4.0) == pytest.approx(20.0 / 1.3)
+    assert energy.model_for(planner_core.DroneSpec(2, 0.0, 4.0)) is energy.NO_RANGE
+
+
+def _order(order_id: int, km_east: float, weight: float) -> optimizer_service.OrderInput:
+    station = optimizer_service.PointInput(0, "Hub", 47.0, 19.0)
+    destination = optimizer_service.PointInput(order_id, f"D{order_id}", 47.0, 19.0 + km_east / 75.8)
+    return optimizer_service.OrderInput(order_id, station, destination, weight, None)
+
+
+def test_optimizer_uses_the_drones_model() -> None:
+    station = optimizer_service.PointInput(0, "Hub", 47.0, 19.0)
+    drone = optimizer_service.DroneInput(5, 20.0, 4.0)
+    # ~8.5 km out loaded, back empty: fits 20 km with 4 kg (8.5 * 1.3 + 8.5 = 19.6).
+    orders = (_order(1, 8.5, 4.0), _order(2, 8.5, 4.5), _order(3, 11.0, 0.5))
+    job = optimizer_service.CountyJob(1, station, drone, {}, orders)
+
+    plan = optimizer_service.plan_county_job(job)
+    assert [entry["order_id"] for entry in plan.planned_orders] == [1]
+    assert sorted(plan.too_far) == [2, 3]  # overweight; out of range
+    assert plan.planned_orders[0]["max_range_km"] == pytest.approx(20.0 / 1.3, abs=0.01)
+
+    # A calibrated drone that is lighter on its battery takes the long one too.
+    energy.set_calibration({5: energy.LinearEnergyModel(4.0, 0.0)})
+    plan = optimizer_service.plan_county_job(job)
+    assert sorted(entry["order_id"] for entry in plan.planned_orders) == [1, 3]
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.benchmarks.synthetic import synthetic_route  # noqa: E402
+from backend.services import feasibility, planner_core, route_planner  # noqa: E402
+from backend.services.planner_core import haversine_km  # noqa: E402
+
+pytest.importorskip("numpy")
+
+HUB = (47.4979, 19.0402)
+ARRAY_KERNELS = [name for name in feasibility.available_kernels() if name != "python"]
+
+
+def _kernel(name: str, coords, ids=None):
+    return feasibility.make_kernel(
+        coords,
+        [haversine_km(HUB, coord) for coord in coords],
+        [haversine_km(coord, HUB) for coord in coords],
+        ids or list(range(len(coords))),
+        haversine_km,
+        kernel=name,
+    )
+
+
+@pytest.mark.parametrize("name", ARRAY_KERNELS)
+def test_array_kernels_match_python_on_exact_borderline_budgets(name: str) -> None:
+    rng = random.Random(5)
+    coords = [(HUB[0] + rng.uniform(-0.3, 0.3), HUB[1] + rng.uniform(-0.3, 0.3)) for _ in range(200)]
+    # Duplicated points force exact ties between stops.
+    coords += coords[:20]
+    reference = _kernel("python", coords)
+    kernel = _kernel(name, coords)
+    assert kernel.name == name
+
+    for _ in range(50):
+        current = (HUB[0] + rng.uniform(-0.3, 0.3), HUB[1] + rng.uniform(-0.3, 0.3))
+        # A budget landing exactly on one stop's round trip is the worst case for float error.
+        pick = rng.randrange(len(coords))
+        exact = haversine_km(current, coords[pick]) + reference.back_km[pick]
+        for budget in (exact, exact - 1e-12, rng.uniform(0, 60)):
+            assert kernel.nearest_feasible(current, budget) == reference.nearest_feasible(current, budget)
+            assert kernel.any_round_trip_within(budget) == reference.any_round_trip_within(budget)
+
+
+@pytest.mark.parametrize("name", ARRAY_KERNELS)
+def test_planner_output_is_identical_across_kernels(name: str) -> None:
+    route = synthetic_route(150, seed=8)
+    route.drone.base_range_km = 25.0
+    stops = route_planner.stops_from_locations(route.locations, route.weights)
+    hub = route_planner.hub_from_station(route.station)
+    drone = route_planner.drone_spec(route.drone)
+
+    expected = planner_core.plan_route(stops, hub, drone, kernel="python")
+    assert planner_core.plan_route(stops, hub, drone, kernel=name) == expected
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import models, optimizer_service  # noqa: E402
+from backend.benchmarks.synthetic import create_synthetic_database  # noqa: E402
+from backend.services import fleet_replan  # noqa: E402
+
+
+def _statuses(session):
+    return [
+        (order.id, order.status, order.failure_reason, len(order.events))
+        for order in session.query(models.Order).order_by(models.Order.id)
+    ]
+
+
+def test_parallel_replan_matches_serial_per_county_planning() -> None:
+    serial_db = create_synthetic_database(n_locations=20, n_orders=25, seed=5, n_counties=4)
+    parallel_db = create_synthetic_database(n_locations=20, n_orders=25, seed=5, n_counties=4)
+    try:
+        with serial_db.session_factory() as session:
+            expected = {
+                county_id: optimizer_service.plan_orders_for_county(county_id, session)
+                for county_id in serial_db.county_ids
+            }
+            expected_statuses = _statuses(session)
+
+        with parallel_db.session_factory() as session:
+            jobs = fleet_replan.load_county_jobs(session)
+            # Workers only receive plain data.
+            assert all(isinstance(order, optimizer_service.OrderInput) for job in jobs for order in job.orders)
+            result = fleet_replan.replan_counties(session, max_workers=2)
+            assert result == expected
+            assert _statuses(session) == expected_statuses
+    finally:
+        serial_db.engine.dispose()
+        parallel_db.engine.dispose()
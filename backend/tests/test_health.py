@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import main, mqtt_bg  # noqa: E402
+from backend.local_broker import LocalBroker, LocalClient  # noqa: E402
+
+
+def test_import_defers_heavy_modules() -> None:
+    probe = (
+        "import sys, backend.main; "
+        "print(','.join(m for m in ('paho', 'jinja2', 'numpy', 'numba') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", probe], cwd=PROJECT_ROOT, check=True, capture_output=True, text=True)
+    assert out.stdout.strip() == ""
+
+
+def test_readiness_reports_db_and_mqtt_separately(monkeypatch) -> None:
+    monkeypatch.setattr(main, "engine", create_engine("sqlite://"))
+    monkeypatch.setattr(mqtt_bg.mqtt_outbox, "OUTBOX_ENABLED", False)
+    broker = LocalBroker()
+    broker.set_online(False)
+    client = TestClient(main.app)
+
+    # An unreachable broker must not block start(); the client keeps connecting in the background.
+    mqtt_bg.start(lambda: LocalClient(broker=broker))
+    try:
+        assert client.get("/healthz").json() == {"status": "ok"}
+
+        response = client.get("/readyz")
+        body = response.json()
+        assert response.status_code == 200
+        assert body["db"]["status"] == "ok"
+        assert body["mqtt"] == {"status": "connecting"}
+
+        monkeypatch.setattr(main, "READY_REQUIRES_MQTT", True)
+        assert client.get("/readyz").status_code == 503
+
+        broker.set_online(True)
+        response = client.get("/readyz")
+        assert response.status_code == 200
+        assert response.json()["mqtt"] == {"status": "connected"}
+    finally:
+        mqtt_bg.stop()
+
+    assert client.get("/readyz").json()["mqtt"] == {"status": "stopped"}
+
+
+def test_readiness_fails_without_database(monkeypatch) -> None:
+    monkeypatch.setattr(main, "engine", create_engine("sqlite:////nonexistent-dir/db.sqlite"))
+    response = TestClient(main.app).get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["db"]["status"] == "error"
+
+
+def test_shutdown_stops_the_mqtt_owner_without_cluster(monkeypatch) -> None:
+    calls = []
+    monkeypatch.setattr(main, "engine", create_engine("sqlite://"))
+    monkeypatch.setattr(main.cluster, "CLUSTER_ENABLED", False)
+    monkeypatch.setattr(main, "start_mqtt_owner", lambda: calls.append("start"))
+    monkeypatch.setattr(main, "stop_mqtt_owner", lambda: calls.append("stop"))
+
+    with TestClient(main.app):
+        assert calls == ["start"]
+    assert calls == ["start", "stop"]
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Any, List, Tuple
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.pool import StaticPool
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import init_db, models  # noqa: E402
+
+
+def _engine() -> Any:
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool, future=True)
+
+
+def _rows(bind: Any, table: Any, *columns: Any) -> List[Tuple[Any, ...]]:
+    with bind.connect() as conn:
+        return [tuple(row) for row in conn.execute(select(*columns).order_by(table.id))]
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch) -> None:
+    # Small RNG blocks so top-ups start in the middle of a block.
+    monkeypatch.setattr(init_db, "SEED_BLOCK", 8)
+
+
+def test_reference_seed_is_idempotent() -> None:
+    bind = _engine()
+    init_db.ensure_schema(bind, models.Base.metadata)
+    first = init_db.seed_reference_data(bind)
+    assert (first.counties, first.stations, first.drones) == (20, 20, 20)
+    assert first.locations == len(init_db.LOCATION_SEED)
+
+    again = init_db.seed_reference_data(bind)
+    assert again.as_dict() == init_db.SeedReport().as_dict()
+
+
+def test_bulk_seed_tops_up_to_targets_and_adds_synthetic_counties() -> None:
+    bind = _engine()
+    report = init_db.bulk_seed(bind, counties=22, locations_per_county=30, drones_per_county=3, orders_per_county=12)
+    assert report.counties == 22
+    with bind.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(models.Location)) == 22 * 30
+        assert conn.scalar(select(func.count()).select_from(models.Drone)) == 22 * 3
+        assert conn.scalar(select(func.count()).select_from(models.Order)) == 22 * 12
+        assert conn.scalar(select(func.count()).where(models.County.name.like("Synthetic %"))) == 2
+        orders = conn.execute(select(models.Order.origin_location_id, models.Order.county_id, models.Order.drone_id)).all()
+        location_county = dict(conn.execute(select(models.Location.id, models.Location.county_id)).all())
+    assert all(location_county[origin] == county_id and drone_id is not None for origin, county_id, drone_id in orders)
+
+    again = init_db.bulk_seed(bind, counties=22, locations_per_county=30, drones_per_county=3, orders_per_county=12)
+    assert (again.locations, again.drones, again.orders) == (0, 0, 0)
+
+
+def test_incremental_top_up_matches_single_run() -> None:
+    one_shot = _engine()
+    init_db.bulk_seed(one_shot, counties=2, locations_per_county=29, drones_per_county=5, seed=9)
+
+    stepped = _engine()
+    init_db.bulk_seed(stepped, counties=2, locations_per_county=13, drones_per_county=2, seed=9)
+    init_db.bulk_seed(stepped, counties=2, locations_per_county=29, drones_per_county=5, seed=9)
+
+    location_columns = (models.Location.county_id, models.Location.name, models.Location.lat, models.Location.lon)
+    locations = lambda bind: sorted(_rows(bind, models.Location, *location_columns))  # noqa: E731
+    assert locations(stepped) == locations(one_shot)
+    drones = lambda bind: sorted(_rows(bind, models.Drone, models.Drone.station_id, models.Drone.speed_kmh))  # noqa: E731
+    assert drones(stepped) == drones(one_shot)
+
+    other_seed = _engine()
+    init_db.bulk_seed(other_seed, counties=2, locations_per_county=29, seed=10)
+    assert locations(other_seed) != locations(one_shot)
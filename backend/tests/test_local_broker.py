@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import sys
+import threading
+from pathlib import Path
+from typing import List
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import local_broker  # noqa: E402
+from backend.local_broker import LocalBroker, LocalClient, LocalMessage  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    "subscription, topic, expected",
+    [
+        ("dron/utvonal", "dron/utvonal", True),
+        ("dron/utvonal", "dron/celpontok", False),
+        ("dron/+", "dron/utvonal", True),
+        ("dron/+", "dron/utvonal/1", False),
+        ("+/utvonal", "dron/utvonal", True),
+        ("dron/+/status", "dron/7/status", True),
+        ("dron/+/status", "dron/7/battery", False),
+        ("dron/#", "dron/utvonal/1/2", True),
+        ("dron/#", "dron", True),
+        ("#", "any/topic", True),
+        ("dron/utvonal/#", "dron/celpontok", False),
+        ("dron/utvonal", "dron", False),
+    ],
+)
+def test_topic_matches_wildcards(subscription: str, topic: str, expected: bool) -> None:
+    assert local_broker.topic_matches(subscription, topic) is expected
+
+
+def _client(broker: LocalBroker, **kwargs) -> LocalClient:
+    client = LocalClient(broker=broker, **kwargs)
+    client.connect()
+    return client
+
+
+def _drain(client: LocalClient) -> List[LocalMessage]:
+    received: List[LocalMessage] = []
+    client.on_message = lambda _client, _userdata, message: received.append(message)
+    while client.pending():
+        client.loop(timeout=0)
+    return received
+
+
+def test_publish_reaches_every_matching_subscriber() -> None:
+    broker = LocalBroker()
+    exact, wildcard, other = _client(broker), _client(broker), _client(broker)
+    exact.subscribe("dron/utvonal")
+    wildcard.subscribe("dron/#")
+    other.subscribe("dron/celpontok")
+    publisher = _client(broker)
+
+    info = publisher.publish("dron/utvonal", '{"route": []}')
+    assert info.rc == local_broker.MQTT_ERR_SUCCESS and info.is_published()
+
+    assert [message.payload for message in _drain(exact)] == [b'{"route": []}']
+    assert [message.topic for message in _drain(wildcard)] == ["dron/utvonal"]
+    assert _drain(other) == []
+    assert broker.stats() == {"published": 1, "delivered": 2, "dropped": 0}
+
+
+def test_full_subscriber_queue_drops_and_counts() -> None:
+    broker = LocalBroker()
+    slow = _client(broker, max_queued_messages=2)
+    fast = _client(broker)
+    slow.subscribe("t")
+    fast.subscribe("t")
+    publisher = _client(broker)
+
+    for index in range(5):
+        assert publisher.publish("t", index).rc == local_broker.MQTT_ERR_SUCCESS
+
+    # The publisher is not told; only the slow subscriber loses messages.
+    assert [message.payload for message in _drain(slow)] == [b"0", b"1"]
+    assert len(_drain(fast)) == 5
+    assert broker.stats() == {"published": 5, "delivered": 7, "dropped": 3}
+
+
+def test_offline_broker_refuses_publishes_until_back() -> None:
+    broker = LocalBroker()
+    subscriber = _client(broker)
+    subscriber.subscribe("t")
+    publisher = _client(broker)
+    events: List[str] = []
+    publisher.on_disconnect = lambda *_args: events.append("disconnect")
+    publisher.on_connect = lambda *_args: events.append("connect")
+
+    broker.set_online(False)
+    assert not publisher.is_connected()
+    assert publisher.publish("t", "lost").rc == local_broker.MQTT_ERR_NO_CONN
+    assert not broker.publish(LocalMessage(topic="t", payload=b"direct"))
+    with pytest.raises(ConnectionRefusedError):
+        LocalClient(broker=broker).connect()
+
+    broker.set_online(True)
+    assert events == ["disconnect", "connect"]
+    assert publisher.publish("t", "kept").rc == local_broker.MQTT_ERR_SUCCESS
+    assert [message.payload for message in _drain(subscriber)] == [b"kept"]
+    assert broker.stats()["published"] == 1
+
+
+def test_loop_thread_dispatches_and_retained_messages_replay() -> None:
+    broker = LocalBroker()
+    publisher = _client(broker)
+    publisher.publish("state", "last", retain=True)
+
+    subscriber = _client(broker)
+    received = threading.Event()
+    payloads: List[bytes] = []
+
+    def on_message(_client, _userdata, message) -> None:
+        payloads.append(message.payload)
+        received.set()
+
+    subscriber.on_message = on_message
+    subscriber.loop_start()
+    try:
+        subscriber.subscribe("state")
+        assert received.wait(2)
+    finally:
+        subscriber.loop_stop()
+    assert payloads == [b"last"]
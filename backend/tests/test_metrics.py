@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import contextvars
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import main, metrics  # noqa: E402
+
+
+@pytest.fixture()
+def metrics_on():
+    previous = metrics.enabled()
+    metrics.set_enabled(True)
+    metrics.REGISTRY.reset()
+    yield
+    metrics.REGISTRY.reset()
+    metrics.set_enabled(previous)
+
+
+def test_counter_and_gauge_render_labelled_series(metrics_on) -> None:
+    registry = metrics.Registry()
+    sent = registry.register(metrics.Counter("sent_total", "Messages sent.", ("topic",)))
+    depth = registry.register(metrics.Gauge("queue_depth", "Queued messages."))
+
+    sent.inc(topic="a")
+    sent.inc(2, topic="a")
+    sent.inc(0.5, topic='b"\n')
+    depth.set(5)
+    depth.dec(2)
+
+    assert sent.value(topic="a") == 3 and sent.value(topic="missing") == 0
+    assert registry.render() == (
+        "# HELP sent_total Messages sent.\n"
+        "# TYPE sent_total counter\n"
+        'sent_total{topic="a"} 3\n'
+        'sent_total{topic="b\\"\\n"} 0.5\n'
+        "# HELP queue_depth Queued messages.\n"
+        "# TYPE queue_depth gauge\n"
+        "queue_depth 3\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative_with_inf(metrics_on) -> None:
+    latency = metrics.Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.5, 0.1, 1.0))
+    for value in (0.05, 0.1, 0.3, 2.0):
+        latency.observe(value, route="/x")
+
+    assert latency.buckets == (0.1, 0.5, 1.0)
+    assert latency.count(route="/x") == 4
+    assert latency.render()[2:] == [
+        'latency_seconds_bucket{route="/x",le="0.1"} 2',
+        'latency_seconds_bucket{route="/x",le="0.5"} 3',
+        'latency_seconds_bucket{route="/x",le="1"} 3',
+        'latency_seconds_bucket{route="/x",le="+Inf"} 4',
+        'latency_seconds_sum{route="/x"} 2.45',
+        'latency_seconds_count{route="/x"} 4',
+    ]
+
+    with metrics.timer(latency, route="/t"):
+        pass
+    assert latency.count(route="/t") == 1
+
+    @metrics.timed(latency, route="/d")
+    def work() -> int:
+        return 7
+
+    assert work() == 7 and latency.count(route="/d") == 1
+
+
+def test_disabled_metrics_are_no_ops() -> None:
+    previous = metrics.enabled()
+    metrics.set_enabled(False)
+    try:
+        sent = metrics.Counter("sent_total", "Messages sent.")
+        depth = metrics.Gauge("queue_depth", "Queued messages.")
+        latency = metrics.Histogram("latency_seconds", "Latency.")
+        sent.inc()
+        depth.set(3)
+        latency.observe(0.2)
+        with metrics.timer(latency) as timing:
+            pass
+        items = [1, 2]
+        stopwatch = metrics.Stopwatch()
+
+        assert sent.value() == 0 and depth.value() == 0 and latency.count() == 0
+        assert timing is metrics._NOOP_TIMER
+        assert metrics.timed_iter(items, stopwatch) is items and stopwatch.elapsed == 0.0
+        assert sent.render() == ["# HELP sent_total Messages sent.", "# TYPE sent_total counter"]
+        assert TestClient(main.app).get("/metrics").status_code == 404
+    finally:
+        metrics.set_enabled(previous)
+
+
+def test_query_count_follows_the_context() -> None:
+    engine = create_engine("sqlite://")
+    metrics.install_query_counter(engine)
+    metrics.install_query_counter(engine)  # idempotent: still one listener
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))  # outside a counting context: ignored
+        token = metrics.begin_query_count()
+        for _ in range(3):
+            conn.execute(text("SELECT 1"))
+        # A copied context (another task) counts into its own box.
+        inner = contextvars.copy_context().run(_count_in_new_context, conn)
+        assert metrics.end_query_count(token) == 3
+    assert inner == 2
+    assert metrics.end_query_count(metrics.begin_query_count()) == 0
+    engine.dispose()
+
+
+def _count_in_new_context(conn) -> int:
+    token = metrics.begin_query_count()
+    conn.execute(text("SELECT 1"))
+    conn.execute(text("SELECT 2"))
+    return metrics.end_query_count(token)
+
+
+def test_metrics_endpoint_exposes_request_metrics(metrics_on) -> None:
+    client = TestClient(main.app)
+    assert client.get("/healthz").status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert "# TYPE http_requests_total counter" in body
+    assert 'http_requests_total{method="GET",route="/healthz",status="200"} 1' in body
+    assert 'http_request_seconds_bucket{method="GET",route="/healthz",le="+Inf"} 1' in body
+    assert 'db_queries_per_request_count{source="http"}' in body
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import json
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import metrics, mqtt_bg, mqtt_codec  # noqa: E402
+from backend.local_broker import LocalMessage  # noqa: E402
+
+
+def _message(payload, topic: str = mqtt_bg.MQTT_TOPIC) -> LocalMessage:
+    raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+    return LocalMessage(topic=topic, payload=raw)
+
+
+def test_route_topic_decoder_matches_every_kind_in_a_payload() -> None:
+    decoder = mqtt_bg._DECODERS[mqtt_bg.MQTT_TOPIC]
+    step = {"coordinates": {"x": 19.1, "y": 47.5}, "next": "A", "order_status": "delivered", "order_ids": [3]}
+
+    decoded = decoder.decode(json.dumps(step).encode("utf-8"))
+
+    assert decoded.kinds == ("step", "order_status")
+    assert decoded.payload == step
+    assert decoder.decode(b'  {"route": ["A", "B"]}').kinds == ("route",)
+    assert decoder.decode(b'{"heartbeat": 1}').kinds == ()
+
+
+@pytest.mark.parametrize(
+    "raw, reason",
+    [
+        (b"", "empty"),
+        (b"[1, 2]", "not_object"),
+        (b"{not json", "invalid_json"),
+        (b'{"coordinates": {"x": "19", "y": 47.5}}', "bad_coordinates"),
+        (b'{"route": "A,B"}', "bad_route"),
+        (b'{"order_status": "lost", "order_id": 1}', "bad_order_status"),
+        (b'{"order_status": "delivered", "order_ids": []}', "missing_order_id"),
+    ],
+)
+def test_route_topic_decoder_rejects_malformed_payloads(raw: bytes, reason: str) -> None:
+    with pytest.raises(mqtt_codec.DecodeError) as excinfo:
+        mqtt_bg._DECODERS[mqtt_bg.MQTT_TOPIC].decode(raw)
+    assert excinfo.value.reason == reason
+
+
+def test_targets_decoder_requires_targets_and_county() -> None:
+    decoder = mqtt_bg._DECODERS[mqtt_bg.MQTT_TOPIC_TARGETS]
+
+    assert decoder.decode(b'{"county_id": 1, "targets": [2, 3], "weights": [0.5, 1]}').kinds == ("targets",)
+    assert decoder.decode(b'{"county_id": 1, "targets": [2, {"lat": 47.5, "lon": 19.0}]}').kinds == ("targets",)
+    assert decoder.decode(b'{"county_id": "1", "targets": [2], "adhoc": false}').kinds == ("targets",)
+    assert mqtt_codec.is_id(3) and mqtt_codec.is_id("42")
+    assert not any(mqtt_codec.is_id(value) for value in (-1, True, 2.0, "\u00b2", "4a", None))
+    for raw, reason in (
+        (b'{"county_id": 1}', "missing_targets"),
+        (b'{"targets": [2]}', "missing_county"),
+        (b'{"county": "Pest", "targets": "2,3"}', "bad_targets"),
+        (b'{"county_id": 1, "targets": [{"lat": "47.5", "lon": 19.0}]}', "bad_targets"),
+        (b'{"county_id": 1, "targets": [{"lat": 147.5, "lon": 19.0}]}', "bad_targets"),
+        (b'{"county_id": 1, "targets": [2], "snap_km": "far"}', "bad_targets"),
+        (b'{"county_id": "abc", "targets": [2]}', "bad_targets"),
+        (b'{"county_id": [1], "targets": [2]}', "bad_targets"),
+        (b'{"county_id": true, "targets": [2]}', "bad_targets"),
+        (b'{"county": 7, "targets": [2]}', "bad_targets"),
+        (b'{"county_id": 1, "targets": [2], "adhoc": "false"}', "bad_targets"),
+    ):
+        with pytest.raises(mqtt_codec.DecodeError) as excinfo:
+            decoder.decode(raw)
+        assert excinfo.value.reason == reason
+
+
+def test_rejections_skip_handlers_and_are_rate_limited(monkeypatch, caplog) -> None:
+    handled = []
+    monkeypatch.setitem(mqtt_bg._HANDLERS, mqtt_bg.MQTT_TOPIC, {"step": handled.append, "route": handled.append, "order_status": handled.append})
+    monkeypatch.setattr(mqtt_bg, "_reject_log", mqtt_codec.RateLimitedLog(mqtt_bg.logger, interval_s=60.0))
+    rejected = metrics.MQTT_MESSAGES_REJECTED.value(topic=mqtt_bg.MQTT_TOPIC, reason="invalid_json") if metrics.enabled() else None
+
+    with caplog.at_level(logging.WARNING, logger="backend.mqtt_bg"):
+        for _ in range(50):
+            mqtt_bg._process_message(_message(b"{garbage" + b"x" * 1000))
+        mqtt_bg._process_message(_message({"coordinates": {"x": 19.0, "y": 47.0}}))
+
+    assert handled == [{"coordinates": {"x": 19.0, "y": 47.0}}]
+    warnings = [record for record in caplog.records if record.levelno == logging.WARNING]
+    assert len(warnings) == 1
+    assert "invalid_json" in warnings[0].getMessage()
+    assert len(warnings[0].getMessage()) < 400
+    if rejected is not None:
+        assert metrics.MQTT_MESSAGES_REJECTED.value(topic=mqtt_bg.MQTT_TOPIC, reason="invalid_json") == rejected + 50
+
+
+def test_rate_limited_log_reports_suppressed_count(caplog) -> None:
+    log = mqtt_codec.RateLimitedLog(logging.getLogger("backend.test"), interval_s=0.0)
+    limited = mqtt_codec.RateLimitedLog(logging.getLogger("backend.test"), interval_s=3600.0)
+
+    with caplog.at_level(logging.WARNING, logger="backend.test"):
+        assert log.warning(("a",), "first") and log.warning(("a",), "second")
+        assert limited.warning(("a",), "x") and not limited.warning(("a",), "x")
+        assert limited.warning(("b",), "other key")
+        limited._next_at[("a",)] = 0.0
+        assert limited.warning(("a",), "again")
+
+    assert caplog.messages[-1] == "again (1 similar suppressed)"
+
+
+def test_handler_errors_are_logged_not_raised(monkeypatch, caplog) -> None:
+    def broken(_payload):
+        raise ValueError("boom")
+
+    handled = []
+    monkeypatch.setitem(mqtt_bg._HANDLERS, mqtt_bg.MQTT_TOPIC, {"step": broken, "route": handled.append, "order_status": broken})
+    monkeypatch.setattr(mqtt_bg, "_reject_log", mqtt_codec.RateLimitedLog(mqtt_bg.logger, interval_s=60.0))
+
+    with caplog.at_level(logging.WARNING, logger="backend.mqtt_bg"):
+        for _ in range(3):
+            mqtt_bg._process_message(_message({"coordinates": {"x": 19.0, "y": 47.0}, "route": ["A"]}))
+
+    # The failing kind does not stop the next one, and repeats are rate limited.
+    assert handled == [{"coordinates": {"x": 19.0, "y": 47.0}, "route": ["A"]}] * 3
+    warnings = [record for record in caplog.records if record.levelno == logging.WARNING]
+    assert len(warnings) == 1 and "Handler step failed" in warnings[0].getMessage()
+    assert warnings[0].exc_info is not None
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import mqtt_outbox  # noqa: E402
+from backend.local_broker import LocalBroker, LocalClient  # noqa: E402
+
+TOPIC = "dron/utvonal"
+
+
+def _subscriber(broker: LocalBroker) -> List[str]:
+    received: List[str] = []
+    client = LocalClient(client_id="drone", broker=broker)
+    client.on_message = lambda _c, _u, msg: received.append(msg.payload.decode("utf-8"))
+    client.connect()
+    client.subscribe(TOPIC)
+    client.loop_start()
+    return received
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_messages_queued_while_broker_is_down_are_sent_in_order_after_reconnect() -> None:
+    broker = LocalBroker()
+    received = _subscriber(broker)
+    backend_client = LocalClient(client_id="backend", broker=broker)
+    outbox = mqtt_outbox.Outbox(lambda: backend_client, spool_path=None, retry_base_s=5.0)
+    backend_client.on_connect = lambda *_args: outbox.wake()
+    backend_client.connect()
+    outbox.start()
+    try:
+        broker.set_online(False)
+        results = [outbox.publish(TOPIC, f'{{"step": {i}}}') for i in range(5)]
+        assert all(result.rc == 0 for result in results)
+        time.sleep(0.1)
+        assert received == []
+        assert outbox.pending() == 5
+
+        # Reconnect wakes the sender long before the 5 s backoff would expire.
+        broker.set_online(True)
+        assert outbox.flush(timeout=2.0)
+        assert _wait_for(lambda: len(received) == 5)
+        assert received == [f'{{"step": {i}}}' for i in range(5)]
+    finally:
+        outbox.stop()
+
+
+def test_spool_survives_restart_and_is_truncated_once_sent(tmp_path) -> None:
+    spool = tmp_path / "outbox.jsonl"
+    broker = LocalBroker()
+    received = _subscriber(broker)
+    backend_client = LocalClient(client_id="backend", broker=broker)
+
+    first = mqtt_outbox.Outbox(lambda: None, spool_path=str(spool))
+    for i in range(3):
+        first.publish(TOPIC, f"m{i}")
+    first.stop()
+
+    second = mqtt_outbox.Outbox(lambda: backend_client, spool_path=str(spool))
+    assert second.pending() == 3
+    backend_client.connect()
+    second.start()
+    try:
+        assert second.flush(timeout=2.0)
+        assert _wait_for(lambda: len(received) == 3)
+        assert received == ["m0", "m1", "m2"]
+        assert spool.read_text(encoding="utf-8") == ""
+        assert second.publish(TOPIC, "m3").mid == 4
+    finally:
+        second.stop()
+
+
+def test_queue_is_bounded() -> None:
+    outbox = mqtt_outbox.Outbox(lambda: None, spool_path=None, max_messages=2)
+
+    assert outbox.publish(TOPIC, "a").rc == 0
+    assert outbox.publish(TOPIC, "b").rc == 0
+    assert outbox.publish(TOPIC, "c").rc == mqtt_outbox.MQTT_ERR_QUEUE_SIZE
+    assert outbox.pending() == 2
+
+
+class FlakyClient:
+    """Connected client whose publishes fail or are never acknowledged, on demand."""
+
+    def __init__(self, rc: int = 0, acked: bool = True) -> None:
+        self.rc = rc
+        self.acked = acked
+        self.sent: List[str] = []
+
+    def is_connected(self) -> bool:
+        return True
+
+    def publish(self, _topic: str, payload: str, qos: int = 0, retain: bool = False) -> Any:
+        client = self
+        self.sent.append(payload)
+
+        class Info:
+            rc = client.rc
+
+            def is_published(self) -> bool:
+                return client.acked
+
+        return Info()
+
+
+def test_failed_publishes_back_off_exponentially_then_drop() -> None:
+    client = FlakyClient(rc=4)
+    outbox = mqtt_outbox.Outbox(lambda: client, spool_path=None, retry_base_s=1.0, retry_max_s=4.0, max_attempts=4)
+    outbox.publish(TOPIC, "poison")
+    outbox.publish(TOPIC, "next")
+
+    waits = [outbox.step(now=float(t)) for t in (0, 1, 3, 7)]
+
+    assert waits == [1.0, 2.0, 4.0, 4.0]
+    assert client.sent == ["poison"] * 4
+    client.rc = 0
+    outbox.step(now=20.0)
+    assert client.sent[-1] == "next"
+    assert outbox.pending() == 0
+
+
+def test_unacknowledged_messages_are_resent_after_timeout() -> None:
+    client = FlakyClient(acked=False)
+    outbox = mqtt_outbox.Outbox(lambda: client, spool_path=None, max_inflight=2, ack_timeout_s=5.0)
+    for name in ("a", "b", "c"):
+        outbox.publish(TOPIC, name)
+
+    outbox.step(now=0.0)
+    assert client.sent == ["a", "b"]
+    outbox.step(now=1.0)
+    assert client.sent == ["a", "b"]
+
+    # Past the ack timeout, everything in flight is re-sent in order.
+    client.sent.clear()
+    outbox.step(now=6.0)
+    assert client.sent == ["a", "b"]
+
+    client.acked = True
+    outbox.step(now=7.0)
+    assert client.sent == ["a", "b", "c"]
+    assert outbox.pending() == 0
+
+
+def test_publish_after_stop_is_refused_not_raised(tmp_path) -> None:
+    spool = tmp_path / "outbox.jsonl"
+    outbox = mqtt_outbox.Outbox(lambda: None, spool_path=str(spool), retry_base_s=5.0)
+    outbox.start()
+    assert outbox.publish(TOPIC, "kept").rc == 0
+    outbox.stop()
+
+    result = outbox.publish(TOPIC, "late")
+    assert result.rc == mqtt_outbox.MQTT_ERR_NO_CONN
+    assert outbox.pending() == 1
+    assert [entry.payload for entry in mqtt_outbox.Spool(spool).load()] == ["kept"]
+
+
+def test_wake_reaches_the_sender_while_a_flush_waits() -> None:
+    broker = LocalBroker()
+    received = _subscriber(broker)
+    backend_client = LocalClient(client_id="backend", broker=broker)
+    backend_client.connect()
+    broker.set_online(False)
+    outbox = mqtt_outbox.Outbox(lambda: backend_client, spool_path=None, retry_base_s=5.0)
+    outbox.publish(TOPIC, "queued")
+
+    # The flush waiter sleeps on the condition first, then the sender backs off behind it.
+    waiter = threading.Thread(target=outbox.flush, kwargs={"timeout": 5.0})
+    waiter.start()
+    time.sleep(0.05)
+    outbox.start()
+    try:
+        time.sleep(0.05)
+        broker.set_online(True)
+        outbox.wake()
+        # A wakeup taken by the flush waiter would leave the sender asleep for 5 s.
+        assert _wait_for(lambda: received == ["queued"], timeout=1.0)
+        waiter.join()
+    finally:
+        outbox.stop()
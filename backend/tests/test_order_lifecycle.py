@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import text
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import models  # noqa: E402
+from backend.benchmarks.synthetic import create_synthetic_database  # noqa: E402
+from backend.services import order_lifecycle as lifecycle  # noqa: E402
+
+
+@pytest.fixture()
+def db():
+    database = create_synthetic_database(n_locations=10, n_orders=6, seed=7, n_counties=2)
+    yield database
+    database.engine.dispose()
+
+
+def test_transitions_record_events_and_reject_invalid_moves(db) -> None:
+    with db.session_factory() as session:
+        order = session.query(models.Order).first()
+        lifecycle.transition(session, order, lifecycle.PLANNED)
+        lifecycle.transition(session, order, lifecycle.ASSIGNED)
+        session.commit()
+
+        assert order.status == lifecycle.ASSIGNED
+        assert [(e.from_status, e.to_status) for e in order.events] == [
+            ("pending", "planned"),
+            ("planned", "assigned"),
+        ]
+        assert order.status_changed_at == order.events[-1].created_at
+
+        with pytest.raises(lifecycle.InvalidTransition):
+            lifecycle.transition(session, order, lifecycle.DELIVERED)
+
+
+def test_queue_returns_oldest_orders_of_one_county_and_status(db) -> None:
+    county_id = db.county_ids[0]
+    with db.session_factory() as session:
+        pending = lifecycle.next_orders(session, county_id, lifecycle.PENDING, limit=3)
+        assert len(pending) == 3
+        assert all(o.county_id == county_id and o.status == "pending" for o in pending)
+        assert [o.id for o in pending] == sorted(o.id for o in pending)
+
+        lifecycle.transition(session, pending[0], lifecycle.PLANNED)
+        session.commit()
+        assert lifecycle.queue_depth(session, county_id, lifecycle.PENDING) == 5
+        assert [o.id for o in lifecycle.next_orders(session, county_id, lifecycle.PLANNED)] == [pending[0].id]
+
+        plan = session.execute(
+            text(
+                "EXPLAIN QUERY PLAN SELECT id FROM orders WHERE county_id = :c AND status = 'pending' "
+                "ORDER BY created_at, id LIMIT 5"
+            ),
+            {"c": county_id},
+        ).fetchall()
+        assert "ix_orders_queue_pending" in " ".join(str(row) for row in plan)
+
+
+def test_telemetry_advances_orders_through_intermediate_states(db) -> None:
+    with db.session_factory() as session:
+        first, second = session.query(models.Order).order_by(models.Order.id).limit(2).all()
+        lifecycle.transition(session, first, lifecycle.PLANNED)
+        lifecycle.transition(session, first, lifecycle.ASSIGNED)
+        lifecycle.transition(session, second, lifecycle.PLANNED)
+        session.commit()
+
+        moved = lifecycle.apply_telemetry(session, {"order_id": first.id, "order_status": "in_flight"})
+        assert moved == [first.id] and first.status == lifecycle.IN_FLIGHT
+
+        moved = lifecycle.apply_telemetry(session, {"order_ids": [first.id, second.id], "order_status": "delivered"})
+        assert sorted(moved) == sorted([first.id, second.id])
+        assert second.status == lifecycle.DELIVERED
+        assert [e.to_status for e in second.events] == ["planned", "assigned", "in_flight", "delivered"]
+
+        assert lifecycle.apply_telemetry(session, {"order_id": first.id, "order_status": "in_flight"}) == []
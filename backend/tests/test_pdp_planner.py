@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import models  # noqa: E402
+from backend.services import energy, pdp_planner  # noqa: E402
+
+
+def _fixture(base_range_km: float = 60.0):
+    station = models.Station(id=1, county_id=1, name="Hub", lat=47.4979, lon=19.0402)
+    drone = models.Drone(id=1, station_id=1, base_range_km=base_range_km, max_payload_kg=5.0, speed_kmh=60.0)
+    loc = {
+        name: models.Location(id=index, name=name, county_id=1, lat=lat, lon=lon)
+        for index, (name, lat, lon) in enumerate(
+            [
+                ("A", 47.5190, 19.0220),
+                ("B", 47.5410, 19.0450),
+                ("C", 47.4740, 19.0470),
+                ("D", 47.5600, 19.0800),
+                ("E", 47.5300, 19.1000),
+            ],
+            start=10,
+        )
+    }
+    orders = [
+        pdp_planner.PdpOrder(1, loc["A"], loc["B"], 2.0),
+        pdp_planner.PdpOrder(2, loc["B"], loc["D"], 1.5),
+        pdp_planner.PdpOrder(3, loc["C"], loc["A"], 3.0),
+        pdp_planner.PdpOrder(4, loc["D"], loc["E"], 1.0),
+    ]
+    return orders, station, drone
+
+
+def _walk(plan):
+    """Replay pickups/drops, checking precedence and payload along the way."""
+    onboard = set()
+    for step in plan.steps:
+        for order_id in step.get("drops", []):
+            assert order_id in onboard, f"order {order_id} dropped before pickup"
+            onboard.remove(order_id)
+        onboard.update(step.get("pickups", []))
+    return onboard
+
+
+def test_chains_orders_with_precedence_and_payload_limit() -> None:
+    orders, station, drone = _fixture()
+    plan = pdp_planner.plan_pdp_route(orders, station, drone)
+
+    assert sorted(plan.served) == [1, 2, 3, 4]
+    assert plan.unserved == []
+    assert _walk(plan) == set()
+    assert all(float(step["payload_kg"]) <= drone.max_payload_kg for step in plan.steps)
+    assert plan.steps[-1]["next"] == "Hub"
+    # One chained sortie instead of four station round trips.
+    assert plan.total_km < 0.6 * pdp_planner.round_trip_km(orders, station)
+
+
+def test_short_range_never_strands_cargo() -> None:
+    orders, station, drone = _fixture(base_range_km=12.0)
+    plan = pdp_planner.plan_pdp_route(orders, station, drone)
+
+    assert sorted(plan.served + plan.unserved) == [1, 2, 3, 4]
+    assert _walk(plan) == set()
+    assert plan.steps[-1]["next"] == "Hub"
+
+
+def test_overweight_orders_are_unserved() -> None:
+    orders, station, drone = _fixture()
+    heavy = pdp_planner.PdpOrder(9, orders[0].pickup, orders[0].dropoff, 9.0)
+    plan = pdp_planner.plan_pdp_route([heavy, orders[0]], station, drone)
+
+    assert plan.served == [1]
+    assert plan.unserved == [9]
+
+
+def test_undeliverable_cargo_is_reported_as_stranded(monkeypatch) -> None:
+    energy.set_calibration({})
+    station = models.Station(id=1, county_id=1, name="Hub", lat=47.0, lon=19.0)
+    drone = models.Drone(id=1, station_id=1, base_range_km=20.0, max_payload_kg=5.0, speed_kmh=60.0)
+    pickup = models.Location(id=10, name="P", county_id=1, lat=47.001, lon=19.0)
+    far = models.Location(id=11, name="Far", county_id=1, lat=47.0 + 12.0 / 111.2, lon=19.0)
+    unreachable = models.Location(id=12, name="Moon", county_id=1, lat=48.0, lon=19.0)
+    orders = [pdp_planner.PdpOrder(1, pickup, far, 5.0), pdp_planner.PdpOrder(2, unreachable, far, 1.0)]
+    # An optimistic completion estimate (half the real cost) lets the planner pick up
+    # cargo that the real consumption cannot deliver.
+    completion_cost = pdp_planner._completion_cost
+    monkeypatch.setattr(pdp_planner, "_completion_cost", lambda *args: 0.5 * completion_cost(*args))
+
+    try:
+        plan = pdp_planner.plan_pdp_route(orders, station, drone)
+    finally:
+        energy.set_calibration(None)
+
+    assert plan.served == []
+    assert plan.stranded == [1]
+    assert plan.unserved == [2]
+    # Picked up, never dropped, and back at the hub with it.
+    assert _walk(plan) == {1}
+    assert plan.steps[-1]["next"] == "Hub"
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import pickle
+import sys
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.benchmarks.synthetic import synthetic_route  # noqa: E402
+from backend.services import planner_core, route_planner, scheduling  # noqa: E402
+
+T0 = datetime(2024, 5, 1, 8, 0, 0)
+
+
+def test_core_on_plain_data_matches_orm_adapter() -> None:
+    route = synthetic_route(60, seed=3)
+    route.drone.base_range_km = 25.0  # force a few recharges
+
+    stops = route_planner.stops_from_locations(route.locations, route.weights)
+    hub = route_planner.hub_from_station(route.station)
+    drone = route_planner.drone_spec(route.drone)
+    # Plain inputs survive a round trip to another process.
+    stops, hub, drone = pickle.loads(pickle.dumps((stops, hub, drone)))
+
+    core_steps = planner_core.plan_route(
+        stops, hub, drone, start_time=T0, station_schedule=scheduling.StationSchedule()
+    )
+    orm_steps = route_planner.plan_route_with_recharges(
+        route.locations,
+        route.station,
+        route.drone,
+        route.weights,
+        start_time=T0,
+        station_schedule=scheduling.StationSchedule(),
+    )
+
+    assert core_steps == orm_steps
+    assert any("recharge_s" in step for step in core_steps)
+    assert {step["next"] for step in core_steps} >= {stop.name for stop in stops}
+
+
+def test_plain_types_are_slotted() -> None:
+    stop = planner_core.Stop(1, "A", 47.0, 19.0, 1.5)
+    assert not hasattr(stop, "__dict__")
+    assert not hasattr(planner_core.DroneSpec(1, 30.0, 5.0), "__dict__")
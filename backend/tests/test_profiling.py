@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import main, profiling  # noqa: E402
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture()
+def admin(monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", TOKEN)
+    return {profiling.ADMIN_HEADER: TOKEN}
+
+
+def _profiled_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/work")
+    def work() -> dict:
+        return {"total": sum(i * i for i in range(2000))}
+
+    app.middleware("http")(profiling.profile_request_middleware)
+    profiling.install(app)
+    return app
+
+
+def _parked_worker(stop: threading.Event) -> None:
+    stop.wait(5)
+
+
+def test_sample_stacks_sees_other_threads_and_refuses_overlap() -> None:
+    stop = threading.Event()
+    thread = threading.Thread(target=_parked_worker, args=(stop,), name="parked")
+    thread.start()
+    try:
+        counts = profiling.sample_stacks(0.05, 0.005)
+        with profiling._sampling_lock:
+            with pytest.raises(profiling.ProfilerBusy):
+                profiling.sample_stacks(0.01)
+    finally:
+        stop.set()
+        thread.join()
+
+    parked = [stack for stack in counts if stack.startswith("thread:parked;")]
+    assert parked and all("_parked_worker (test_profiling.py:" in stack for stack in parked)
+    line = profiling.render_collapsed(counts).splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+
+def test_admin_endpoints_require_the_token(monkeypatch, admin) -> None:
+    client = TestClient(main.app)
+    assert client.get("/admin/profile", params={"seconds": 0.02}).status_code == 403
+    assert client.get("/admin/profile", params={"seconds": 0.02}, headers={profiling.ADMIN_HEADER: "nope"}).status_code == 403
+    assert client.get("/admin/profiles/1", headers={profiling.ADMIN_HEADER: "nope"}).status_code == 403
+
+    response = client.get("/admin/profile", params={"seconds": 0.02, "interval_ms": 5}, headers=admin)
+    assert response.status_code == 200
+    assert response.headers["content-disposition"].endswith('.collapsed"')
+    assert "thread:" in response.text
+
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "")
+    assert client.get("/admin/profile", params={"seconds": 0.02}, headers=admin).status_code == 404
+
+
+def test_profiled_request_report_is_served_once_stored(admin) -> None:
+    app_client = TestClient(_profiled_app())
+    plain = app_client.get("/work", headers={profiling.PROFILE_HEADER: "1"})
+    assert plain.status_code == 200 and "x-profile-id" not in plain.headers
+
+    for off in ("0", "false", ""):
+        declined = app_client.get("/work", headers={profiling.PROFILE_HEADER: off, **admin})
+        assert declined.status_code == 200 and "x-profile-id" not in declined.headers
+
+    response = app_client.get("/work", headers={profiling.PROFILE_HEADER: "1", **admin})
+    assert response.json() == {"total": sum(i * i for i in range(2000))}
+    profile_id = response.headers["x-profile-id"]
+
+    client = TestClient(main.app)
+    report = client.get(f"/admin/profiles/{profile_id}", headers=admin)
+    assert report.status_code == 200
+    # The threadpool worker's profile is merged in, so the sync endpoint shows up.
+    assert "function calls" in report.text and "(work)" in report.text
+    assert client.get("/admin/profiles/does-not-exist", headers=admin).status_code == 404
+
+
+def test_overlapping_profiled_requests_get_409(admin) -> None:
+    app_client = TestClient(_profiled_app())
+    with profiling._profiled_request_lock:
+        busy = app_client.get("/work", headers={profiling.PROFILE_HEADER: "1", **admin})
+        unprofiled = app_client.get("/work")
+    assert busy.status_code == 409
+    assert unprofiled.status_code == 200
+    assert app_client.get("/work", headers={profiling.PROFILE_HEADER: "1", **admin}).headers["x-profile-id"]
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import main, models, mqtt_bg  # noqa: E402
+from backend.benchmarks.synthetic import create_synthetic_database, synthetic_route  # noqa: E402
+from backend.db import get_session  # noqa: E402
+from backend.services import route_codec, route_history, route_planner, scheduling  # noqa: E402
+
+
+class RecordingClient:
+    def __init__(self, rc: int = 0) -> None:
+        self.messages: List[Dict[str, Any]] = []
+        self.rc = rc
+
+    def publish(self, topic: str, payload: str, *_args, **_kwargs) -> Any:
+        self.messages.append(json.loads(payload))
+
+        class Result:
+            rc = self.rc
+
+        return Result()
+
+
+@pytest.fixture()
+def db():
+    database = create_synthetic_database(n_locations=30, n_orders=0, seed=4, n_counties=1)
+    yield database
+    database.engine.dispose()
+
+
+@pytest.fixture()
+def client(db):
+    def session_override():
+        with db.session_factory() as session:
+            yield session
+
+    main.app.dependency_overrides[get_session] = session_override
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def test_polyline_matches_the_reference_encoding() -> None:
+    coords = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert route_codec.encode_polyline(coords) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert route_codec.decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@") == coords
+
+
+def test_steps_round_trip_at_a_fraction_of_the_json() -> None:
+    route = synthetic_route(200, seed=3)
+    for loc in route.locations:
+        loc.lat, loc.lon = round(loc.lat, 6), round(loc.lon, 6)
+    steps = route_planner.plan_route_with_recharges(
+        route.locations,
+        route.station,
+        route.drone,
+        route.weights,
+        start_time=datetime(2026, 1, 5, 8, 30),
+        recharge_model=scheduling.RechargeModel(),
+    )
+    assert any("recharge_s" in step for step in steps)
+    blob = route_codec.encode_rows(steps)
+    assert route_codec.decode_rows(blob) == steps
+    assert len(blob) < len(json.dumps(steps)) / 10
+
+    # Values that fit no compact column still come back exactly.
+    odd = [
+        {"a": 1, "b": 0.1 + 0.2, "c": True, "t": "2026-01-05T08:30:00+00:00", "p": {"x": 19.123456789012345, "y": 47.5}},
+        {"a": None, "b": 2.5, "l": [1, "x"], "t": "soon", "p": {"x": 19.0, "y": 47.5}},
+        {"c": False, "nested": {"k": [1.5, None]}},
+    ]
+    assert route_codec.decode_rows(route_codec.encode_rows(odd)) == odd
+    assert route_codec.decode_rows(route_codec.encode_rows([])) == []
+    with pytest.raises(route_codec.RouteCodecError):
+        route_codec.decode_rows(b"RC\x01not zlib")
+
+
+def test_targets_route_is_stored_and_replayed(client, db) -> None:
+    county_id = db.county_ids[0]
+    targets = db.location_ids[county_id][:12]
+    recorder = RecordingClient()
+    with patch.object(mqtt_bg, "SessionLocal", db.session_factory), patch.object(
+        mqtt_bg, "get_publisher", lambda: recorder
+    ):
+        mqtt_bg._handle_targets_payload({"county_id": county_id, "targets": targets, "weights": [0.2] * len(targets)})
+    published = recorder.messages[:-1]
+
+    listing = client.get("/api/routes", params={"county_id": county_id}).json()
+    assert [item["source"] for item in listing["items"]] == ["mqtt"]
+    route_id = listing["items"][0]["id"]
+    assert listing["items"][0]["stored_bytes"] < len(json.dumps(published)) / 3
+
+    stored = client.get(f"/api/routes/{route_id}").json()
+    assert stored["steps"] == published
+    assert stored["route"] == recorder.messages[-1]["route"]
+    assert sorted(stop["id"] for stop in stored["stops"]) == sorted(targets)
+    assert len(route_codec.decode_polyline(stored["path"])) == len(published) + 1
+    assert "steps" not in client.get(f"/api/routes/{route_id}", params={"include_steps": False}).json()
+    assert client.get("/api/routes/999999").status_code == 404
+
+    with patch.object(main, "SessionLocal", db.session_factory):
+        with client.websocket_connect(f"/ws?replay={route_id}&speed=1000000") as websocket:
+            replayed = [websocket.receive_json() for _ in published]
+            assert websocket.receive_json() == {"route": stored["route"]}
+        assert replayed == published
+
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            with client.websocket_connect("/ws?replay=999999") as websocket:
+                websocket.receive_json()
+        assert excinfo.value.code == 4404
+
+
+def test_unpublished_targets_route_is_not_stored(client, db) -> None:
+    county_id = db.county_ids[0]
+    targets = db.location_ids[county_id][:6]
+    refusing = RecordingClient(rc=4)
+    with patch.object(mqtt_bg, "SessionLocal", db.session_factory), patch.object(
+        mqtt_bg, "get_publisher", lambda: refusing
+    ):
+        mqtt_bg._handle_targets_payload({"county_id": county_id, "targets": targets, "weights": [0.2] * len(targets)})
+
+    assert refusing.messages
+    assert client.get("/api/routes", params={"county_id": county_id}).json()["items"] == []
+
+
+def test_replay_schedule_follows_arrivals() -> None:
+    steps = [
+        {"arrive_offset_s": 60.0},
+        {"arrive_offset_s": 180.0, "recharge_s": 900.0},
+        {"arrive_offset_s": 1200.0},
+        {"next": "no timing"},
+    ]
+    waits = [wait for wait, _ in route_history.replay_schedule(steps, speed=60, max_gap_s=5)]
+    assert waits == [1.0, 2.0, 5.0, 0.0]
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import models  # noqa: E402
+from backend.services import route_planner  # noqa: E402
+
+
+class RecordingClient:
+    def __init__(self) -> None:
+        self.messages: List[Dict[str, Any]] = []
+
+    def publish(self, topic: str, payload: str, *_args, **_kwargs) -> Any:
+        self.messages.append({"topic": topic, "payload": json.loads(payload)})
+
+        class Result:
+            rc = 0
+
+        return Result()
+
+
+def _fixture():
+    station = models.Station(id=1, county_id=1, name="Hub", lat=47.4979, lon=19.0402)
+    drone = models.Drone(id=1, station_id=1, base_range_km=60.0, max_payload_kg=5.0, speed_kmh=60.0)
+    locations = [
+        models.Location(id=10, name="A", county_id=1, lat=47.5190, lon=19.0220),
+        models.Location(id=11, name="B", county_id=1, lat=47.5410, lon=19.0450),
+        models.Location(id=12, name="C", county_id=1, lat=47.4740, lon=19.0470),
+        models.Location(id=13, name="D", county_id=1, lat=47.6737, lon=19.0716),
+    ]
+    weights = {10: 1.0, 11: 0.5, 12: 2.0, 13: 1.0}
+    return locations, station, drone, weights
+
+
+def test_generator_matches_list_planner() -> None:
+    locations, station, drone, weights = _fixture()
+    planned = route_planner.plan_route_with_recharges(locations, station, drone, weights)
+    streamed = list(route_planner.iter_route_with_recharges(locations, station, drone, weights))
+    assert streamed == planned
+    assert planned[-1]["next"] == "Hub"
+
+
+def test_first_step_is_published_before_planning_finishes() -> None:
+    locations, station, drone, weights = _fixture()
+    client = RecordingClient()
+    seen_before_next: List[int] = []
+
+    def observed():
+        for step in route_planner.iter_route_with_recharges(locations, station, drone, weights):
+            seen_before_next.append(len(client.messages))
+            yield step
+
+    names = route_planner.publish_route_stream(client, observed(), "dron/utvonal")
+
+    # Every step is handed to the publisher before the following one is computed.
+    assert seen_before_next == list(range(len(seen_before_next)))
+    assert client.messages[-1]["payload"] == {"route": names}
+    assert len(client.messages) == len(names) + 1
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import models  # noqa: E402
+from backend.services import route_planner, scheduling  # noqa: E402
+
+T0 = datetime(2024, 5, 1, 8, 0, 0)
+
+
+def test_station_pads_serialise_overlapping_recharges() -> None:
+    schedule = scheduling.StationSchedule(pads_per_station=1)
+    first = schedule.reserve(1, T0, 600)
+    second = schedule.reserve(1, T0 + timedelta(minutes=5), 600)
+    other_station = schedule.reserve(2, T0, 600)
+
+    assert first == T0
+    assert second == T0 + timedelta(minutes=10)
+    assert other_station == T0
+
+    two_pads = scheduling.StationSchedule(pads_per_station=2)
+    two_pads.reserve(1, T0, 600)
+    assert two_pads.reserve(1, T0, 600) == T0
+
+
+def test_reserve_drops_expired_reservations() -> None:
+    schedule = scheduling.StationSchedule(pads_per_station=1, retention_s=3600)
+    for minutes in (0, 30, 60):
+        schedule.reserve(1, T0 + timedelta(minutes=minutes), 600)
+    schedule.reserve(2, T0, 600)
+    assert schedule.reservation_count(1) == 3
+
+    # Booking at T0+5h forgets everything that ended before T0+4h, on that station only.
+    assert schedule.reserve(1, T0 + timedelta(hours=5), 600) == T0 + timedelta(hours=5)
+    assert schedule.reservation_count(1) == 1
+    assert schedule.reservation_count(2) == 1
+
+    schedule.prune(T0 + timedelta(hours=6))
+    assert schedule.reservation_count(1) == 0 and schedule.reservation_count(2) == 0
+
+
+def test_schedule_routes_packs_each_drone_sequentially() -> None:
+    jobs = [
+        scheduling.RouteJob("a", drone_id=1, duration_s=1800, ready_at=T0),
+        scheduling.RouteJob("b", drone_id=1, duration_s=600, ready_at=T0, turnaround_s=300),
+        scheduling.RouteJob("c", drone_id=2, duration_s=900, ready_at=T0 + timedelta(minutes=5)),
+    ]
+    plan = scheduling.schedule_routes(jobs)
+    by_id = {route.route_id: route for route in plan.routes}
+
+    assert by_id["a"].start == T0
+    assert by_id["b"].start == by_id["a"].end
+    assert by_id["c"].start == T0 + timedelta(minutes=5)
+    assert plan.drone_available_at[1] == by_id["b"].end + timedelta(seconds=300)
+
+
+def test_planner_stamps_times_and_recharge_waits() -> None:
+    station = models.Station(id=7, county_id=1, name="Hub", lat=47.0, lon=19.0)
+    drone = models.Drone(id=1, station_id=7, base_range_km=30.0, max_payload_kg=5.0, speed_kmh=60.0)
+    locations = [
+        models.Location(id=1, name="North", county_id=1, lat=47.1, lon=19.0),
+        models.Location(id=2, name="South", county_id=1, lat=46.9, lon=19.0),
+    ]
+    schedule = scheduling.StationSchedule(pads_per_station=1)
+    # Another drone already occupies the only pad for the first hour.
+    schedule.reserve(7, T0, 3600)
+    model = scheduling.RechargeModel(fixed_s=60.0, seconds_per_pct=10.0)
+
+    steps = route_planner.plan_route_with_recharges(
+        locations,
+        station,
+        drone,
+        {1: 0.0, 2: 0.0},
+        start_time=T0,
+        recharge_model=model,
+        station_schedule=schedule,
+    )
+
+    recharge_steps = [step for step in steps if "recharge_s" in step]
+    assert recharge_steps, "the short range should force a recharge"
+    recharge = recharge_steps[0]
+    assert recharge["recharge_wait_s"] > 0
+    assert recharge["recharge_s"] == round(model.duration_s(float(recharge["battery_pct"])), 1)
+
+    following = steps[steps.index(recharge) + 1]
+    assert following["depart_offset_s"] == recharge["ready_offset_s"]
+    assert following["depart_at"] == recharge["ready_at"]
+    first_leg_s = scheduling.leg_duration_s(float(steps[0]["distance_km"]), 60.0)
+    assert steps[0]["arrive_offset_s"] == pytest.approx(first_leg_s, abs=0.5)
+    assert scheduling.route_duration_s(steps) == steps[-1]["arrive_offset_s"]
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import models  # noqa: E402
+from backend.benchmarks.synthetic import create_synthetic_database  # noqa: E402
+from backend.services import dispatcher, order_lifecycle  # noqa: E402
+from simulator import engine  # noqa: E402
+
+
+@pytest.fixture()
+def db():
+    database = create_synthetic_database(n_locations=10, n_orders=0, seed=5, n_counties=2)
+    yield database
+    database.engine.dispose()
+
+
+def test_generated_orders_are_seeded_and_sorted(db) -> None:
+    first = engine.generate_orders(db.session_factory, 6.0, 7200.0, seed=3)
+    again = engine.generate_orders(db.session_factory, 6.0, 7200.0, seed=3)
+
+    assert first == again
+    assert first
+    assert [arrival.at_s for arrival in first] == sorted(arrival.at_s for arrival in first)
+    assert all(0.0 < arrival.at_s < 7200.0 for arrival in first)
+
+
+def test_simulation_flies_dispatched_routes_to_delivery(db) -> None:
+    county_id = db.county_ids[0]
+    origin, destination = db.location_ids[county_id][:2]
+    arrivals = [engine.OrderArrival(at_s * 60.0, origin, destination, 0.5) for at_s in range(4)]
+    simulation = engine.Simulation(
+        db.session_factory,
+        arrivals,
+        window=dispatcher.DispatchWindow(max_wait_s=300.0, max_batch=10, poll_interval_s=30.0),
+        speedup=None,
+    )
+
+    report = simulation.run(duration_s=3600.0)
+
+    assert report.orders_created == 4
+    assert report.orders_delivered == 4
+    assert report.orders_open == 0
+    assert report.routes >= 1
+    # Dispatch waits are bounded by the time window plus one poll.
+    assert all(0.0 <= wait <= 330.0 for wait in report.dispatch_wait_s)
+    assert all(latency > wait for latency, wait in zip(report.delivery_s, report.dispatch_wait_s))
+
+    with db.session_factory() as session:
+        events = (
+            session.query(models.OrderEvent)
+            .filter(models.OrderEvent.to_status == order_lifecycle.DELIVERED)
+            .all()
+        )
+    # Lifecycle events carry simulated, not wall-clock, time.
+    assert len(events) == 4
+    assert all(engine.SIM_EPOCH < event.created_at < engine.SIM_EPOCH + timedelta(hours=2) for event in events)
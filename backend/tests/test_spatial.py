@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import models, mqtt_bg  # noqa: E402
+from backend.benchmarks.synthetic import create_synthetic_database  # noqa: E402
+from backend.services import spatial  # noqa: E402
+from backend.services.planner_core import haversine_km  # noqa: E402
+
+
+def _brute(points, query, k=None, radius=None):
+    found = sorted((haversine_km(query, coord), key) for key, coord in points.items())
+    if radius is not None:
+        return [match for match in found if match[0] <= radius]
+    return found[:k]
+
+
+@pytest.mark.parametrize("cell_km", [0.2, 2.0, 50.0])
+def test_grid_answers_match_a_linear_scan(cell_km: float) -> None:
+    rng = random.Random(3)
+    points = {i: (47.0 + rng.uniform(-1.5, 1.5), 19.0 + rng.uniform(-3.0, 3.0)) for i in range(600)}
+    for i in range(20):  # exact ties
+        points[1000 + i] = points[i]
+    index = spatial.GridIndex(cell_km)
+    index.insert_many((key, lat, lon) for key, (lat, lon) in points.items())
+
+    for step in range(60):
+        query = (47.0 + rng.uniform(-2.0, 2.0), 19.0 + rng.uniform(-4.0, 4.0))
+        if step % 3 == 0:
+            query = points[rng.randrange(20)]
+        k = rng.choice([1, 3, 10])
+        assert index.nearest(*query, k=k) == _brute(points, query, k=k)
+        radius = rng.uniform(0.5, 40.0)
+        assert index.within(*query, radius) == _brute(points, query, radius=radius)
+        if step % 2:
+            # Points leave (as stops are served); answers follow.
+            gone = rng.choice(sorted(points))
+            index.remove(gone)
+            del points[gone]
+
+    odd = index.nearest(47.0, 19.0, k=2, where=lambda key, _dist: key % 2 == 1)
+    assert odd == [match for match in _brute(points, (47.0, 19.0)) if match[1] % 2 == 1][:2]
+    assert index.nearest(47.0, 19.0, max_km=0.0) == [match for match in _brute(points, (47.0, 19.0), k=1) if match[0] == 0.0]
+
+
+def test_place_index_picks_up_inserts() -> None:
+    db = create_synthetic_database(n_locations=30, n_orders=0, seed=2, n_counties=2)
+    try:
+        with db.session_factory() as session:
+            places = spatial.place_index(db.engine)
+            assert spatial.place_index(db.engine) is places
+            stations = session.query(models.Station).all()
+            hub = stations[1]
+            nearest = places.nearest(session, "station", hub.lat + 0.01, hub.lon)
+            assert nearest[0][1] == hub.id
+
+            locations = session.query(models.Location).all()
+            query = (locations[0].lat + 0.003, locations[0].lon - 0.002)
+            expected = sorted((haversine_km(query, (loc.lat, loc.lon)), loc.id) for loc in locations)
+            assert places.nearest(session, "location", *query, k=5) == expected[:5]
+
+            county_id = db.county_ids[1]
+            in_county = places.nearest(session, "location", *query, k=1, county_id=county_id)
+            assert session.get(models.Location, in_county[0][1]).county_id == county_id
+
+            added = models.Location(name="Uj pont", county_id=county_id, lat=query[0], lon=query[1])
+            session.add(added)
+            session.commit()
+            assert places.nearest(session, "location", *query) == [(0.0, added.id)]
+            assert (0.0, added.id) in places.within(session, "location", *query, 1.0)
+    finally:
+        db.engine.dispose()
+
+
+def test_targets_payload_snaps_coordinates_to_locations() -> None:
+    db = create_synthetic_database(n_locations=40, n_orders=0, seed=6, n_counties=2)
+    try:
+        with db.session_factory() as session:
+            county_id = db.county_ids[0]
+            locations = session.query(models.Location).filter(models.Location.county_id == county_id).order_by(models.Location.id).all()
+            near, by_id, by_name = locations[3], locations[5], locations[7]
+            payload = {
+                "county_id": county_id,
+                "targets": [
+                    {"lat": near.lat + 0.0005, "lon": near.lon},  # ~55 m off: snaps
+                    by_id.id,
+                    by_name.name,
+                    {"lat": near.lat + 0.5, "lon": near.lon, "name": "Mezo"},  # far from everything
+                ],
+                "weights": [0.5, 0.25, 0.75, 1.0],
+            }
+            resolved = mqtt_bg._resolve_targets(session, payload)
+            assert [loc.id for loc in resolved.locations[:3]] == [near.id, by_id.id, by_name.id]
+            adhoc = resolved.locations[3]
+            assert (adhoc.id, adhoc.name, adhoc.lat) == (-4, "Mezo", near.lat + 0.5)
+            assert resolved.weights_by_id == {near.id: 0.5, by_id.id: 0.25, by_name.id: 0.75, -4: 1.0}
+            assert adhoc not in session
+
+            strict = mqtt_bg._resolve_targets(session, dict(payload, adhoc=False, snap_km=0.01))
+            assert [loc.id for loc in strict.locations] == [by_id.id, by_name.id]
+
+            # A location of another county is never the snap target.
+            other = session.query(models.Location).filter(models.Location.county_id == db.county_ids[1]).first()
+            resolved = mqtt_bg._resolve_targets(session, {"county_id": county_id, "targets": [{"lat": other.lat, "lon": other.lon}]})
+            assert resolved.locations[0].id < 0
+    finally:
+        db.engine.dispose()
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import main, models, mqtt_bg  # noqa: E402
+from backend.benchmarks.synthetic import create_synthetic_database, synthetic_route  # noqa: E402
+from backend.db import get_session  # noqa: E402
+from backend.services import energy, feasibility, planner_core, route_planner, whatif  # noqa: E402
+
+
+@pytest.fixture()
+def db():
+    database = create_synthetic_database(n_locations=40, n_orders=0, seed=11, n_counties=2)
+    yield database
+    database.engine.dispose()
+
+
+@pytest.fixture()
+def client(db):
+    def session_override():
+        with db.session_factory() as session:
+            yield session
+
+    main.app.dependency_overrides[get_session] = session_override
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def test_batch_matches_the_live_planner_and_has_no_side_effects(client, db) -> None:
+    county_id = db.county_ids[0]
+    targets = db.location_ids[county_id][:25]
+    weights = [0.1 * (i % 5) for i in range(len(targets))]
+    last_route = list(mqtt_bg.get_last_route())
+    scenarios = [
+        {"name": "base", "county_id": county_id, "targets": targets, "weights": weights},
+        {"name": "short", "county_id": county_id, "targets": targets, "weights": weights, "base_range_km": 12.0},
+        {"name": "careful", "county_id": county_id, "targets": targets, "weights": weights, "safety_margin_ratio": 0.2},
+        {"name": "few", "county_id": county_id, "targets": targets[:5]},
+    ]
+
+    response = client.post("/api/plan/batch", json={"scenarios": scenarios, "include_steps": True})
+    assert response.status_code == 200
+    results = response.json()["scenarios"]
+    assert [result["name"] for result in results] == ["base", "short", "careful", "few"]
+
+    with db.session_factory() as session:
+        station = session.query(models.Station).filter(models.Station.county_id == county_id).one()
+        drone = station.drones[0]
+        base_range_km = drone.base_range_km
+        locations = {loc.id: loc for loc in session.query(models.Location).filter(models.Location.id.in_(targets))}
+        for scenario, result in zip(scenarios, results):
+            drone.base_range_km = scenario.get("base_range_km", base_range_km)
+            ids = scenario["targets"]
+            steps = route_planner.plan_route_with_recharges(
+                [locations[i] for i in ids],
+                station,
+                drone,
+                dict(zip(ids, scenario.get("weights", []))),
+                safety_margin_ratio=scenario.get("safety_margin_ratio", 0.05),
+                recharge_model=whatif.RECHARGE_MODEL,
+            )
+            if "base_range_km" in scenario:
+                # A hypothetical drone: planned with its spec model, under no drone id.
+                steps = [dict(step, drone_id=None) for step in steps]
+            assert result["drone_id"] == drone.id
+            assert result["steps"] == steps
+            assert result["distance_km"] == steps[-1]["cumulative_distance_km"]
+            assert result["recharges"] == sum(1 for step in steps if "recharge_s" in step)
+            assert result["served"] + result["unserved"] == len(ids)
+        session.rollback()
+
+    assert results[1]["recharges"] > results[0]["recharges"]
+    assert mqtt_bg.get_last_route() == last_route
+
+    summary_only = client.post("/api/plan/batch", json={"scenarios": scenarios}).json()["scenarios"]
+    assert "steps" not in summary_only[0]
+    assert summary_only[0]["duration_s"] == results[0]["duration_s"]
+
+
+def test_overridden_drone_spec_ignores_the_stored_calibration(db) -> None:
+    county_id = db.county_ids[0]
+    targets = tuple(db.location_ids[county_id][:10])
+    with db.session_factory() as session:
+        drone = session.query(models.Station).filter(models.Station.county_id == county_id).one().drones[0]
+        drone_id, base_range_km = drone.id, drone.base_range_km
+        specs = [
+            whatif.ScenarioSpec(name="stored", county_id=county_id, targets=targets),
+            whatif.ScenarioSpec(name="long", county_id=county_id, targets=targets, base_range_km=10 * base_range_km),
+        ]
+        stored, longer = whatif.resolve_scenarios(session, specs)
+
+    # Calibrated at half the spec range.
+    energy.set_calibration({drone_id: energy.LinearEnergyModel(200.0 / base_range_km)})
+    try:
+        assert stored.drone.id == drone_id
+        assert energy.model_for(stored.drone).capacity_km == pytest.approx(base_range_km / 2)
+        assert longer.drone.id is None and longer.drone_id == drone_id
+        assert energy.model_for(longer.drone).capacity_km == pytest.approx(10 * base_range_km)
+        assert whatif.summarize(longer, [])["drone_id"] == drone_id
+    finally:
+        energy.set_calibration(None)
+
+
+def test_batch_rejects_unknown_references(client, db) -> None:
+    county_id = db.county_ids[0]
+    bad = [{"county_id": county_id, "targets": [999999]}]
+    assert client.post("/api/plan/batch", json={"scenarios": bad}).status_code == 400
+    bad = [{"county_id": county_id, "drone_id": 999, "targets": db.location_ids[county_id][:2]}]
+    assert client.post("/api/plan/batch", json={"scenarios": bad}).status_code == 400
+    assert client.post("/api/plan/batch", json={"scenarios": []}).status_code == 422
+
+
+@pytest.mark.parametrize("n_stops", [30, 150])
+def test_shared_matrix_plans_identically(n_stops: int) -> None:
+    route = synthetic_route(n_stops, seed=5)
+    stops = route_planner.stops_from_locations(route.locations, route.weights)
+    hub = route_planner.hub_from_station(route.station)
+    matrix = feasibility.DistanceMatrix([(hub.lat, hub.lon)] + [(stop.lat, stop.lon) for stop in stops])
+    assert matrix((hub.lat, hub.lon), (stops[3].lat, stops[3].lon)) == planner_core.haversine_km(
+        (hub.lat, hub.lon), (stops[3].lat, stops[3].lon)
+    )
+
+    for range_km in (15.0, 40.0):
+        drone = planner_core.DroneSpec(1, range_km, route.drone.max_payload_kg, 60.0)
+        expected = planner_core.plan_route(stops, hub, drone, kernel="python")
+        assert planner_core.plan_route(stops, hub, drone, matrix=matrix) == expected
+
+
+def test_batch_on_a_pool_matches_in_process() -> None:
+    route = synthetic_route(60, seed=2)
+    stops = tuple(route_planner.stops_from_locations(route.locations, route.weights))
+    hub = route_planner.hub_from_station(route.station)
+    scenarios = [
+        whatif.Scenario(f"s{i}", hub, planner_core.DroneSpec(1, 12.0 + 3 * i, route.drone.max_payload_kg, 60.0), stops[: 60 - 20 * (i % 2)])
+        for i in range(6)
+    ]
+    expected = [whatif.evaluate(scenario) for scenario in scenarios]
+    assert whatif.evaluate_batch(scenarios, max_workers=1) == expected
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        assert whatif.evaluate_batch(scenarios, max_workers=3, executor=pool) == expected
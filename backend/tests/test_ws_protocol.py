@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend import main, models, mqtt_bg, ws_protocol  # noqa: E402
+from backend.benchmarks.synthetic import create_synthetic_database, synthetic_route  # noqa: E402
+from backend.db import get_session  # noqa: E402
+from backend.services import route_history, route_planner, scheduling  # noqa: E402
+
+
+def _steps(n_stops: int = 60):
+    route = synthetic_route(n_stops, seed=8)
+    route.drone.base_range_km = 15.0
+    steps = route_planner.plan_route_with_recharges(
+        route.locations,
+        route.station,
+        route.drone,
+        route.weights,
+        start_time=datetime(2026, 3, 1, 9, 0),
+        recharge_model=scheduling.RechargeModel(),
+    )
+    return route, steps
+
+
+@pytest.fixture()
+def db():
+    database = create_synthetic_database(n_locations=10, n_orders=0, seed=3, n_counties=1)
+    yield database
+    database.engine.dispose()
+
+
+@pytest.fixture()
+def client(db):
+    def session_override():
+        with db.session_factory() as session:
+            yield session
+
+    main.app.dependency_overrides[get_session] = session_override
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def test_delta_stream_rebuilds_every_payload() -> None:
+    _, steps = _steps()
+    assert any("recharge_s" in step for step in steps)
+    payloads = steps + [{"route": ["A", "B"]}] + steps[:3]
+
+    full = ws_protocol.StreamEncoder("full")
+    assert [full.encode(step) for step in steps] == [json.dumps(step, separators=(",", ":")) for step in steps]
+
+    for interval in (0, 7):
+        encoder = ws_protocol.StreamEncoder("delta", keyframe_interval=interval)
+        decoder = ws_protocol.StreamDecoder()
+        frames = [json.loads(encoder.encode(payload)) for payload in payloads]
+        assert [decoder.apply(frame) == payload for frame, payload in zip(frames, payloads)] == [True] * len(payloads)
+        assert [frame["seq"] for frame in frames] == list(range(len(payloads)))
+        assert frames[0]["t"] == "key" and frames[len(steps)]["t"] == "key"  # the summary shares nothing
+        assert any("unset" in frame for frame in frames) and any("keys" in frame for frame in frames)
+
+    delta = ws_protocol.StreamEncoder("delta", keyframe_interval=0)
+    delta_bytes = sum(len(delta.encode(step)) for step in steps)
+    assert delta_bytes < 0.7 * sum(len(json.dumps(step, separators=(",", ":"))) for step in steps)
+
+
+def test_msgpack_frames_are_binary() -> None:
+    msgpack = pytest.importorskip("msgpack")
+    _, steps = _steps(10)
+    encoder = ws_protocol.StreamEncoder("delta", "msgpack")
+    decoder = ws_protocol.StreamDecoder()
+    for step in steps:
+        frame = encoder.encode(step)
+        assert isinstance(frame, bytes)
+        assert decoder.apply(msgpack.unpackb(frame, raw=False)) == step
+
+
+def test_ws_negotiates_delta_mode(client, db) -> None:
+    route, steps = _steps(20)
+    with db.session_factory() as session:
+        station = session.query(models.Station).first()
+        drone = session.query(models.Drone).first()
+        record = route_history.record_route(session, "test", steps, station, drone)
+        session.commit()
+        route_id = record.id
+
+    decoder = ws_protocol.StreamDecoder()
+    with patch.object(main, "SessionLocal", db.session_factory):
+        with client.websocket_connect(f"/ws?replay={route_id}&speed=1000000&mode=delta") as websocket:
+            frames = [websocket.receive_json() for _ in steps]
+            summary = websocket.receive_json()
+    assert [decoder.apply(frame) for frame in frames] == steps
+    assert frames[0]["t"] == "key" and frames[1]["t"] == "delta"
+    assert decoder.apply(summary) == {"route": [step["next"] for step in steps]}
+
+    # Unknown modes are refused; the plain feed (what index.html uses) is untouched.
+    with pytest.raises(WebSocketDisconnect) as excinfo:
+        with client.websocket_connect(f"/ws?replay={route_id}&mode=zip") as websocket:
+            websocket.receive_json()
+    assert excinfo.value.code == 1008
+    mqtt_bg._store_step(steps[0])
+
+    def no_session():
+        raise AssertionError("the live feed must not open a database session")
+
+    try:
+        with patch.object(main, "SessionLocal", no_session):
+            with client.websocket_connect("/ws") as websocket:
+                assert websocket.receive_json() == steps[0]
+    finally:
+        with mqtt_bg._state_lock:
+            mqtt_bg._last_message.clear()
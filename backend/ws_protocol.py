@@ -0,0 +1,115 @@
+"""
+``/ws`` stream encodings, negotiated per connection with query parameters.
+
+``mode=full`` (the default, what ``templates/index.html`` speaks) sends every
+changed payload whole, as a JSON text frame, exactly as before.
+
+``mode=delta`` sends a keyframe with the whole payload first, then only the
+top-level fields that changed since the previous frame:
+
+    {"t": "key", "seq": 0, "enc": "json", "data": {"previous": "Hub", ...}}
+    {"t": "delta", "seq": 1, "set": {"0": "A", "6": 81.2, ...}, "unset": [14], "keys": ["recharge_s"]}
+
+Fields are named by their index in the key table: the keyframe's ``data``
+keys, in order, extended by each delta's ``keys``. Step field names are
+longer than most of their values, so this halves a delta again. Constant
+fields (``drone_id``, ``speed_kmh``, ...) are sent once per keyframe
+instead of once per step. ``seq`` numbers every frame. A delta that would
+not be smaller than the payload goes out as a keyframe instead, and so does
+every ``WS_KEYFRAME_INTERVAL``-th frame (0: only the first), so a client
+can always resynchronise.
+
+``encoding=msgpack`` sends binary MessagePack frames when ``msgpack`` is
+installed; without it the stream stays JSON, and keyframes say which
+encoding is in use (``"enc"``). permessage-deflate is not chosen here: the
+ASGI server negotiates it with clients that offer it (uvicorn with
+``websockets`` does by default, ``--ws-per-message-deflate``).
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Union
+
+try:  # Optional: binary frames for delta streams.
+    import msgpack
+except ImportError:  # pragma: no cover - exercised without msgpack installed
+    msgpack = None  # type: ignore[assignment]
+
+MODES = ("full", "delta")
+ENCODINGS = ("json", "msgpack")
+KEYFRAME_INTERVAL = int(os.getenv("WS_KEYFRAME_INTERVAL", "100"))
+
+Frame = Union[str, bytes]
+
+
+class StreamEncoder:
+    """Turns successive payloads into frames for one connection."""
+
+    def __init__(self, mode: str = "full", encoding: str = "json", keyframe_interval: int = KEYFRAME_INTERVAL) -> None:
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode!r}")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"unknown encoding {encoding!r}")
+        self.mode = mode
+        self.encoding = "msgpack" if encoding == "msgpack" and msgpack is not None else "json"
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self._state: Optional[Dict[str, Any]] = None
+        self._index: Dict[str, int] = {}
+
+    def encode(self, payload: Dict[str, Any]) -> Frame:
+        if self.mode == "full":
+            return self._dump(payload)
+        frame = self._delta(payload)
+        self._state = dict(payload)
+        self.seq += 1
+        return self._dump(frame)
+
+    def _delta(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        state = self._state
+        periodic = self.keyframe_interval > 0 and self.seq % self.keyframe_interval == 0
+        if state is not None and not periodic:
+            changed = [key for key, value in payload.items() if key not in state or state[key] != value]
+            removed = [key for key in state if key not in payload]
+            if len(changed) + len(removed) < len(payload):
+                index = self._index
+                added = [key for key in changed if key not in index]
+                for key in added:
+                    index[key] = len(index)
+                fields = {str(index[key]): payload[key] for key in changed}
+                frame: Dict[str, Any] = {"t": "delta", "seq": self.seq, "set": fields}
+                if removed:
+                    frame["unset"] = [index[key] for key in removed]
+                if added:
+                    frame["keys"] = added
+                return frame
+        self._index = {key: position for position, key in enumerate(payload)}
+        return {"t": "key", "seq": self.seq, "enc": self.encoding, "data": payload}
+
+    def _dump(self, frame: Dict[str, Any]) -> Frame:
+        if self.encoding == "msgpack":
+            return msgpack.packb(frame, use_bin_type=True)
+        # Same text as Starlette's ``send_json``, so full mode is unchanged on the wire.
+        return json.dumps(frame, separators=(",", ":"), ensure_ascii=False)
+
+
+class StreamDecoder:
+    """Reference client for delta mode: feed it decoded frames, read ``payload``."""
+
+    def __init__(self) -> None:
+        self.payload: Dict[str, Any] = {}
+        self.keys: List[str] = []
+
+    def apply(self, frame: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply one frame; returns a copy of the payload it describes."""
+        if frame["t"] == "key":
+            self.payload = dict(frame["data"])
+            self.keys = list(self.payload)
+            return dict(self.payload)
+        self.keys.extend(frame.get("keys", ()))
+        for position in frame.get("unset", ()):
+            self.payload.pop(self.keys[position], None)
+        for position, value in frame["set"].items():
+            self.payload[self.keys[int(position)]] = value
+        return dict(self.payload)
@@ -0,0 +1 @@
+"""Offline tools that stand in for drones: a telemetry publisher and a fleet simulator."""
@@ -0,0 +1,465 @@
+"""
+Discrete-event fleet simulator.
+
+Replays (or generates) a stream of orders against the real ``backend.models``
+schema and drives the same code the live process runs: orders are inserted
+as ``pending``, the ``services.dispatcher`` batches and plans them and
+publishes routes to a fake MQTT client, and the simulator flies the published
+steps (leg times from ``speed_kmh``, recharges from the ``RechargeModel``) and
+reports pickups/drops back through ``order_lifecycle.apply_telemetry``.
+
+Simulated time advances event by event. With ``speedup`` set, the run is
+paced so one wall-clock second covers ``speedup`` simulated seconds (a day in
+under 90 s at 1000x); without it, it runs as fast as possible.
+
+Run with:
+    python -m simulator.engine --counties 3 --hours 24 --orders-per-hour 20 --speedup 1000
+    python -m simulator.engine --replay orders.jsonl --database sqlite:///sim.db
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import itertools
+import json
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from sqlalchemy import create_engine, func  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from backend import models  # noqa: E402
+from backend.benchmarks.mqtt_load import percentile  # noqa: E402
+from backend.benchmarks.synthetic import DEFAULT_SEED, create_synthetic_database  # noqa: E402
+from backend.db import ensure_schema  # noqa: E402
+from backend.services import dispatcher, order_lifecycle, scheduling  # noqa: E402
+
+SIM_EPOCH = datetime(2024, 1, 1, 6, 0, 0)
+TOPIC = "dron/utvonal"
+
+
+@dataclass(frozen=True)
+class OrderArrival:
+    """An order entering the system ``at_s`` simulated seconds after the start."""
+
+    at_s: float
+    origin_location_id: int
+    destination_location_id: int
+    weight_kg: float
+
+
+def generate_orders(
+    session_factory: sessionmaker,
+    orders_per_hour: float,
+    duration_s: float,
+    seed: int = DEFAULT_SEED,
+    county_ids: Optional[Sequence[int]] = None,
+) -> List[OrderArrival]:
+    """Poisson arrivals per county between random pairs of its locations."""
+    rng = random.Random(seed)
+    arrivals: List[OrderArrival] = []
+    with session_factory() as session:
+        query = session.query(models.County.id).order_by(models.County.id)
+        ids = list(county_ids) if county_ids is not None else [county_id for (county_id,) in query]
+        for county_id in ids:
+            locations = [
+                loc_id
+                for (loc_id,) in session.query(models.Location.id)
+                .filter(models.Location.county_id == county_id)
+                .order_by(models.Location.id)
+            ]
+            drone = (
+                session.query(models.Drone)
+                .join(models.Station)
+                .filter(models.Station.county_id == county_id)
+                .order_by(models.Drone.id)
+                .first()
+            )
+            if len(locations) < 2 or drone is None or orders_per_hour <= 0:
+                continue
+            at_s = 0.0
+            while True:
+                at_s += rng.expovariate(orders_per_hour / 3600.0)
+                if at_s >= duration_s:
+                    break
+                origin, destination = rng.sample(locations, 2)
+                weight = round(rng.uniform(0.2, max(0.3, drone.max_payload_kg * 0.6)), 2)
+                arrivals.append(OrderArrival(at_s, origin, destination, weight))
+    arrivals.sort(key=lambda arrival: arrival.at_s)
+    return arrivals
+
+
+def load_orders(path: Path) -> List[OrderArrival]:
+    """Read a JSONL replay: ``{"at_s", "origin_location_id", "destination_location_id", "weight_kg"}`` per line."""
+    arrivals: List[OrderArrival] = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        arrivals.append(
+            OrderArrival(
+                float(row["at_s"]),
+                int(row["origin_location_id"]),
+                int(row["destination_location_id"]),
+                float(row["weight_kg"]),
+            )
+        )
+    arrivals.sort(key=lambda arrival: arrival.at_s)
+    return arrivals
+
+
+class SimMqttClient:
+    """Fake MQTT client that collects each published route as a list of steps."""
+
+    def __init__(self) -> None:
+        self.published = 0
+        self._pending: List[Dict[str, Any]] = []
+        self.routes: List[List[Dict[str, Any]]] = []
+
+    def publish(self, _topic: str, payload: str, *_args: Any, **_kwargs: Any) -> Any:
+        self.published += 1
+        message = json.loads(payload)
+        if "route" in message:
+            self.routes.append(self._pending)
+            self._pending = []
+        else:
+            self._pending.append(message)
+
+        class Result:
+            rc = 0
+
+        return Result()
+
+    def take_routes(self) -> List[List[Dict[str, Any]]]:
+        routes, self.routes = self.routes, []
+        return routes
+
+
+@dataclass
+class DroneState:
+    """Where a simulated drone is and which legs it has been given."""
+
+    drone_id: int
+    free_at_s: float = 0.0
+    busy_s: float = 0.0
+    flown_km: float = 0.0
+    battery_pct: float = 100.0
+    position: Optional[Tuple[float, float]] = None
+    # (depart_s, arrive_s, from (lat, lon), to (lat, lon))
+    legs: List[Tuple[float, float, Tuple[float, float], Tuple[float, float]]] = field(default_factory=list)
+
+    def position_at(self, at_s: float) -> Optional[Tuple[float, float]]:
+        """Linear interpolation along the leg being flown at ``at_s``."""
+        for depart_s, arrive_s, start, end in self.legs:
+            if depart_s <= at_s < arrive_s:
+                ratio = (at_s - depart_s) / (arrive_s - depart_s)
+                return (start[0] + (end[0] - start[0]) * ratio, start[1] + (end[1] - start[1]) * ratio)
+        return self.position
+
+
+@dataclass
+class SimulationReport:
+    sim_duration_s: float
+    wall_s: float
+    orders_created: int
+    orders_delivered: int
+    orders_failed: int
+    orders_open: int
+    routes: int
+    messages_published: int
+    flown_km: float
+    position_samples: int
+    dispatch_wait_s: List[float] = field(default_factory=list, repr=False)
+    delivery_s: List[float] = field(default_factory=list, repr=False)
+    drone_utilisation: Dict[int, float] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        hours = self.sim_duration_s / 3600.0 if self.sim_duration_s else 0.0
+        return {
+            "sim_duration_h": round(hours, 2),
+            "wall_s": round(self.wall_s, 3),
+            "speedup": round(self.sim_duration_s / self.wall_s, 1) if self.wall_s > 0 else None,
+            "orders_created": self.orders_created,
+            "orders_delivered": self.orders_delivered,
+            "orders_failed": self.orders_failed,
+            "orders_open": self.orders_open,
+            "delivered_per_hour": round(self.orders_delivered / hours, 2) if hours else None,
+            "routes": self.routes,
+            "messages_published": self.messages_published,
+            "flown_km": round(self.flown_km, 1),
+            "position_samples": self.position_samples,
+            "dispatch_wait_s": _latency_summary(self.dispatch_wait_s),
+            "delivery_s": _latency_summary(self.delivery_s),
+            "drone_utilisation": {drone_id: round(value, 3) for drone_id, value in self.drone_utilisation.items()},
+        }
+
+
+def _latency_summary(samples: Sequence[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "p99": percentile(samples, 99),
+        "max": max(samples) if samples else None,
+    }
+
+
+class Simulation:
+    """Event loop: order arrivals, dispatcher polls, drone arrivals and position samples."""
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        arrivals: Iterable[OrderArrival],
+        window: Optional[dispatcher.DispatchWindow] = None,
+        speedup: Optional[float] = 1000.0,
+        start: datetime = SIM_EPOCH,
+        position_interval_s: float = 60.0,
+        recharge_model: Optional[scheduling.RechargeModel] = None,
+    ) -> None:
+        self.session_factory = session_factory
+        self.window = window or dispatcher.DispatchWindow()
+        self.speedup = speedup
+        self.start = start
+        self.position_interval_s = position_interval_s
+        self.client = SimMqttClient()
+        self.dispatcher = dispatcher.Dispatcher(
+            session_factory,
+            lambda: self.client,
+            TOPIC,
+            window=self.window,
+            recharge_model=recharge_model or scheduling.RechargeModel(),
+            station_schedule=scheduling.StationSchedule(),
+        )
+        self.drones: Dict[int, DroneState] = {}
+        self.created_at_s: Dict[int, float] = {}
+        self.dispatch_wait_s: List[float] = []
+        self.delivery_s: List[float] = []
+        self.position_samples = 0
+        self.routes = 0
+        self._events: List[Tuple[float, int, str, Any]] = []
+        self._seq = itertools.count()
+        self._drone_by_county: Dict[int, Optional[int]] = {}
+        self._county_by_location: Dict[int, int] = {}
+        for arrival in arrivals:
+            self._push(arrival.at_s, "order", arrival)
+
+    def _push(self, at_s: float, kind: str, payload: Any = None) -> None:
+        heapq.heappush(self._events, (at_s, next(self._seq), kind, payload))
+
+    def _at(self, at_s: float) -> datetime:
+        return self.start + timedelta(seconds=at_s)
+
+    def _events_until(self, until_s: float) -> Iterator[Tuple[float, str, Any]]:
+        wall_start = time.perf_counter()
+        while self._events and self._events[0][0] <= until_s:
+            at_s, _seq, kind, payload = heapq.heappop(self._events)
+            if self.speedup:
+                delay = wall_start + at_s / self.speedup - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield at_s, kind, payload
+
+    # Event handlers -------------------------------------------------------
+    def _on_order(self, at_s: float, arrival: OrderArrival) -> None:
+        with self.session_factory() as session:
+            county_id = self._county_by_location.get(arrival.origin_location_id)
+            if county_id is None:
+                origin = session.get(models.Location, arrival.origin_location_id)
+                if origin is None:
+                    return
+                county_id = self._county_by_location[arrival.origin_location_id] = origin.county_id
+            if county_id not in self._drone_by_county:
+                drone = (
+                    session.query(models.Drone)
+                    .join(models.Station)
+                    .filter(models.Station.county_id == county_id)
+                    .order_by(models.Drone.id)
+                    .first()
+                )
+                self._drone_by_county[county_id] = drone.id if drone else None
+            order = models.Order(
+                origin_location_id=arrival.origin_location_id,
+                destination_location_id=arrival.destination_location_id,
+                weight_kg=arrival.weight_kg,
+                county_id=county_id,
+                drone_id=self._drone_by_county[county_id],
+                status=order_lifecycle.PENDING,
+                created_at=self._at(at_s),
+                status_changed_at=self._at(at_s),
+            )
+            session.add(order)
+            session.commit()
+            self.created_at_s[order.id] = at_s
+
+    def _on_dispatch(self, at_s: float) -> None:
+        for result in self.dispatcher.run_once(now=self._at(at_s)):
+            for order_id in result.assigned:
+                self.dispatch_wait_s.append(at_s - self.created_at_s.get(order_id, at_s))
+        for steps in self.client.take_routes():
+            self._fly(at_s, steps)
+
+    def _fly(self, at_s: float, steps: List[Dict[str, Any]]) -> None:
+        if not steps:
+            return
+        self.routes += 1
+        drone_id = int(steps[0]["drone_id"])
+        drone = self.drones.setdefault(drone_id, DroneState(drone_id))
+        # The plan assumes departure at dispatch time; a busy drone starts when it is back.
+        begin_s = max(at_s, drone.free_at_s)
+        previous: Optional[Tuple[float, float]] = drone.position
+        for step in steps:
+            target = (float(step["coordinates"]["y"]), float(step["coordinates"]["x"]))
+            depart_s = begin_s + float(step.get("depart_offset_s", 0.0))
+            arrive_s = begin_s + float(step.get("arrive_offset_s", 0.0))
+            if previous is not None and arrive_s > depart_s:
+                drone.legs.append((depart_s, arrive_s, previous, target))
+            previous = target
+            self._push(arrive_s, "arrive", (drone_id, step, target))
+        duration_s = scheduling.route_duration_s(steps)
+        drone.free_at_s = begin_s + duration_s
+        drone.busy_s += duration_s
+
+    def _on_arrive(self, at_s: float, payload: Tuple[int, Dict[str, Any], Tuple[float, float]]) -> None:
+        drone_id, step, target = payload
+        drone = self.drones[drone_id]
+        drone.position = target
+        drone.battery_pct = float(step.get("battery_pct", drone.battery_pct))
+        drone.flown_km += float(step.get("distance_km", 0.0))
+        drone.legs = [leg for leg in drone.legs if leg[1] > at_s]
+        pickups = step.get("pickups") or []
+        drops = step.get("drops") or []
+        if not pickups and not drops:
+            return
+        with self.session_factory() as session:
+            if pickups:
+                order_lifecycle.apply_telemetry(
+                    session, {"order_ids": pickups, "order_status": order_lifecycle.IN_FLIGHT}, at=self._at(at_s)
+                )
+            if drops:
+                delivered = order_lifecycle.apply_telemetry(
+                    session, {"order_ids": drops, "order_status": order_lifecycle.DELIVERED}, at=self._at(at_s)
+                )
+                for order_id in delivered:
+                    self.delivery_s.append(at_s - self.created_at_s.get(order_id, at_s))
+            session.commit()
+
+    def _on_sample(self, at_s: float) -> None:
+        for drone in self.drones.values():
+            if drone.position_at(at_s) is not None:
+                self.position_samples += 1
+
+    # Main loop ------------------------------------------------------------
+    def run(self, duration_s: float, drain: bool = True) -> SimulationReport:
+        """Simulate ``duration_s`` of order intake; with ``drain``, keep flying until every route is done."""
+        wall_start = time.perf_counter()
+        self._push(0.0, "dispatch")
+        if self.position_interval_s > 0:
+            self._push(0.0, "sample")
+
+        end_s = duration_s
+        horizon_s = duration_s
+        while True:
+            for at_s, kind, payload in self._events_until(horizon_s):
+                end_s = max(end_s, at_s)
+                if kind == "order":
+                    self._on_order(at_s, payload)
+                elif kind == "dispatch":
+                    self._on_dispatch(at_s)
+                    if at_s + self.window.poll_interval_s <= horizon_s:
+                        self._push(at_s + self.window.poll_interval_s, "dispatch")
+                elif kind == "arrive":
+                    self._on_arrive(at_s, payload)
+                elif kind == "sample":
+                    self._on_sample(at_s)
+                    if at_s + self.position_interval_s <= horizon_s:
+                        self._push(at_s + self.position_interval_s, "sample")
+            pending_arrivals = any(kind == "arrive" for _at, _seq, kind, _payload in self._events)
+            if not drain or not pending_arrivals:
+                break
+            # Orders still queued after intake stops go out on the time window; flights finish.
+            horizon_s = max(at for at, _seq, kind, _payload in self._events if kind == "arrive")
+
+        return self._report(end_s, time.perf_counter() - wall_start)
+
+    def _report(self, sim_duration_s: float, wall_s: float) -> SimulationReport:
+        with self.session_factory() as session:
+            counts = dict(
+                session.query(models.Order.status, func.count(models.Order.id))
+                .filter(models.Order.id.in_(list(self.created_at_s)))
+                .group_by(models.Order.status)
+                .all()
+            )
+        delivered = counts.get(order_lifecycle.DELIVERED, 0)
+        failed = counts.get(order_lifecycle.FAILED, 0)
+        return SimulationReport(
+            sim_duration_s=sim_duration_s,
+            wall_s=wall_s,
+            orders_created=len(self.created_at_s),
+            orders_delivered=delivered,
+            orders_failed=failed,
+            orders_open=len(self.created_at_s) - delivered - failed,
+            routes=self.routes,
+            messages_published=self.client.published,
+            flown_km=sum(drone.flown_km for drone in self.drones.values()),
+            position_samples=self.position_samples,
+            dispatch_wait_s=self.dispatch_wait_s,
+            delivery_s=self.delivery_s,
+            drone_utilisation={
+                drone_id: min(1.0, drone.busy_s / sim_duration_s) if sim_duration_s else 0.0
+                for drone_id, drone in sorted(self.drones.items())
+            },
+        )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Simulate a day of orders faster than real time.")
+    parser.add_argument("--database", help="SQLAlchemy URL of a seeded database; default: synthetic in-memory counties.")
+    parser.add_argument("--counties", type=int, default=3, help="Synthetic counties when no database is given.")
+    parser.add_argument("--locations", type=int, default=40, help="Synthetic locations per county.")
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--orders-per-hour", type=float, default=20.0, help="Arrival rate per county.")
+    parser.add_argument("--replay", type=Path, help="JSONL order stream to replay instead of generating one.")
+    parser.add_argument("--speedup", type=float, default=1000.0, help="Simulated seconds per wall second; 0 = unpaced.")
+    parser.add_argument("--max-wait", type=float, default=300.0, help="Dispatcher time window (s).")
+    parser.add_argument("--max-batch", type=int, default=6, help="Dispatcher size window (orders).")
+    parser.add_argument("--poll", type=float, default=30.0, help="Dispatcher poll interval (simulated s).")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv)
+
+    if args.database:
+        engine = create_engine(args.database, future=True)
+        ensure_schema(engine, models.Base.metadata)
+        session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+    else:
+        database = create_synthetic_database(n_locations=args.locations, n_orders=0, seed=args.seed, n_counties=args.counties)
+        session_factory = database.session_factory
+
+    duration_s = args.hours * 3600.0
+    arrivals = (
+        load_orders(args.replay)
+        if args.replay
+        else generate_orders(session_factory, args.orders_per_hour, duration_s, seed=args.seed)
+    )
+    simulation = Simulation(
+        session_factory,
+        arrivals,
+        window=dispatcher.DispatchWindow(max_wait_s=args.max_wait, max_batch=args.max_batch, poll_interval_s=args.poll),
+        speedup=args.speedup or None,
+    )
+    report = simulation.run(duration_s)
+    print(json.dumps(report.as_dict(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,113 @@
+"""
+Publishes a simulated drone route to the MQTT broker, one hop per second.
+
+Points come from ``SIMULATOR_POINTS_FILE`` (default ``dronoptimalisut.txt`` in
+the repository root): either a JSON list of ``{"name", "lat", "lon"}`` objects
+or ``name;lat;lon`` lines. Without the file the seed locations of
+``backend.init_db`` are used.
+
+Run with:
+    python -m simulator.publisher --limit 5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from math import atan2, cos, radians, sin, sqrt
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import paho.mqtt.client as mqtt
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+MQTT_HOST = os.getenv("MQTT_HOST", "broker.hivemq.com")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "dron/utvonal")
+POINTS_FILE = Path(os.getenv("SIMULATOR_POINTS_FILE", str(PROJECT_ROOT / "dronoptimalisut.txt")))
+
+START_POINT = {"name": "GLS Hungary", "lat": 47.3127, "lon": 19.1600}
+HOP_DELAY_S = 1.0
+
+
+def _distance_m(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    lat1, lon1, lat2, lon2 = map(radians, (a["lat"], a["lon"], b["lat"], b["lon"]))
+    h = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 6371000.0 * 2 * atan2(sqrt(h), sqrt(1 - h))
+
+
+def _parse_points(text: str) -> List[Dict[str, Any]]:
+    text = text.strip()
+    if text.startswith("["):
+        return [{"name": str(p["name"]), "lon": float(p["lon"]), "lat": float(p["lat"])} for p in json.loads(text)]
+    points: List[Dict[str, Any]] = []
+    for line in text.splitlines():
+        parts = [part.strip() for part in line.split(";")]
+        if len(parts) != 3 or line.lstrip().startswith("#"):
+            continue
+        points.append({"name": parts[0], "lon": float(parts[2]), "lat": float(parts[1])})
+    return points
+
+
+def load_points(path: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """Points to visit as ``{"name", "lon", "lat"}`` dicts."""
+    path = path or POINTS_FILE
+    if path.exists():
+        return _parse_points(path.read_text(encoding="utf-8"))
+
+    from backend.init_db import LOCATION_SEED
+
+    return [{"name": loc["name"], "lon": loc["lon"], "lat": loc["lat"]} for loc in LOCATION_SEED]
+
+
+def publish_route(
+    points: Sequence[Dict[str, Any]],
+    start: Optional[Dict[str, Any]] = None,
+    topic: str = MQTT_TOPIC,
+    delay_s: float = HOP_DELAY_S,
+) -> List[str]:
+    """Fly ``points`` in order: one step message per hop, then the route summary."""
+    client = mqtt.Client()
+    client.connect(MQTT_HOST, MQTT_PORT, 60)
+    previous = start or START_POINT
+    names: List[str] = []
+    try:
+        for point in points:
+            step = {
+                "previous": previous["name"],
+                "next": point["name"],
+                "coordinates": {"x": point["lon"], "y": point["lat"]},
+                "distance": round(_distance_m(previous, point), 2),
+            }
+            client.publish(topic, json.dumps(step))
+            names.append(point["name"])
+            previous = point
+            time.sleep(delay_s)
+        client.publish(topic, json.dumps({"route": names}))
+    finally:
+        client.disconnect()
+    return names
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Publish a simulated drone route over MQTT.")
+    parser.add_argument("--points", type=Path, help="Points file; defaults to SIMULATOR_POINTS_FILE.")
+    parser.add_argument("--limit", type=int, help="Only fly the first N points.")
+    parser.add_argument("--delay", type=float, default=HOP_DELAY_S, help="Seconds between hops.")
+    args = parser.parse_args(argv)
+
+    points = load_points(args.points)
+    if args.limit:
+        points = points[: args.limit]
+    names = publish_route(points, delay_s=args.delay)
+    print(f"Published {len(names)} hops to {MQTT_TOPIC} on {MQTT_HOST}:{MQTT_PORT}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())